@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        from .caching import invalidate_result
+        from .instrumentation import install_query_recorder
+        from .models import HearingTestResult, Patient
+        from .trends import invalidate_patient
+
+        connection_created.connect(install_query_recorder, dispatch_uid='core.performance.record_query')
+        # Результаты неизменны, но их можно поправить в админке — тогда кешированный ответ сбрасывается
+        post_save.connect(invalidate_result, sender=HearingTestResult, dispatch_uid='core.caching.result_saved')
+        post_delete.connect(invalidate_result, sender=HearingTestResult, dispatch_uid='core.caching.result_deleted')
+        # Ответы результатов включают данные пациента: правка Patient сбрасывает их вместе с динамикой
+        post_save.connect(invalidate_patient, sender=Patient, dispatch_uid='core.trends.patient_saved')
+        post_delete.connect(invalidate_patient, sender=Patient, dispatch_uid='core.trends.patient_deleted')
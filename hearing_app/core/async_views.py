@@ -0,0 +1,98 @@
+"""
+Асинхронные (ASGI) версии основных endpoint'ов на async ORM Django.
+
+DRF не поддерживает async-представления, поэтому здесь обычные Django-представления;
+ответы рендерятся тем же JSONRenderer, что и в DRF, так что тела ответов
+совпадают с синхронными api/... байт в байт.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+
+from .caching import acached_result, cached_response, result_cache_control
+from .instrumentation import stage
+from .models import CalibrationProfile, HearingTestResult
+from .pagination import KeysetPagination
+from .views import (
+    PATIENT_TESTS_LIST_COLUMNS, PATIENT_TESTS_LIST_ENCODER, calibration_response, patient_tests_queryset,
+    prepare_result, save_result, saved_result_payload, test_result_payload
+)
+
+
+class JSONResponse(HttpResponse):
+    renderer = JSONRenderer()
+
+    def __init__(self, data, status=200):
+        super().__init__(self.renderer.render(data), content_type='application/json', status=status)
+
+
+async def asave_result(test_result):
+    """
+    save_result() для async-представлений. Пациент, результат, сырые пробы и нормы
+    пишутся одной транзакцией, а transaction.atomic в async-коде Django не работает,
+    поэтому без write-behind запись идёт через sync_to_async. С write-behind запрос
+    ждёт Future потока-писателя, не занимая поток.
+    """
+    if settings.WRITE_BEHIND_ENABLED:
+        from .writer import get_result_writer
+
+        future = asyncio.wrap_future(get_result_writer().submit(test_result))
+        await asyncio.wait_for(future, settings.WRITE_BEHIND_TIMEOUT)
+        return
+    await sync_to_async(save_result)(test_result)
+
+
+async def aload_test_result_payload(test_id):
+    try:
+        return test_result_payload(await HearingTestResult.objects.select_related('patient').aget(id=test_id))
+    except HearingTestResult.DoesNotExist:
+        return None
+
+
+@csrf_exempt
+@require_POST
+async def save_results(request):
+    try:
+        with stage('parse'):
+            data = json.loads(request.body)
+        test_result, thresholds, reliabilities = prepare_result(data, await CalibrationProfile.objects.aactive())
+
+        # Сохраняем результаты в БД
+        with stage('db_write'):
+            await asave_result(test_result)
+
+        return JSONResponse(saved_result_payload(test_result, thresholds, reliabilities))
+    except Exception as e:
+        return JSONResponse({'status': 'error', 'message': str(e)})
+
+
+@require_GET
+async def get_test_results(request, test_id):
+    entry = await acached_result(test_id, aload_test_result_payload)
+    if entry is None:
+        return JSONResponse({'status': 'error', 'message': 'Test not found'}, status=404)
+    return cached_response(request, entry, result_cache_control())
+
+
+@require_GET
+async def get_patient_tests(request):
+    paginator = KeysetPagination(PATIENT_TESTS_LIST_COLUMNS)
+    try:
+        page = await paginator.apaginate_queryset(patient_tests_queryset(request.GET), request)
+    except ValidationError as e:
+        return JSONResponse(e.detail, status=400)
+    body = paginator.get_paginated_json(PATIENT_TESTS_LIST_ENCODER, page)
+    return HttpResponse(body, content_type='application/json')
+
+
+@require_GET
+async def get_calibration(request):
+    """Возвращает калибровочные коэффициенты для оборудования"""
+    return calibration_response(request, await CalibrationProfile.objects.aactive(), JSONResponse)
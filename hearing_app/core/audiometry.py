@@ -0,0 +1,147 @@
+"""
+Адаптивный поиск порогов на сервере (модифицированный метод Хьюсона–Уэстлейка).
+
+Клиент получает очередной стимул (частота, громкость), отвечает «слышу/не слышу»,
+сервер выбирает следующий стимул: после ответа «слышу» громкость снижается на
+STEP_DOWN ступеней, после «не слышу» — повышается на STEP_UP (до первого ответа
+«слышу» на частоте — тоже на STEP_DOWN, чтобы быстрее выйти к порогу). Порог —
+наименьшая громкость, услышанная REQUIRED_HITS раза при подъёме. Так порог находится за 5–8
+предъявлений на частоту вместо прохода по всей шкале громкостей. Достоверность по окончании
+сессии считается scoring.score_trials() по её пробам — так же, как для api/save-results/.
+
+Громкость — в тех же долях 0..1, что и в пробах api/save-results/, поэтому готовая
+сессия сохраняется обычной записью HearingTestResult. Состояние сессии — простой
+словарь в кеше Django (CACHES['default'], по умолчанию память процесса) со сроком
+жизни AUDIOMETRY_SESSION_TTL.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Порядок частот по методике: с 1 кГц вверх, затем 500 Гц
+FREQUENCIES = (1000, 2000, 4000, 8000, 500)
+# Шкала громкостей: 20 ступеней по 0.05 (аналог шкалы с шагом 5 дБ)
+LEVELS = tuple(round(0.05 * step, 2) for step in range(1, 21))
+START_LEVEL = 7  # индекс в LEVELS, 0.4
+STEP_DOWN = 2
+STEP_UP = 1
+REQUIRED_HITS = 2
+# Предел предъявлений на частоту; после него порог — наименьшая услышанная при подъёме громкость
+MAX_TRIALS_PER_FREQUENCY = 20
+
+CACHE_PREFIX = 'audiometry:'
+
+
+class SessionError(Exception):
+    pass
+
+
+def new_session(patient, frequencies=FREQUENCIES):
+    return {
+        'id': uuid.uuid4().hex,
+        'patient': patient,
+        'frequencies': list(frequencies),
+        'current': 0,
+        'thresholds': {},
+        'reliabilities': {},
+        'trials': [],
+        **_frequency_state(),
+    }
+
+
+def _frequency_state():
+    return {
+        'level': START_LEVEL,
+        'previous_heard': None,
+        'heard_once': False,
+        'frequency_trials': 0,
+        # индекс громкости -> [предъявлений при подъёме, из них услышано]
+        'ascending': {},
+        'top_misses': 0,
+    }
+
+
+def is_finished(session):
+    return session['current'] >= len(session['frequencies'])
+
+
+def next_stimulus(session):
+    """Стимул, ответ на который ожидается; None, если сессия завершена"""
+    if is_finished(session):
+        return None
+    return {
+        'frequency': session['frequencies'][session['current']],
+        'volume': LEVELS[session['level']],
+        'trial': len(session['trials']),
+    }
+
+
+def _finish_frequency(session, level):
+    frequency = str(session['frequencies'][session['current']])
+    session['thresholds'][frequency] = LEVELS[level]
+    session['current'] += 1
+    session.update(_frequency_state())
+    if is_finished(session):
+        # Та же метрика, что у api/save-results/ и trials.rescore(): доля услышанных проб частоты
+        from .scoring import score_trials
+
+        session['reliabilities'] = score_trials(session['trials'])[1]
+
+
+def respond(session, heard):
+    """Учитывает ответ на текущий стимул и переходит к следующему (изменяет session)"""
+    if is_finished(session):
+        raise SessionError('Session is already finished')
+
+    level = session['level']
+    top = len(LEVELS) - 1
+    session['trials'].append({
+        'frequency': session['frequencies'][session['current']], 'volume': LEVELS[level], 'heard': heard,
+    })
+    session['frequency_trials'] += 1
+
+    # На нижней ступени опускаться некуда, поэтому каждое предъявление там считается подъёмом
+    if session['previous_heard'] is False or level == 0:
+        runs = session['ascending'].setdefault(level, [0, 0])
+        runs[0] += 1
+        runs[1] += int(heard)
+        if heard and runs[1] >= REQUIRED_HITS:
+            _finish_frequency(session, level)
+            return
+
+    if not heard and level == top:
+        session['top_misses'] += 1
+        if session['top_misses'] >= REQUIRED_HITS:
+            # Нет ответа на максимальной громкости: записываем максимум
+            _finish_frequency(session, top)
+            return
+
+    if session['frequency_trials'] >= MAX_TRIALS_PER_FREQUENCY:
+        heard_levels = [index for index, (_, hits) in session['ascending'].items() if hits]
+        if heard_levels:
+            _finish_frequency(session, min(heard_levels))
+        else:
+            _finish_frequency(session, top)
+        return
+
+    step_up = STEP_UP if session['heard_once'] else STEP_DOWN
+    session['level'] = max(0, level - STEP_DOWN) if heard else min(top, level + step_up)
+    session['previous_heard'] = heard
+    session['heard_once'] = session['heard_once'] or heard
+
+
+def load_session(session_id):
+    session = cache.get(CACHE_PREFIX + session_id)
+    if session is None:
+        raise SessionError('Session not found or expired')
+    return session
+
+
+def store_session(session):
+    # Каждый ответ продлевает срок жизни сессии
+    cache.set(CACHE_PREFIX + session['id'], session, settings.AUDIOMETRY_SESSION_TTL)
+
+
+def delete_session(session):
+    cache.delete(CACHE_PREFIX + session['id'])
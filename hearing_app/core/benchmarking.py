@@ -0,0 +1,284 @@
+"""
+Утилиты для замеров производительности: временная БД, синтетические данные, таймеры.
+Используются management-командами benchmark_*.
+"""
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from .scoring import DEFAULT_FREQUENCIES
+
+FREQUENCIES = list(DEFAULT_FREQUENCIES)
+VOLUME_STEPS = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+
+NAME_SYLLABLES = ['ба', 'ва', 'го', 'да', 'же', 'зи', 'ка', 'ло', 'ми', 'но', 'пе', 'ра', 'се', 'ту', 'фе', 'хо', 'ча', 'ша', 'ю', 'я']
+FIRST_NAMES = {
+    'M': ['Иван', 'Пётр', 'Алексей', 'Дмитрий', 'Сергей', 'Андрей', 'Михаил', 'Николай'],
+    'F': ['Анна', 'Мария', 'Елена', 'Ольга', 'Ксения', 'Татьяна', 'Наталья', 'Юлия'],
+}
+
+
+@contextmanager
+def scratch_database(verbosity=0):
+    """Создаёт временную тестовую БД, чтобы замеры не трогали рабочие данные"""
+    old_name = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        # Файловая БД вместо :memory:, чтобы в замер попадала стоимость коммитов
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = path
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+
+
+def make_last_name(gender, rng=random):
+    """Правдоподобная фамилия из 2-3 слогов; даёт десятки тысяч различных значений"""
+    stem = ''.join(rng.choice(NAME_SYLLABLES) for _ in range(rng.randint(2, 3)))
+    suffix = rng.choice(['ов', 'ев', 'ин']) + ('а' if gender == 'F' else '')
+    return (stem + suffix).capitalize()
+
+
+def make_patient(rng=random):
+    gender = rng.choice(['M', 'F'])
+    return {
+        'lastName': make_last_name(gender, rng),
+        'firstName': rng.choice(FIRST_NAMES[gender]),
+        'middleName': '',
+        'gender': gender,
+        'birthDate': f'{rng.randint(1940, 2010)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        'phone': '',
+        'email': '',
+    }
+
+
+def make_trials(rng=random, frequencies=FREQUENCIES, volume_steps=VOLUME_STEPS):
+    """Имитирует пробы фронтенда: по каждой частоте громкость растёт, пока тон не услышан"""
+    trials = []
+    for freq in frequencies:
+        threshold = rng.choice(volume_steps)
+        for volume in volume_steps:
+            heard = volume >= threshold
+            trials.append({'frequency': freq, 'volume': volume, 'heard': heard})
+            if heard:
+                break
+    return trials
+
+
+def make_payload(rng=random):
+    return {'patient': make_patient(rng), 'data': make_trials(rng)}
+
+
+@contextmanager
+def timed(results, key):
+    start = time.perf_counter()
+    yield
+    results[key] = time.perf_counter() - start
+
+
+def populate_results(count, rng=random, chunk_size=10000):
+    """
+    Быстро заполняет таблицу HearingTestResult синтетическими записями.
+    Пороги генерируются напрямую, без симуляции проб, чтобы 1M строк вставлялся за минуты.
+    """
+    from django.db import transaction
+
+    from .models import CalibrationProfile, HearingTestResult, attach_patients
+    from .norms import record_results
+    from .views import build_test_result, generate_diagnosis
+
+    calibration_profile = CalibrationProfile.objects.active()
+    created = 0
+    while created < count:
+        rows = []
+        for _ in range(min(chunk_size, count - created)):
+            thresholds = {str(freq): rng.choice(VOLUME_STEPS) for freq in FREQUENCIES}
+            reliabilities = {str(freq): rng.random() for freq in FREQUENCIES}
+            diagnosis = generate_diagnosis(thresholds)
+            rows.append(build_test_result(make_patient(rng), thresholds, reliabilities, diagnosis, calibration_profile))
+        with transaction.atomic():
+            record_results(HearingTestResult.objects.bulk_create(attach_patients(rows), batch_size=1000))
+        created += len(rows)
+    return created
+
+
+def reference_list_json(rows, next_link=None):
+    """Прежний путь списка: словари values() через JSONRenderer DRF (эталон для core/fastjson.py)"""
+    from rest_framework.renderers import JSONRenderer
+
+    return JSONRenderer().render({'next': next_link, 'results': rows})
+
+
+def reference_ndjson(rows, fields):
+    """Прежний путь NDJSON-выгрузки: словарь на строку через DjangoJSONEncoder"""
+    from django.core.serializers.json import DjangoJSONEncoder
+
+    from .export import _isoformat
+
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    return ''.join(encoder.encode(dict(zip(fields, map(_isoformat, row)))) + '\n' for row in rows)
+
+
+def import_times(code):
+    """
+    Запускает code в чистом интерпретаторе с python -X importtime.
+    Возвращает ({модуль: суммарное время импорта, мс}, общее время всех импортов, мс).
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    times, total = {}, 0.0
+    for line in completed.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package", вложенность — отступом имени
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative) / 1000
+        if not name[1:].startswith(' '):
+            total += int(cumulative) / 1000
+    return times, total
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def http_load(base_url, paths, total, concurrency, method='GET', body=None):
+    """
+    Нагрузка на живой HTTP-сервер: concurrency потоков с keep-alive соединениями
+    выполняют total запросов по кругу из paths. Возвращает сводку с throughput и p50/p95/p99.
+    """
+    import http.client
+    import itertools
+    import threading
+    from urllib.parse import urlsplit
+
+    url = urlsplit(base_url)
+    counter = itertools.count()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+
+    def worker():
+        connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        local_latencies, local_errors = [], 0
+        while True:
+            number = next(counter)
+            if number >= total:
+                break
+            path = paths[number % len(paths)]
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+                continue
+            local_latencies.append((time.perf_counter() - started) * 1000)
+        connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - started, sum(errors))
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Сводка замера: число запросов, ошибки, throughput (запросов/с), p50/p95/p99 в мс"""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+    }
+
+
+def client_load(client, paths, total, method='GET', bodies=None):
+    """
+    Последовательные запросы через django.test.Client (без сети).
+    Кроме сводки summarize() считает SQL-запросы: queries — в среднем на запрос, max_queries — максимум.
+    """
+    from django.test.utils import CaptureQueriesContext
+
+    latencies, query_counts, errors = [], [], 0
+    started = time.perf_counter()
+    for number in range(total):
+        path = paths[number % len(paths)]
+        request_started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            if method == 'POST':
+                response = client.post(path, bodies[number % len(bodies)], content_type='application/json')
+            else:
+                response = client.get(path)
+        latencies.append((time.perf_counter() - request_started) * 1000)
+        query_counts.append(len(queries))
+        if response.status_code >= 400:
+            errors += 1
+    stats = summarize(latencies, time.perf_counter() - started, errors)
+    stats['queries'] = sum(query_counts) / len(query_counts) if query_counts else 0.0
+    stats['max_queries'] = max(query_counts, default=0)
+    return stats
+
+
+@contextmanager
+def live_server(host='127.0.0.1'):
+    """
+    Многопоточный WSGI-сервер Django в фоновом потоке на свободном порту (как LiveServerTestCase).
+    Обслуживает текущую БД, в т.ч. временную из scratch_database(). Возвращает базовый URL.
+    """
+    import threading
+
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.test.utils import modify_settings
+
+    class QuietHandler(WSGIRequestHandler):
+        # Заголовки и тело уходят отдельными send(); без TCP_NODELAY keep-alive ловит задержку ACK ~40 мс
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadedWSGIServer((host, 0), QuietHandler, allow_reuse_address=False)
+    server.set_app(WSGIHandler())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with modify_settings(ALLOWED_HOSTS={'append': host}):
+            yield f'http://{host}:{server.server_port}'
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
@@ -0,0 +1,124 @@
+"""
+Кеш ответов для неизменяемых данных: результатов теста и активной калибровки.
+
+Сохранённый результат не меняется, поэтому ответ api/results/<id>/ кешируется
+целиком — готовым JSON и сильным ETag (SHA-256 тела) — в кеше Django (CACHES['default']).
+Клиент с тем же ETag получает 304 без обращения к БД. Редкое изменение записи через
+админку сбрасывает кеш через сигналы post_save/post_delete (см. CoreConfig.ready).
+Счётчики попаданий/промахов хранятся там же и выводятся командой manage.py cache_stats.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+RESULT_CACHE_PREFIX = 'result:'
+CALIBRATION_CACHE_KEY = 'calibration:active'
+STATS_PREFIX = 'cache-stats:'
+CACHE_NAMES = ('results', 'calibration')
+
+
+def stats_key(name, hit):
+    return f'{STATS_PREFIX}{name}:{"hits" if hit else "misses"}'
+
+
+def count(name, hit):
+    key = stats_key(name, hit)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Счётчик вытеснен между add и incr
+            cache.add(key, 1, None)
+
+
+async def acount(name, hit):
+    key = stats_key(name, hit)
+    if not await cache.aadd(key, 1, None):
+        try:
+            await cache.aincr(key)
+        except ValueError:
+            await cache.aadd(key, 1, None)
+
+
+def cache_stats():
+    keys = [f'{STATS_PREFIX}{name}:{outcome}' for name in CACHE_NAMES for outcome in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    return {
+        name: {outcome: values.get(f'{STATS_PREFIX}{name}:{outcome}', 0) for outcome in ('hits', 'misses')}
+        for name in CACHE_NAMES
+    }
+
+
+def render_entry(payload):
+    """(ETag, тело JSON) — так же, как отрисовал бы DRF"""
+    from rest_framework.renderers import JSONRenderer
+
+    body = JSONRenderer().render(payload)
+    return f'"{hashlib.sha256(body).hexdigest()}"', body
+
+
+def result_cache_key(test_id):
+    return f'{RESULT_CACHE_PREFIX}{test_id}'
+
+
+def cached_result(test_id, load_payload):
+    """
+    Запись кеша результата (ETag, тело) или None, если теста нет.
+    load_payload(test_id) возвращает словарь ответа или None; отсутствие теста не кешируется.
+    """
+    key = result_cache_key(test_id)
+    entry = cache.get(key)
+    count('results', entry is not None)
+    if entry is None:
+        payload = load_payload(test_id)
+        if payload is None:
+            return None
+        entry = render_entry(payload)
+        cache.set(key, entry, settings.RESULT_CACHE_TIMEOUT)
+    return entry
+
+
+async def acached_result(test_id, aload_payload):
+    """cached_result() для async-представлений: aload_payload — корутина на async ORM"""
+    key = result_cache_key(test_id)
+    entry = await cache.aget(key)
+    await acount('results', entry is not None)
+    if entry is None:
+        payload = await aload_payload(test_id)
+        if payload is None:
+            return None
+        entry = render_entry(payload)
+        await cache.aset(key, entry, settings.RESULT_CACHE_TIMEOUT)
+    return entry
+
+
+def invalidate_calibration():
+    cache.delete(CALIBRATION_CACHE_KEY)
+
+
+def invalidate_result(sender, instance, **kwargs):
+    """Обработчик post_save/post_delete HearingTestResult"""
+    cache.delete(result_cache_key(instance.pk))
+
+
+def invalidate_results(pks):
+    """Для массовых изменений (bulk_update), которые не отправляют сигналы"""
+    cache.delete_many([result_cache_key(pk) for pk in pks])
+
+
+def cached_response(request, entry, cache_control):
+    etag, body = entry
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def result_cache_control():
+    # private: ответ содержит персональные данные и не должен оседать в общих кешах
+    return f'private, max-age={settings.RESULT_CACHE_MAX_AGE}'
@@ -0,0 +1,17 @@
+import hashlib
+import json
+
+# Калибровка по умолчанию; используется, пока не активирован другой профиль
+CALIBRATION_VALUES = {
+    '500': {'factor': 1.02, 'max_db': 110},
+    '1000': {'factor': 0.98, 'max_db': 115},
+    '2000': {'factor': 1.05, 'max_db': 120},
+    '4000': {'factor': 0.95, 'max_db': 115},
+    '8000': {'factor': 1.1, 'max_db': 105}
+}
+
+
+def calibration_hash(data):
+    """SHA-256 канонического JSON: одинаковые калибровки дают одинаковый хеш независимо от порядка ключей"""
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
@@ -0,0 +1,134 @@
+"""
+Правила заключения по порогам и пересчёт сохранённых заключений.
+
+Заключение и рекомендации записываются в результат при сохранении, поэтому после
+изменения правил (NORM_THRESHOLDS, DIAGNOSIS_BOUNDS, тексты) старые строки устаревают.
+manage.py rediagnose проходит таблицу диапазонами первичного ключа; в каждом диапазоне
+правила применяются векторно к матрице порогов (diagnosis_levels), а изменившиеся
+строки пишутся bulk_update. Чтение и расчёт диапазонов можно распределить по процессам
+(rediagnose_chunk), запись остаётся в одном процессе — у SQLite один писатель.
+"""
+import hashlib
+import json
+from bisect import bisect_right
+
+from .models import HearingTestResult
+
+NORM_THRESHOLDS = {
+    '500': 20,
+    '1000': 15,
+    '2000': 10,
+    '4000': 5,
+    '8000': 0
+}
+# Верхние границы (не включительно) среднего отклонения для заключений DIAGNOSES[:-1]
+DIAGNOSIS_BOUNDS = (0.1, 0.3, 0.6)
+DIAGNOSES = (
+    "Ваш слух в пределах нормы",
+    "Легкое снижение слуха",
+    "Умеренное снижение слуха",
+    "Рекомендуется консультация специалиста",
+)
+THRESHOLD_FIELDS = [f'threshold_{freq}' for freq in NORM_THRESHOLDS]
+REDIAGNOSE_CHUNK_SIZE = 5000
+
+
+def generate_diagnosis(thresholds):
+    deviations = []
+    for freq, norm in NORM_THRESHOLDS.items():
+        user_threshold = thresholds.get(freq, 1.0)
+        if isinstance(user_threshold, (int, float)):
+            deviations.append(user_threshold - norm)
+
+    avg_deviation = sum(deviations) / len(deviations) if deviations else 0
+    # NaN не меньше ни одной границы и попадает в последнее заключение, как и раньше
+    return DIAGNOSES[bisect_right(DIAGNOSIS_BOUNDS, avg_deviation)]
+
+
+def get_recommendations(diagnosis):
+    if "нормы" in diagnosis.lower():
+        return "Повторите тест через год для контроля слуха."
+    elif "легкое" in diagnosis.lower():
+        return "Рекомендуется избегать шумных помещений, повторить тест через 6 месяцев."
+    elif "умеренное" in diagnosis.lower():
+        return "Рекомендуется консультация ЛОР-врача и проведение дополнительных исследований."
+    else:
+        return "Необходима срочная консультация специалиста для детального обследования."
+
+
+RECOMMENDATIONS = tuple(get_recommendations(diagnosis) for diagnosis in DIAGNOSES)
+
+
+def rules_version():
+    """Отпечаток правил: возобновлять пересчёт можно только с теми же правилами"""
+    rules = [NORM_THRESHOLDS, DIAGNOSIS_BOUNDS, DIAGNOSES, RECOMMENDATIONS]
+    return hashlib.sha256(json.dumps(rules, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+def diagnosis_levels(thresholds):
+    """
+    Индексы DIAGNOSES для матрицы порогов (n, 5) в порядке NORM_THRESHOLDS.
+    Отклонения складываются по столбцам в том же порядке, что и в generate_diagnosis,
+    поэтому результат на границах совпадает побитово.
+    """
+    import numpy as np
+
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    deviations = np.zeros(len(thresholds))
+    for column, norm in enumerate(NORM_THRESHOLDS.values()):
+        deviations += thresholds[:, column] - norm
+    return np.searchsorted(DIAGNOSIS_BOUNDS, deviations / len(NORM_THRESHOLDS), side='right')
+
+
+def rediagnose_chunk(bounds):
+    """
+    Пересчитывает результаты с pk в [lower, upper).
+    Возвращает (число строк, [(pk, старое заключение, новое заключение, рекомендации), ...] только для изменившихся).
+    """
+    import numpy as np
+
+    lower, upper = bounds
+    rows = list(
+        HearingTestResult.objects.filter(pk__gte=lower, pk__lt=upper)
+        .order_by('pk')
+        .values_list('pk', 'diagnosis', 'recommendations', *THRESHOLD_FIELDS)
+    )
+    if not rows:
+        return 0, []
+    levels = diagnosis_levels(np.array([row[3:] for row in rows], dtype=np.float64))
+    changes = [
+        (pk, diagnosis, DIAGNOSES[level], RECOMMENDATIONS[level])
+        for (pk, diagnosis, recommendations, *_), level in zip(rows, levels.tolist())
+        if diagnosis != DIAGNOSES[level] or recommendations != RECOMMENDATIONS[level]
+    ]
+    return len(rows), changes
+
+
+def apply_changes(changes, batch_size=1000):
+    """Записывает пересчитанные заключения одним bulk_update и сбрасывает кеш ответов этих результатов"""
+    from django.db import transaction
+
+    from .caching import invalidate_results
+
+    if not changes:
+        return
+    with transaction.atomic():
+        HearingTestResult.objects.bulk_update(
+            [
+                HearingTestResult(pk=pk, diagnosis=diagnosis, recommendations=recommendations)
+                for pk, _, diagnosis, recommendations in changes
+            ],
+            ['diagnosis', 'recommendations'],
+            batch_size=batch_size,
+        )
+    # bulk_update не отправляет post_save, поэтому кеш api/results/<id>/ сбрасывается явно
+    invalidate_results(pk for pk, *_ in changes)
+
+
+def init_worker():
+    """Инициализатор процесса пула: при spawn/forkserver Django ещё не настроен"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
@@ -0,0 +1,108 @@
+"""
+Потоковая выгрузка результатов в CSV / NDJSON.
+
+Записи читаются через .iterator(chunk_size=...) и сразу превращаются в текст,
+поэтому расход памяти не зависит от размера таблицы. Используется endpoint'ом
+api/export/ и командой manage.py export_results.
+"""
+import csv
+import datetime
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .fastjson import DEFAULT_SEPARATORS, RowEncoder, isoformat
+from .models import PATIENT_RESULT_FIELDS, HearingTestResult
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+# Столбцы выгрузки; вместо ссылки на пациента — его поля под прежними именами (patient_last_name, ...)
+EXPORT_FIELDS = [
+    name
+    for field in HearingTestResult._meta.concrete_fields
+    for name in (PATIENT_RESULT_FIELDS if field.name == 'patient' else [field.name])
+]
+EXPORT_CHUNK_SIZE = 2000
+
+
+class ExportError(ValueError):
+    pass
+
+
+class _Echo:
+    """Псевдо-буфер для csv.writer: write() просто возвращает строку"""
+    def write(self, value):
+        return value
+
+
+def parse_fields(value):
+    if not value:
+        return list(EXPORT_FIELDS)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in EXPORT_FIELDS]
+    if unknown:
+        raise ExportError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def _day_start(value, name):
+    day = parse_date(value)
+    if day is None:
+        raise ExportError(f"Invalid {name} date, expected YYYY-MM-DD")
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min), datetime.timezone.utc)
+
+
+def export_queryset(date_from=None, date_to=None):
+    """Результаты за период [date_from, date_to] (включительно) по порядку первичного ключа"""
+    queryset = HearingTestResult.objects.all()
+    # Сравнение с границами суток, а не test_date__date, чтобы работал индекс по test_date
+    if date_from:
+        queryset = queryset.filter(test_date__gte=_day_start(date_from, 'date_from'))
+    if date_to:
+        queryset = queryset.filter(test_date__lt=_day_start(date_to, 'date_to') + datetime.timedelta(days=1))
+    return queryset.order_by('pk')
+
+
+def _isoformat(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return isoformat(value)
+    return value
+
+
+def iter_csv(rows, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    buffer = []
+    for row in rows:
+        buffer.append(writer.writerow(['' if value is None else _isoformat(value) for value in row]))
+        if len(buffer) >= EXPORT_CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def iter_ndjson(rows, fields):
+    # Пачка строк кодируется по столбцам (core/fastjson.py); вывод тот же, что у DjangoJSONEncoder по словарю
+    encoder = RowEncoder(fields, DjangoJSONEncoder(ensure_ascii=False).encode, separators=DEFAULT_SEPARATORS)
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        yield '\n'.join(encoder.encode_objects(chunk)) + '\n'
+
+
+def iter_export(queryset, fields, fmt='csv', chunk_size=EXPORT_CHUNK_SIZE):
+    """Генератор текстовых фрагментов выгрузки"""
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown format: {fmt}")
+    lookups = [PATIENT_RESULT_FIELDS.get(name, name) for name in fields]
+    rows = queryset.values_list(*lookups).iterator(chunk_size=chunk_size)
+    if fmt == 'csv':
+        return iter_csv(rows, fields)
+    return iter_ndjson(rows, fields)
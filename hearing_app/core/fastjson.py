@@ -0,0 +1,104 @@
+"""
+Быстрое кодирование строк values_list() в JSON для списков и выгрузки.
+
+Вместо словаря на строку и обхода json-кодировщиком (с вызовом default() на каждую
+дату) пачка строк-кортежей кодируется по столбцам: у столбца одного типа все значения
+проходят через одну C-функцию (map), а объекты собираются заранее подготовленным
+шаблоном с ключами (str.format). Результат байт в байт совпадает с прежним путём —
+JSONRenderer DRF для списков (paginated_json) и DjangoJSONEncoder для NDJSON-выгрузки
+(проверяется в core/tests.py и manage.py benchmark_serialization).
+"""
+import datetime
+import json
+import math
+from json.encoder import encode_basestring
+
+# Разделители JSONRenderer DRF (COMPACT_JSON) и json.dumps по умолчанию
+COMPACT_SEPARATORS = (',', ':')
+DEFAULT_SEPARATORS = (', ', ': ')
+JSON_BOOLEANS = {True: 'true', False: 'false'}
+
+
+def isoformat(value):
+    """Дата/время как в кодировщике DRF: UTC в виде «Z»"""
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def _encode_datetimes(values):
+    return [encode_basestring(isoformat(value)) for value in values]
+
+
+def _encode_dates(values):
+    return list(map(encode_basestring, map(datetime.date.isoformat, values)))
+
+
+class RowEncoder:
+    """
+    Кодирует кортежи values_list() в JSON-объекты с ключами fields.
+    fallback(value) — строка JSON для типов без быстрого пути (Decimal, UUID, NaN, ...),
+    обычно encode() того кодировщика, с которым нужно совпасть (в т.ч. по allow_nan).
+    """
+
+    def __init__(self, fields, fallback, separators=COMPACT_SEPARATORS):
+        item_separator, key_separator = separators
+        self.item_separator = item_separator
+        self.fallback = fallback
+        # '{"id":{},"test_date":{},...}' для str.format; фигурные скобки самого JSON удвоены
+        self.template = '{{' + item_separator.join(
+            (encode_basestring(field) + key_separator).replace('{', '{{').replace('}', '}}') + '{}'
+            for field in fields
+        ) + '}}'
+        self.column_encoders = {
+            str: lambda values: list(map(encode_basestring, values)),
+            int: lambda values: list(map(int.__repr__, values)),
+            float: self._encode_floats,
+            bool: lambda values: list(map(JSON_BOOLEANS.__getitem__, values)),
+            type(None): lambda values: ['null'] * len(values),
+            datetime.datetime: _encode_datetimes,
+            datetime.date: _encode_dates,
+        }
+
+    def _encode_floats(self, values):
+        if all(map(math.isfinite, values)):
+            return list(map(float.__repr__, values))
+        # NaN/Infinity: fallback пишет их или отказывает так же, как исходный кодировщик
+        return [self.fallback(value) for value in values]
+
+    def encode_value(self, value):
+        encode = self.column_encoders.get(type(value))
+        return encode([value])[0] if encode is not None else self.fallback(value)
+
+    def encode_column(self, values):
+        types = set(map(type, values))
+        if len(types) == 1:
+            encode = self.column_encoders.get(types.pop())
+            if encode is not None:
+                return encode(values)
+        # Смешанные типы (например, NULL в части строк)
+        return list(map(self.encode_value, values))
+
+    def encode_objects(self, rows):
+        """Список JSON-объектов по одному на строку"""
+        if not rows:
+            return []
+        columns = [self.encode_column(values) for values in zip(*rows)]
+        return list(map(self.template.format, *columns))
+
+    def encode_rows(self, rows):
+        return '[' + self.item_separator.join(self.encode_objects(rows)) + ']'
+
+
+def drf_encoder(fields):
+    """RowEncoder с настройками JSONRenderer DRF по умолчанию"""
+    from rest_framework.utils.encoders import JSONEncoder
+
+    fallback = JSONEncoder(ensure_ascii=False, allow_nan=False, separators=COMPACT_SEPARATORS).encode
+    return RowEncoder(fields, fallback)
+
+
+def paginated_json(next_link, encoded_rows):
+    """Байты, которые JSONRenderer вернул бы для KeysetPagination.get_paginated_data()"""
+    text = '{"next":' + json.dumps(next_link, ensure_ascii=False) + ',"results":' + encoded_rows + '}'
+    # JSONRenderer экранирует разделители строк, недопустимые в JavaScript
+    return text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
@@ -0,0 +1,129 @@
+"""
+Обслуживание модели из train_model.py внутри процесса Django.
+
+Модель загружается один раз на процесс при первом запросе через
+joblib.load(mmap_mode='r'): массивы деревьев отображаются в память из файла,
+поэтому несколько воркеров gunicorn/uvicorn делят одни и те же страницы.
+Файл модели периодически проверяется (mtime/размер/inode); при изменении новая
+модель загружается целиком и только потом подменяет старую, так что запросы
+всегда видят полностью загруженную модель.
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+# Порядок признаков модели по умолчанию (без .json метаданных); совпадает с ml.features.FEATURE_NAMES
+MODEL_FEATURES = ('max_freq', 'mfcc_mean', 'rms')
+PREDICT_MAX_ROWS = 10000
+
+
+class ModelNotAvailable(Exception):
+    pass
+
+
+class ModelService:
+    def __init__(self, path, check_interval=2.0):
+        self.path = str(path)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # (модель, имена признаков, сигнатура файла) — заменяется одним присваиванием,
+        # поэтому читатели видят либо старое, либо новое состояние целиком
+        self._state = None
+        self._checked_at = 0.0
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            raise ModelNotAvailable(f'Model file not found: {self.path}')
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def get(self):
+        """Текущие (модель, имена признаков, версия); при необходимости (пере)загружает файл"""
+        state = self._state
+        if state is None or time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                state = self._state
+                if state is None or time.monotonic() - self._checked_at >= self.check_interval:
+                    try:
+                        signature = self._file_signature()
+                    except ModelNotAvailable:
+                        # Файл временно пропал (идёт замена) — продолжаем обслуживать загруженную модель
+                        if state is None:
+                            raise
+                        signature = state[2]
+                    if state is None or signature != state[2]:
+                        state = self._state = (*self._load(), signature)
+                    self._checked_at = time.monotonic()
+        model, feature_names, (mtime_ns, size, _) = state
+        return model, feature_names, f'{mtime_ns}-{size}'
+
+    def _load(self):
+        """Модель и имена признаков (из .json рядом с моделью, если он есть — см. core/training.py)"""
+        import joblib
+
+        model = joblib.load(self.path, mmap_mode='r')
+        feature_names = MODEL_FEATURES
+        try:
+            with open(Path(self.path).with_suffix('.json'), encoding='utf-8') as meta_file:
+                feature_names = tuple(json.load(meta_file)['feature_names'])
+        except (FileNotFoundError, KeyError, ValueError):
+            pass
+        return model, feature_names
+
+    @property
+    def feature_names(self):
+        return self.get()[1]
+
+    def predict(self, matrix):
+        model, _, version = self.get()
+        probabilities = model.predict_proba(matrix)
+        labels = model.classes_[np.argmax(probabilities, axis=1)]
+        return {
+            'model_version': version,
+            'classes': model.classes_.tolist(),
+            'predictions': labels.tolist(),
+            'probabilities': probabilities.tolist(),
+        }
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_model_service():
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = ModelService(
+                    settings.HEARING_MODEL_PATH,
+                    check_interval=getattr(settings, 'HEARING_MODEL_CHECK_INTERVAL', 2.0),
+                )
+    return _service
+
+
+def features_to_matrix(rows, feature_names=MODEL_FEATURES):
+    """
+    Список векторов или словарей с ключами feature_names -> матрица float64.
+    Бросает ValueError при неверном формате.
+    """
+    if not isinstance(rows, list) or not rows:
+        raise ValueError('features must be a non-empty list')
+    if len(rows) > PREDICT_MAX_ROWS:
+        raise ValueError(f'Too many rows (max {PREDICT_MAX_ROWS})')
+    rows = [[row.get(name) for name in feature_names] if isinstance(row, dict) else row for row in rows]
+    try:
+        matrix = np.array(rows, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError('features must be numeric')
+    if matrix.ndim != 2 or matrix.shape[1] != len(feature_names):
+        raise ValueError(f'Each row must have {len(feature_names)} features: {", ".join(feature_names)}')
+    if not np.isfinite(matrix).all():
+        raise ValueError('features must be finite numbers')
+    return matrix
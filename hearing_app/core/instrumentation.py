@@ -0,0 +1,188 @@
+"""
+Замеры производительности запросов: общее время, число и время SQL-запросов — по запросу и по этапам.
+
+PerformanceMiddleware открывает замер на каждый запрос, представления размечают
+внутренние этапы через stage('scoring') и т.п. Итог отдаётся в заголовке Server-Timing
+(виден во вкладке Network браузера) и пишется в лог core.performance; поля записи —
+в extra['performance']. Доля запросов PERF_PROFILE_SAMPLE_RATE выполняется под cProfile,
+профиль сохраняется в PERF_PROFILE_DIR, если запрос дольше PERF_PROFILE_THRESHOLD_MS.
+"""
+import contextvars
+import cProfile
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger('core.performance')
+
+# Замер текущего запроса; sync_to_async копирует контекст, так что запросы async ORM тоже учитываются
+_current = contextvars.ContextVar('request_timing', default=None)
+# cProfile нельзя включить в двух потоках одновременно (Python 3.12+), поэтому профилируется один запрос за раз
+_profile_lock = threading.Lock()
+
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        # имя этапа -> [мс, SQL-запросов, мс в БД]; повторные этапы (например, в пакете) суммируются
+        self.stages = {}
+
+    def snapshot(self):
+        return time.perf_counter(), self.queries, self.db_time
+
+    def close_stage(self, name, snapshot):
+        started, queries, db_time = snapshot
+        totals = self.stages.setdefault(name, [0.0, 0, 0.0])
+        totals[0] += (time.perf_counter() - started) * 1000
+        totals[1] += self.queries - queries
+        totals[2] += (self.db_time - db_time) * 1000
+
+    def as_dict(self, total_ms):
+        return {
+            'total_ms': round(total_ms, 3),
+            'db_queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 3),
+            'stages': {
+                name: {'ms': round(ms, 3), 'db_queries': queries, 'db_ms': round(db_ms, 3)}
+                for name, (ms, queries, db_ms) in self.stages.items()
+            },
+        }
+
+    def server_timing(self, total_ms):
+        metrics = [
+            f'total;dur={total_ms:.1f}',
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+        ]
+        metrics.extend(f'{name};dur={ms:.1f}' for name, (ms, _, _) in self.stages.items())
+        return ', '.join(metrics)
+
+
+@contextmanager
+def stage(name):
+    """Размечает этап обработки запроса; вне PerformanceMiddleware ничего не делает"""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    snapshot = timing.snapshot()
+    try:
+        yield
+    finally:
+        timing.close_stage(name, snapshot)
+
+
+def record_query(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.queries += 1
+        timing.db_time += time.perf_counter() - started
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """Обработчик connection_created: подключает record_query к каждому новому соединению"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def start_profiler():
+    if settings.PERF_PROFILE_SAMPLE_RATE <= 0 or random.random() >= settings.PERF_PROFILE_SAMPLE_RATE:
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Включён другой профилировщик (отладчик, coverage)
+        _profile_lock.release()
+        return None
+    return profiler
+
+
+def save_profile(profiler, request, total_ms):
+    directory = Path(settings.PERF_PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+    path = directory / f'{time.strftime("%Y%m%d-%H%M%S")}-{request.method}-{slug}-{total_ms:.0f}ms.prof'
+    profiler.dump_stats(path)
+    return path
+
+
+class PerformanceMiddleware:
+    """Должен стоять первым в MIDDLEWARE, чтобы замер охватывал остальные middleware"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        profiler = start_profiler()
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                _profile_lock.release()
+            _current.reset(token)
+        self.finish(request, response, timing, profiler)
+        return response
+
+    async def __acall__(self, request):
+        # cProfile не следит за корутинами между await, поэтому async-запросы не профилируются
+        timing = RequestTiming()
+        token = _current.set(timing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, timing)
+        return response
+
+    def process_template_response(self, request, response):
+        # Ответы DRF рендерятся (сериализуются в JSON) уже после выхода из представления
+        timing = _current.get()
+        if timing is not None:
+            snapshot = timing.snapshot()
+            response.add_post_render_callback(lambda rendered: timing.close_stage('render', snapshot))
+        return response
+
+    def finish(self, request, response, timing, profiler=None):
+        total_ms = (time.perf_counter() - timing.started) * 1000
+        response['Server-Timing'] = timing.server_timing(total_ms)
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **timing.as_dict(total_ms),
+        }
+        if profiler is not None and total_ms >= settings.PERF_PROFILE_THRESHOLD_MS:
+            record['profile'] = str(save_profile(profiler, request, total_ms))
+
+        logger.info(
+            '%s %s %s %.1f ms, %d queries (%.1f ms)',
+            request.method, request.path, response.status_code, total_ms, timing.queries, timing.db_time * 1000,
+            extra={'performance': record},
+        )
@@ -0,0 +1,171 @@
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from core.benchmarking import client_load, http_load, live_server, make_payload, populate_results, scratch_database
+from core.models import HearingTestResult
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+ENDPOINTS = ('save_results', 'get_test_results', 'get_patient_tests')
+# Во сколько раз p95 может вырасти (а throughput упасть) относительно базовой линии без сигнала регрессии
+DEFAULT_TOLERANCE = 1.5
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный замер save_results / get_test_results / get_patient_tests на 10k/100k/1M записей "
+        "через django.test.Client и по HTTP. Печатает throughput, p50/p95/p99 и число SQL-запросов "
+        "и сравнивает с базовой линией из benchmarks/baseline.json"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000',
+                            help="Размеры таблицы через запятую, например 10000,100000,1000000")
+        parser.add_argument('--requests', type=int, default=300, help="Запросов на endpoint и транспорт")
+        parser.add_argument('--concurrency', type=int, default=8, help="Параллельных HTTP-соединений")
+        parser.add_argument('--no-http', action='store_true', help="Только django.test.Client")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Записать результаты как новую базовую линию вместо сравнения")
+        parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',') if size.strip()})
+        except ValueError:
+            raise CommandError("--sizes: ожидаются целые числа через запятую")
+        rng = random.Random(options['seed'])
+        results = {}
+
+        with scratch_database():
+            populated = 0
+            for size in sizes:
+                # Таблица дозаполняется до следующего размера, а не создаётся заново
+                started = time.perf_counter()
+                populate_results(size - populated, rng)
+                populated = size
+                self.stdout.write(f"{size} rows ({time.perf_counter() - started:.1f} s to populate)")
+                results[str(size)] = self.run_size(rng, options)
+
+        report = {'environment': self.environment(), 'settings': {
+            'sizes': sizes, 'requests': options['requests'], 'concurrency': options['concurrency'],
+            'http': not options['no_http'], 'seed': options['seed'],
+            'write_behind': settings.WRITE_BEHIND_ENABLED, 'database': settings.DATABASES['default']['ENGINE'],
+        }, 'results': results}
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(report, ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+            self.stdout.write(f"Базовая линия записана: {baseline_path}")
+        elif baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text(encoding='utf-8'))
+            self.warn_environment(baseline.get('environment', {}), report['environment'])
+            regressions = self.compare(baseline['results'], results, options['tolerance'])
+            if regressions:
+                raise CommandError(f"{len(regressions)} регрессий относительно {baseline_path}")
+            self.stdout.write(f"Регрессий относительно {baseline_path} нет")
+        else:
+            self.stdout.write(f"Базовой линии {baseline_path} нет; запишите её через --update-baseline")
+
+    def scenarios(self, rng, count):
+        """Пути и тела запросов: реальные id и пациенты из таблицы, свежие синтетические пробы для записи"""
+        samples = list(
+            HearingTestResult.objects.order_by('?')
+            .values_list('id', 'patient__last_name', 'patient__first_name')[:min(count, 500)]
+        )
+        bodies = [json.dumps(make_payload(rng)) for _ in range(min(count, 500))]
+        return {
+            'save_results': ('POST', ['/api/save-results/'], bodies),
+            'get_test_results': ('GET', [f'/api/results/{pk}/' for pk, _, _ in samples], None),
+            'get_patient_tests': ('GET', [
+                '/api/patient-tests/?' + urlencode({'last_name': last_name, 'first_name': first_name})
+                for _, last_name, first_name in samples
+            ], None),
+        }
+
+    def run_size(self, rng, options):
+        total = options['requests']
+        scenarios = self.scenarios(rng, total)
+        measured = {'client': {}, 'http': {}}
+
+        client = Client()
+        for name in ENDPOINTS:
+            method, paths, bodies = scenarios[name]
+            measured['client'][name] = client_load(client, paths, total, method, bodies)
+
+        if not options['no_http']:
+            with live_server() as base_url:
+                for name in ENDPOINTS:
+                    method, paths, bodies = scenarios[name]
+                    measured['http'][name] = http_load(
+                        base_url, paths, total, options['concurrency'], method,
+                        body=bodies[0].encode() if bodies else None,
+                    )
+
+        self.stdout.write(
+            f"  {'endpoint':<18} {'transport':<9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'queries':>7} {'errors':>6}"
+        )
+        for transport, endpoints in measured.items():
+            for name, stats in endpoints.items():
+                queries = f"{stats['queries']:.1f}" if 'queries' in stats else '-'
+                self.stdout.write(
+                    f"  {name:<18} {transport:<9} {stats['throughput']:>9.1f} {stats['p50_ms']:>8.2f} "
+                    f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {queries:>7} {stats['errors']:>6}"
+                )
+        return measured
+
+    def compare(self, baseline, results, tolerance):
+        """Печатает регрессии: больше SQL-запросов, рост p95 или падение throughput сверх tolerance"""
+        regressions = []
+        for size, transports in results.items():
+            for transport, endpoints in transports.items():
+                for name, stats in endpoints.items():
+                    reference = baseline.get(size, {}).get(transport, {}).get(name)
+                    if reference is None:
+                        continue
+                    label = f"{size} {transport} {name}"
+                    if stats.get('max_queries', 0) > reference.get('max_queries', stats.get('max_queries', 0)):
+                        regressions.append(f"{label}: queries {reference['max_queries']} -> {stats['max_queries']}")
+                    if stats['p95_ms'] > reference['p95_ms'] * tolerance:
+                        regressions.append(f"{label}: p95 {reference['p95_ms']:.2f} -> {stats['p95_ms']:.2f} ms")
+                    if stats['throughput'] * tolerance < reference['throughput']:
+                        regressions.append(
+                            f"{label}: throughput {reference['throughput']:.1f} -> {stats['throughput']:.1f} req/s"
+                        )
+                    if stats['errors'] > reference['errors']:
+                        regressions.append(f"{label}: errors {reference['errors']} -> {stats['errors']}")
+        for regression in regressions:
+            self.stderr.write(f"REGRESSION {regression}")
+        return regressions
+
+    def environment(self):
+        return {
+            'date': datetime.date.today().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+        }
+
+    def warn_environment(self, baseline, current):
+        """Абсолютные времена сравнимы только на той же машине: расхождения окружения печатаются"""
+        for key in ('python', 'django', 'sqlite', 'machine', 'cpu_count'):
+            if key in baseline and baseline[key] != current[key]:
+                self.stderr.write(f"Окружение отличается от базовой линии: {key} {baseline[key]} -> {current[key]}")
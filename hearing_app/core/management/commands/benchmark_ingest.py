@@ -0,0 +1,42 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from core.benchmarking import make_payload, scratch_database, timed
+from core.models import HearingTestResult
+
+
+class Command(BaseCommand):
+    help = "Сравнивает N вызовов api/save-results/ с одним вызовом api/save-results/batch/"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        count = options['count']
+        rng = random.Random(options['seed'])
+        payloads = [make_payload(rng) for _ in range(count)]
+        timings = {}
+
+        with scratch_database():
+            client = Client()
+
+            with timed(timings, 'single'):
+                for payload in payloads:
+                    response = client.post('/api/save-results/', json.dumps(payload),
+                                           content_type='application/json')
+                    assert response.json()['status'] == 'success', response.content
+            HearingTestResult.objects.all().delete()
+
+            with timed(timings, 'batch'):
+                response = client.post('/api/save-results/batch/', json.dumps({'results': payloads}),
+                                       content_type='application/json')
+            body = response.json()
+            assert body['saved'] == count, body
+
+        for key, seconds in timings.items():
+            self.stdout.write(f"{key:>6}: {seconds:8.3f} s  {count / seconds:10.1f} results/s")
+        self.stdout.write(f"speedup: {timings['single'] / timings['batch']:.1f}x")
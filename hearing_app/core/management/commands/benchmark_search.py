@@ -0,0 +1,64 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.benchmarking import populate_results, scratch_database
+from core.models import HearingTestResult
+from core.views import patient_tests_values
+
+
+class Command(BaseCommand):
+    help = "Сравнивает поиск по icontains с индексным поиском по нормализованным ФИО"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        with scratch_database():
+            start = time.perf_counter()
+            populate_results(options['rows'], rng)
+            self.stdout.write(f"populated {options['rows']} rows in {time.perf_counter() - start:.1f} s")
+
+            samples = list(
+                HearingTestResult.objects.order_by('?')
+                .values_list('patient__last_name', 'patient__first_name', 'patient__birth_date')[:options['queries']]
+            )
+
+            def icontains(last_name, first_name, birth_date):
+                return HearingTestResult.objects.filter(
+                    patient__last_name__icontains=last_name,
+                    patient__first_name__icontains=first_name,
+                    patient__birth_date=birth_date,
+                )
+
+            def indexed(last_name, first_name, birth_date):
+                return HearingTestResult.objects.search_patient(
+                    last_name=last_name.lower(), first_name=first_name.lower(),
+                ).filter(patient__birth_date=birth_date)
+
+            for label, search in (('icontains', icontains), ('indexed', indexed)):
+                latencies = []
+                for last_name, first_name, birth_date in samples:
+                    queryset = search(last_name, first_name, birth_date)
+                    started = time.perf_counter()
+                    list(patient_tests_values(queryset).order_by('-test_date', '-id')[:51])
+                    latencies.append((time.perf_counter() - started) * 1000)
+                latencies.sort()
+                self.stdout.write(
+                    f"{label:>10}: p50 {statistics.median(latencies):8.2f} ms"
+                    f"  p95 {latencies[int(len(latencies) * 0.95) - 1]:8.2f} ms"
+                )
+
+            last_name, first_name, birth_date = samples[0]
+            sql, params = indexed(last_name, first_name, birth_date).values('id').query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                for row in cursor.fetchall():
+                    self.stdout.write(f"plan: {row[-1]}")
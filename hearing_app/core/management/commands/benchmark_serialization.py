@@ -0,0 +1,63 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarking import populate_results, reference_list_json, reference_ndjson, scratch_database
+from core.export import EXPORT_FIELDS, export_queryset, iter_ndjson
+from core.fastjson import paginated_json
+from core.models import PATIENT_RESULT_FIELDS, HearingTestResult
+from core.views import PATIENT_TESTS_LIST_ENCODER, patient_tests_rows, patient_tests_values
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает скорость (строк/с) прежней сериализации списка и NDJSON-выгрузки "
+        "с быстрым путём core/fastjson.py и проверяет, что вывод совпадает байт в байт"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=3, help="Лучший из N прогонов")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            populate_results(options['rows'], random.Random(options['seed']))
+            tests = HearingTestResult.objects.order_by('-test_date', '-id')
+            export_rows = list(
+                export_queryset().values_list(*(PATIENT_RESULT_FIELDS.get(name, name) for name in EXPORT_FIELDS))
+            )
+
+            # Список: выборка из БД входит в замер, так как путь отличается и ею (словари или кортежи)
+            self.compare(
+                'patient-tests list', options,
+                lambda: reference_list_json(list(patient_tests_values(tests))),
+                lambda: paginated_json(None, PATIENT_TESTS_LIST_ENCODER.encode_rows(list(patient_tests_rows(tests)))),
+            )
+            # Выгрузка: строки values_list() одни и те же, меряется только кодирование
+            self.compare(
+                'ndjson export', options,
+                lambda: reference_ndjson(export_rows, EXPORT_FIELDS),
+                lambda: ''.join(iter_ndjson(export_rows, EXPORT_FIELDS)),
+            )
+
+    def compare(self, label, options, before, after):
+        rows = options['rows']
+        timings = {}
+        outputs = {}
+        for name, render in (('before', before), ('after', after)):
+            best = None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                outputs[name] = render()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+        if outputs['before'] != outputs['after']:
+            raise CommandError(f"{label}: вывод быстрого пути отличается от прежнего")
+        self.stdout.write(
+            f"{label:<20} before {rows / timings['before']:>10.0f} rows/s"
+            f"  after {rows / timings['after']:>10.0f} rows/s"
+            f"  x{timings['before'] / timings['after']:.2f}  (identical output)"
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.caching import cache_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Счётчики попаданий и промахов кеша ответов (результаты тестов, калибровка). "
+        "Видны из отдельного процесса только при общем бэкенде кеша (Redis, файловый)"
+    )
+
+    def handle(self, *args, **options):
+        for name, stats in cache_stats().items():
+            total = stats['hits'] + stats['misses']
+            ratio = stats['hits'] / total if total else 0.0
+            self.stdout.write(f"{name:>12}: {stats['hits']} hits, {stats['misses']} misses ({ratio:.1%} hit rate)")
@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, ExportError, export_queryset, iter_export, parse_fields
+
+
+class Command(BaseCommand):
+    help = "Потоковая выгрузка результатов аудиометрии в CSV или NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--date-from', help="YYYY-MM-DD, включительно")
+        parser.add_argument('--date-to', help="YYYY-MM-DD, включительно")
+        parser.add_argument('--fields', help="Список полей через запятую (по умолчанию все)")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+        parser.add_argument('--output', '-o', help="Файл для записи (по умолчанию stdout)")
+
+    def handle(self, *args, **options):
+        try:
+            fields = parse_fields(options['fields'])
+            queryset = export_queryset(options['date_from'], options['date_to'])
+            chunks = iter_export(queryset, fields, options['format'], options['chunk_size'])
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(chunks)
+        else:
+            sys.stdout.writelines(chunks)
@@ -0,0 +1,57 @@
+import json
+from urllib.parse import quote
+
+from django.core.management.base import BaseCommand
+
+from core.benchmarking import http_load, make_payload
+from core.models import HearingTestResult
+
+# (название, путь синхронного endpoint'а, путь асинхронного)
+SCENARIOS = [
+    ('results', '/api/results/{id}/', '/api/async/results/{id}/'),
+    ('patient-tests', '/api/patient-tests/?last_name={last_name}', '/api/async/patient-tests/?last_name={last_name}'),
+    ('calibration', '/api/calibration/', '/api/async/calibration/'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает пропускную способность и хвостовые задержки WSGI- и ASGI-путей. "
+        "Оба сервера должны быть запущены на одной БД, например: "
+        "gunicorn -w 4 hearing_app.wsgi:application -b 127.0.0.1:8000 и "
+        "uvicorn --workers 4 hearing_app.asgi:application --port 8001"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--asgi-url', default='http://127.0.0.1:8001')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--include-writes', action='store_true',
+                            help="Добавить сценарий save-results (пишет в БД серверов)")
+
+    def handle(self, *args, **options):
+        samples = list(HearingTestResult.objects.order_by('-id').values_list('id', 'patient__last_name')[:100])
+        if not samples:
+            self.stderr.write("В БД нет результатов — заполните её перед нагрузочным тестом")
+            return
+
+        scenarios = list(SCENARIOS)
+        if options['include_writes']:
+            scenarios.append(('save-results', '/api/save-results/', '/api/async/save-results/'))
+        payload = json.dumps(make_payload()).encode()
+
+        self.stdout.write(f"{'scenario':<14} {'path':<5} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+        for name, sync_path, async_path in scenarios:
+            for label, base_url, template in (('wsgi', options['wsgi_url'], sync_path),
+                                              ('asgi', options['asgi_url'], async_path)):
+                paths = [template.format(id=pk, last_name=quote(last_name[:3])) for pk, last_name in samples]
+                writes = name == 'save-results'
+                stats = http_load(
+                    base_url, paths, options['requests'], options['concurrency'],
+                    method='POST' if writes else 'GET', body=payload if writes else None,
+                )
+                self.stdout.write(
+                    f"{name:<14} {label:<5} {stats['throughput']:>9.1f} {stats['p50_ms']:>8.2f} "
+                    f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['errors']:>6}"
+                )
@@ -0,0 +1,110 @@
+import json
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+
+from core.diagnosis import (
+    REDIAGNOSE_CHUNK_SIZE, apply_changes, init_worker, rediagnose_chunk, rules_version,
+)
+from core.models import HearingTestResult
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает заключения и рекомендации сохранённых результатов по текущим правилам "
+        "(core/diagnosis.py): диапазонами первичного ключа, векторно, с записью через bulk_update"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=REDIAGNOSE_CHUNK_SIZE,
+                            help="Ширина диапазона первичного ключа на одну задачу")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Процессов для чтения и расчёта диапазонов; запись всегда в основном процессе")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Только посчитать, сколько заключений изменится, ничего не записывая")
+        parser.add_argument('--resume', action='store_true',
+                            help="Продолжить с последнего записанного диапазона из --state-file")
+        parser.add_argument('--state-file', default=str(settings.BASE_DIR / 'rediagnose.state.json'),
+                            help="Файл с последним обработанным pk (удаляется после завершения)")
+        parser.add_argument('--report-every', type=float, default=5.0, metavar='SECONDS')
+
+    def handle(self, *args, **options):
+        state_path = Path(options['state_file'])
+        chunk_size = options['chunk_size']
+        if chunk_size < 1 or options['workers'] < 1:
+            raise CommandError("--chunk-size и --workers должны быть положительными")
+
+        start_pk = self.resume_from(state_path) if options['resume'] else 0
+        queryset = HearingTestResult.objects.filter(pk__gt=start_pk)
+        bounds = queryset.aggregate(lower=Min('pk'), upper=Max('pk'))
+        if bounds['lower'] is None:
+            self.stdout.write("Нет результатов для пересчёта")
+            state_path.unlink(missing_ok=True)
+            return
+        total = queryset.count()
+        ranges = [
+            (lower, min(lower + chunk_size, bounds['upper'] + 1))
+            for lower in range(bounds['lower'], bounds['upper'] + 1, chunk_size)
+        ]
+
+        scanned = changed = 0
+        transitions = Counter()
+        started = last_report = time.perf_counter()
+        for (lower, upper), (rows, changes) in zip(ranges, self.evaluate(ranges, options['workers'])):
+            if not options['dry_run']:
+                apply_changes(changes)
+                self.save_state(state_path, upper - 1)
+            scanned += rows
+            changed += len(changes)
+            transitions.update((old, new) for _, old, new, _ in changes)
+
+            now = time.perf_counter()
+            if now - last_report >= options['report_every']:
+                self.report(scanned, total, changed, now - started)
+                last_report = now
+
+        self.report(scanned, total, changed, time.perf_counter() - started)
+        for (old, new), count in transitions.most_common():
+            self.stdout.write(f"  {count:>8}  {old!r} -> {new!r}")
+        if options['dry_run']:
+            self.stdout.write("dry run: ничего не записано")
+        else:
+            state_path.unlink(missing_ok=True)
+
+    def evaluate(self, ranges, workers):
+        """(строк, изменения) по диапазонам в исходном порядке, чтобы контрольная точка всегда была сплошной"""
+        if workers == 1:
+            return map(rediagnose_chunk, ranges)
+        # Дочерние процессы не должны наследовать открытые соединения основного
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+        return self.drain(executor, ranges)
+
+    def drain(self, executor, ranges):
+        with executor:
+            yield from executor.map(rediagnose_chunk, ranges)
+
+    def resume_from(self, state_path):
+        try:
+            state = json.loads(state_path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            raise CommandError(f"Нет файла состояния {state_path}; запустите без --resume")
+        if state['rules'] != rules_version():
+            raise CommandError("Правила изменились после прерванного запуска; запустите без --resume")
+        self.stdout.write(f"Продолжение после pk {state['last_pk']}")
+        return state['last_pk']
+
+    def save_state(self, state_path, last_pk):
+        tmp_path = state_path.with_name(state_path.name + '.tmp')
+        tmp_path.write_text(json.dumps({'last_pk': last_pk, 'rules': rules_version()}), encoding='utf-8')
+        tmp_path.replace(state_path)
+
+    def report(self, scanned, total, changed, elapsed):
+        rate = scanned / elapsed if elapsed else 0.0
+        self.stdout.write(f"{scanned}/{total} rows, {changed} changed, {rate:.0f} rows/s")
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.snapshot import SYNC_CHUNK_SIZE, read_meta, sync_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Дописывает новые результаты в колоночный снимок порогов (core/snapshot.py). "
+        "С --follow продолжает работать и подхватывает результаты по мере поступления"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--follow', type=float, metavar='SECONDS',
+                            help="Повторять синхронизацию с этим интервалом")
+        parser.add_argument('--chunk-size', type=int, default=SYNC_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            appended = sync_snapshot(chunk_size=options['chunk_size'])
+            if appended or not options['follow']:
+                self.stdout.write(
+                    f"appended {appended} rows in {time.perf_counter() - started:.2f} s, "
+                    f"{read_meta()['count']} rows in snapshot"
+                )
+            if not options['follow']:
+                break
+            time.sleep(options['follow'])
@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.training import publish_artifact, train
+
+
+class Command(BaseCommand):
+    help = (
+        "Обучает RandomForest по сохранённым результатам и пишет версионированный артефакт "
+        "в HEARING_MODEL_DIR; --incremental дообучает только на новых строках. "
+        "Метка пока берётся из заключения по правилам, поэтому rule_agreement — не качество модели"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help="Добавить деревья, обученные на строках после последней версии")
+        parser.add_argument('--n-estimators', type=int, default=100)
+        parser.add_argument('--increment-estimators', type=int, default=20)
+        parser.add_argument('--test-fraction', type=float, default=0.2)
+        parser.add_argument('--n-jobs', type=int, default=-1, help="-1 — все ядра")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--publish', action='store_true',
+                            help="Сделать новую версию рабочей (HEARING_MODEL_PATH)")
+
+    def handle(self, *args, **options):
+        path, metadata = train(
+            incremental=options['incremental'],
+            n_estimators=options['n_estimators'],
+            increment_estimators=options['increment_estimators'],
+            test_fraction=options['test_fraction'],
+            random_state=options['seed'],
+            n_jobs=options['n_jobs'],
+        )
+        if path is None:
+            self.stdout.write("Нет новых строк для обучения")
+            return
+
+        self.stdout.write(f"Сохранена версия {metadata['version']}: {path}")
+        self.stdout.write(json.dumps(metadata, ensure_ascii=False, indent=2))
+        if options['publish']:
+            publish_artifact(metadata)
+            self.stdout.write("Версия опубликована")
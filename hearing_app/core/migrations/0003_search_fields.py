@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:12
+
+import unicodedata
+
+from django.db import migrations, models
+
+BACKFILL_CHUNK_SIZE = 2000
+
+
+# Копия core.search.normalize_name на момент миграции: её последующие правки не должны менять результат
+def normalize_name(value):
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKC", value).casefold().replace("ё", "е")
+    return " ".join(value.split())
+
+
+def backfill_search_fields(apps, schema_editor):
+    HearingTestResult = apps.get_model("core", "HearingTestResult")
+    last_pk = 0
+    while True:
+        chunk = list(
+            HearingTestResult.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .only("pk", "patient_last_name", "patient_first_name")[:BACKFILL_CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+        for result in chunk:
+            result.patient_last_name_normalized = normalize_name(result.patient_last_name)
+            result.patient_first_name_normalized = normalize_name(result.patient_first_name)
+        HearingTestResult.objects.bulk_update(
+            chunk, ["patient_last_name_normalized", "patient_first_name_normalized"]
+        )
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_hearingtestresult_calibration_data_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hearingtestresult",
+            name="patient_first_name_normalized",
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="hearingtestresult",
+            name="patient_last_name_normalized",
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(backfill_search_fields, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="hearingtestresult",
+            index=models.Index(
+                fields=[
+                    "patient_last_name_normalized",
+                    "patient_first_name_normalized",
+                    "patient_birth_date",
+                ],
+                name="core_result_patient_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="hearingtestresult",
+            index=models.Index(fields=["test_date"], name="core_result_test_date_idx"),
+        ),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:21
+
+import hashlib
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+COLLAPSE_CHUNK_SIZE = 2000
+
+
+# Копия core.calibration.calibration_hash на момент миграции: хеши в таблице не должны зависеть от её правок
+def calibration_hash(data):
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def collapse_calibration_data(apps, schema_editor):
+    """Заменяет копии calibration_data в каждой строке ссылками на дедуплицированные профили"""
+    CalibrationProfile = apps.get_model("core", "CalibrationProfile")
+    HearingTestResult = apps.get_model("core", "HearingTestResult")
+    profile_ids = {}
+    latest_profile_id = None
+    last_pk = 0
+
+    while True:
+        chunk = list(
+            HearingTestResult.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", "calibration_data")[:COLLAPSE_CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+
+        pks_by_profile = {}
+        for pk, data in chunk:
+            content_hash = calibration_hash(data)
+            if content_hash not in profile_ids:
+                profile, _ = CalibrationProfile.objects.get_or_create(
+                    content_hash=content_hash, defaults={"data": data}
+                )
+                profile_ids[content_hash] = profile.pk
+            latest_profile_id = profile_ids[content_hash]
+            pks_by_profile.setdefault(latest_profile_id, []).append(pk)
+
+        for profile_id, pks in pks_by_profile.items():
+            HearingTestResult.objects.filter(pk__in=pks).update(calibration_profile_id=profile_id)
+        last_pk = chunk[-1][0]
+
+    # Активной становится калибровка последнего сохранённого теста
+    if latest_profile_id is not None:
+        CalibrationProfile.objects.filter(pk=latest_profile_id).update(is_active=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_search_fields"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CalibrationProfile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "content_hash",
+                    models.CharField(max_length=64, unique=True, verbose_name="Хеш содержимого"),
+                ),
+                ("data", models.JSONField(verbose_name="Данные калибровки")),
+                ("is_active", models.BooleanField(default=False, verbose_name="Активный")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Дата создания"),
+                ),
+            ],
+            options={
+                "verbose_name": "Профиль калибровки",
+                "verbose_name_plural": "Профили калибровки",
+            },
+        ),
+        migrations.AddField(
+            model_name="hearingtestresult",
+            name="calibration_profile",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="results",
+                to="core.calibrationprofile",
+                verbose_name="Профиль калибровки",
+            ),
+        ),
+        migrations.RunPython(collapse_calibration_data, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="hearingtestresult",
+            name="calibration_data",
+        ),
+    ]
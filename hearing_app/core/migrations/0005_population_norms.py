@@ -0,0 +1,109 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+BACKFILL_CHUNK_SIZE = 5000
+
+# Копии правил core.norms на момент миграции: последующие правки групп и корзин не должны менять её результат
+NORM_FREQUENCIES = (500, 1000, 2000, 4000, 8000)
+NORM_BINS = 100
+AGE_BANDS = (0, 18, 30, 40, 50, 60, 70, 80)
+
+
+def age_band(birth_date, test_date):
+    on_date = test_date.date()
+    age = on_date.year - birth_date.year - ((on_date.month, on_date.day) < (birth_date.month, birth_date.day))
+    lower = max((bound for bound in AGE_BANDS if bound <= age), default=AGE_BANDS[0])
+    upper = AGE_BANDS[AGE_BANDS.index(lower) + 1] - 1 if lower != AGE_BANDS[-1] else None
+    return f"{lower}-{upper}" if upper is not None else f"{lower}+"
+
+
+def bin_index(threshold):
+    return min(NORM_BINS - 1, max(0, int(threshold * NORM_BINS + 1e-9)))
+
+
+def backfill_norms(apps, schema_editor):
+    """Строит нормы по уже сохранённым результатам одним проходом по таблице"""
+    HearingTestResult = apps.get_model("core", "HearingTestResult")
+    PopulationNorm = apps.get_model("core", "PopulationNorm")
+    threshold_fields = [f"threshold_{frequency}" for frequency in NORM_FREQUENCIES]
+    rows = (
+        HearingTestResult.objects.order_by("pk")
+        .values_list("patient_birth_date", "patient_gender", "test_date", *threshold_fields)
+        .iterator(chunk_size=BACKFILL_CHUNK_SIZE)
+    )
+    # Таблица норм только что создана, поэтому группы считаются в памяти и вставляются разом
+    norms = {}
+    for birth_date, gender, test_date, *thresholds in rows:
+        if birth_date is None or not gender:
+            continue
+        band = age_band(birth_date, test_date)
+        for frequency, threshold in zip(NORM_FREQUENCIES, thresholds):
+            if threshold is None:
+                continue
+            norm = norms.setdefault(
+                (band, gender, frequency),
+                PopulationNorm(age_band=band, gender=gender, frequency=frequency, histogram=[0] * NORM_BINS),
+            )
+            norm.count += 1
+            norm.histogram[bin_index(threshold)] += 1
+    PopulationNorm.objects.bulk_create(norms.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_calibration_profiles"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PopulationNorm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "age_band",
+                    models.CharField(max_length=10, verbose_name="Возрастная группа"),
+                ),
+                (
+                    "gender",
+                    models.CharField(
+                        choices=[("M", "Мужской"), ("F", "Женский")],
+                        max_length=1,
+                        verbose_name="Пол",
+                    ),
+                ),
+                (
+                    "frequency",
+                    models.PositiveIntegerField(verbose_name="Частота, Гц"),
+                ),
+                (
+                    "count",
+                    models.PositiveIntegerField(default=0, verbose_name="Число результатов"),
+                ),
+                (
+                    "histogram",
+                    models.JSONField(default=list, verbose_name="Гистограмма порогов"),
+                ),
+            ],
+            options={
+                "verbose_name": "Популяционная норма",
+                "verbose_name_plural": "Популяционные нормы",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("age_band", "gender", "frequency"),
+                        name="core_norm_group_uniq",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_norms, migrations.RunPython.noop),
+    ]
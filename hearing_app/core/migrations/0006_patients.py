@@ -0,0 +1,256 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:40
+
+import hashlib
+import logging
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+MERGE_CHUNK_SIZE = 2000
+PATIENT_FIELDS = ("last_name", "first_name", "middle_name", "gender", "birth_date", "phone", "email")
+CONTACT_FIELDS = ("phone", "email")
+
+logger = logging.getLogger(__name__)
+
+
+# Копии core.search на момент миграции: последующие правки нормализации не должны менять её результат
+def normalize_name(value):
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKC", value).casefold().replace("ё", "е")
+    return " ".join(value.split())
+
+
+def patient_identity_key(last_name, first_name, middle_name, gender, birth_date):
+    identity = "\x1f".join((
+        normalize_name(last_name), normalize_name(first_name), normalize_name(middle_name),
+        (gender or "").strip().upper(), birth_date.isoformat(),
+    ))
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def result_chunks(HearingTestResult):
+    """(pk, identity_key, данные пациента) результатов пачками по MERGE_CHUNK_SIZE"""
+    last_pk = 0
+    while True:
+        chunk = list(
+            HearingTestResult.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", *(f"patient_{name}" for name in PATIENT_FIELDS))[:MERGE_CHUNK_SIZE]
+        )
+        if not chunk:
+            return
+        rows = []
+        for pk, *values in chunk:
+            data = dict(zip(PATIENT_FIELDS, values))
+            key = patient_identity_key(
+                data["last_name"], data["first_name"], data["middle_name"], data["gender"], data["birth_date"]
+            )
+            rows.append((pk, key, data))
+        yield rows
+        last_pk = chunk[-1][0]
+
+
+def merge_patients(apps, schema_editor):
+    """
+    Переносит повторяющиеся ФИО/контакты результатов в таблицу пациентов: одна строка
+    на identity_key (ФИО, пол и дата рождения). Контакты — по правилу PatientQuerySet.resolve():
+    результаты обходятся по pk, и каждый непустой телефон или email заменяет прежний.
+    Заменённые значения попадают в предупреждение лога.
+    """
+    HearingTestResult = apps.get_model("core", "HearingTestResult")
+    Patient = apps.get_model("core", "Patient")
+
+    patients = {}
+    overwritten = []
+    for rows in result_chunks(HearingTestResult):
+        for pk, key, data in rows:
+            patient = patients.setdefault(key, data)
+            for field in CONTACT_FIELDS:
+                if data[field] and data[field] != patient[field]:
+                    if patient[field]:
+                        overwritten.append(f"{field} {patient[field]!r} -> {data[field]!r} (результат {pk})")
+                    patient[field] = data[field]
+    if overwritten:
+        logger.warning(
+            "Заменено %d прежних контактов пациентов более новыми:\n%s",
+            len(overwritten), "\n".join(overwritten[:100]),
+        )
+
+    Patient.objects.bulk_create(
+        [
+            Patient(
+                identity_key=key,
+                last_name_normalized=normalize_name(data["last_name"]),
+                first_name_normalized=normalize_name(data["first_name"]),
+                **data,
+            )
+            for key, data in patients.items()
+        ],
+        batch_size=500,
+    )
+    patient_ids = dict(Patient.objects.values_list("identity_key", "pk"))
+    for rows in result_chunks(HearingTestResult):
+        HearingTestResult.objects.bulk_update(
+            [HearingTestResult(pk=pk, patient_id=patient_ids[key]) for pk, key, _ in rows],
+            ["patient"],
+            batch_size=500,
+        )
+
+
+def split_patients(apps, schema_editor):
+    """
+    Обратная операция: возвращает данные пациента в строки результатов
+    (все результаты пациента получают его последние контакты)
+    """
+    HearingTestResult = apps.get_model("core", "HearingTestResult")
+    fields = [f"patient_{name}" for name in PATIENT_FIELDS]
+    last_pk = 0
+
+    while True:
+        chunk = list(
+            HearingTestResult.objects.filter(pk__gt=last_pk)
+            .select_related("patient")
+            .order_by("pk")[:MERGE_CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+        for result in chunk:
+            for name in PATIENT_FIELDS:
+                setattr(result, f"patient_{name}", getattr(result.patient, name))
+            result.patient_last_name_normalized = result.patient.last_name_normalized
+            result.patient_first_name_normalized = result.patient.first_name_normalized
+        HearingTestResult.objects.bulk_update(
+            chunk,
+            [*fields, "patient_last_name_normalized", "patient_first_name_normalized"],
+            batch_size=500,
+        )
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_population_norms"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Patient",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "identity_key",
+                    models.CharField(editable=False, max_length=64, unique=True),
+                ),
+                ("last_name", models.CharField(max_length=100, verbose_name="Фамилия")),
+                ("first_name", models.CharField(max_length=100, verbose_name="Имя")),
+                (
+                    "middle_name",
+                    models.CharField(blank=True, max_length=100, verbose_name="Отчество"),
+                ),
+                (
+                    "gender",
+                    models.CharField(
+                        choices=[("M", "Мужской"), ("F", "Женский")],
+                        max_length=1,
+                        verbose_name="Пол",
+                    ),
+                ),
+                ("birth_date", models.DateField(verbose_name="Дата рождения")),
+                ("phone", models.CharField(blank=True, max_length=20, verbose_name="Телефон")),
+                ("email", models.EmailField(blank=True, max_length=254, verbose_name="Email")),
+                (
+                    "last_name_normalized",
+                    models.CharField(blank=True, editable=False, max_length=100),
+                ),
+                (
+                    "first_name_normalized",
+                    models.CharField(blank=True, editable=False, max_length=100),
+                ),
+            ],
+            options={
+                "verbose_name": "Пациент",
+                "verbose_name_plural": "Пациенты",
+                "indexes": [
+                    models.Index(
+                        fields=["last_name_normalized", "first_name_normalized", "birth_date"],
+                        name="core_patient_search_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddField(
+            model_name="hearingtestresult",
+            name="patient",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="results",
+                to="core.patient",
+                verbose_name="Пациент",
+            ),
+        ),
+        # Обязательные столбцы пациента временно допускают NULL, чтобы при откате их можно было
+        # вернуть в таблицу до того, как split_patients заполнит их обратно
+        *(
+            migrations.AlterField(model_name="hearingtestresult", name=name, field=field)
+            for name, field in (
+                ("patient_last_name", models.CharField(max_length=100, null=True, verbose_name="Фамилия")),
+                ("patient_first_name", models.CharField(max_length=100, null=True, verbose_name="Имя")),
+                (
+                    "patient_gender",
+                    models.CharField(
+                        choices=[("M", "Мужской"), ("F", "Женский")],
+                        max_length=1,
+                        null=True,
+                        verbose_name="Пол",
+                    ),
+                ),
+                ("patient_birth_date", models.DateField(null=True, verbose_name="Дата рождения")),
+            )
+        ),
+        migrations.RunPython(merge_patients, split_patients),
+        migrations.RemoveIndex(
+            model_name="hearingtestresult",
+            name="core_result_patient_idx",
+        ),
+        migrations.RemoveField(model_name="hearingtestresult", name="patient_last_name"),
+        migrations.RemoveField(model_name="hearingtestresult", name="patient_first_name"),
+        migrations.RemoveField(model_name="hearingtestresult", name="patient_middle_name"),
+        migrations.RemoveField(model_name="hearingtestresult", name="patient_gender"),
+        migrations.RemoveField(model_name="hearingtestresult", name="patient_birth_date"),
+        migrations.RemoveField(model_name="hearingtestresult", name="patient_phone"),
+        migrations.RemoveField(model_name="hearingtestresult", name="patient_email"),
+        migrations.RemoveField(
+            model_name="hearingtestresult", name="patient_last_name_normalized"
+        ),
+        migrations.RemoveField(
+            model_name="hearingtestresult", name="patient_first_name_normalized"
+        ),
+        migrations.AlterField(
+            model_name="hearingtestresult",
+            name="patient",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="results",
+                to="core.patient",
+                verbose_name="Пациент",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="hearingtestresult",
+            index=models.Index(fields=["patient", "test_date"], name="core_result_patient_date_idx"),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_patients"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RawTrials",
+            fields=[
+                (
+                    "result",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="raw_trials",
+                        serialize=False,
+                        to="core.hearingtestresult",
+                        verbose_name="Результат",
+                    ),
+                ),
+                ("data", models.BinaryField(verbose_name="Пробы")),
+            ],
+            options={
+                "verbose_name": "Сырые пробы теста",
+                "verbose_name_plural": "Сырые пробы тестов",
+            },
+        ),
+    ]
@@ -1,19 +1,208 @@
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
 
+from .caching import CALIBRATION_CACHE_KEY, acount, count, invalidate_calibration
+from .calibration import CALIBRATION_VALUES, calibration_hash
+from .search import normalize_name, patient_identity_key, prefix_range
 
-class HearingTestResult(models.Model):
+
+class CalibrationProfileManager(models.Manager):
+    def get_or_create_for(self, data):
+        """Возвращает профиль с такими же значениями или создаёт новый (дедупликация по хешу)"""
+        profile, _ = self.get_or_create(content_hash=calibration_hash(data), defaults={'data': data})
+        return profile
+
+    def activate(self, data):
+        with transaction.atomic():
+            profile = self.get_or_create_for(data)
+            self.filter(is_active=True).exclude(pk=profile.pk).update(is_active=False)
+            if not profile.is_active:
+                profile.is_active = True
+                profile.save(update_fields=['is_active'])
+        invalidate_calibration()
+        return profile
+
+    def active(self):
+        """Активный профиль; читается из кеша (core/caching.py) не чаще раза в CALIBRATION_CACHE_TIMEOUT"""
+        profile = cache.get(CALIBRATION_CACHE_KEY)
+        count('calibration', profile is not None)
+        if profile is None:
+            profile = self.filter(is_active=True).order_by('-id').first()
+            if profile is None:
+                profile = self.activate(CALIBRATION_VALUES)
+            cache.set(CALIBRATION_CACHE_KEY, profile, settings.CALIBRATION_CACHE_TIMEOUT)
+        return profile
+
+    async def aactive(self):
+        profile = await cache.aget(CALIBRATION_CACHE_KEY)
+        await acount('calibration', profile is not None)
+        if profile is None:
+            profile = await self.filter(is_active=True).order_by('-id').afirst()
+            if profile is None:
+                # Активация пишет в транзакции, которую async ORM не поддерживает
+                profile = await sync_to_async(self.activate)(CALIBRATION_VALUES)
+            await cache.aset(CALIBRATION_CACHE_KEY, profile, settings.CALIBRATION_CACHE_TIMEOUT)
+        return profile
+
+
+class CalibrationProfile(models.Model):
+    content_hash = models.CharField(max_length=64, unique=True, verbose_name="Хеш содержимого")
+    data = models.JSONField(verbose_name="Данные калибровки")
+    is_active = models.BooleanField(default=False, verbose_name="Активный")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+    objects = CalibrationProfileManager()
+
+    class Meta:
+        verbose_name = "Профиль калибровки"
+        verbose_name_plural = "Профили калибровки"
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.created_at})"
+
+
+def search_filters(prefix, last_name='', first_name=''):
+    """Условия поиска по началу фамилии и имени без учёта регистра (в т.ч. кириллица)"""
+    filters = {}
+    for field, value in (('last_name_normalized', last_name), ('first_name_normalized', first_name)):
+        value = normalize_name(value)
+        if value:
+            lower, upper = prefix_range(value)
+            filters[f'{prefix}{field}__gte'] = lower
+            filters[f'{prefix}{field}__lt'] = upper
+    return filters
+
+
+class PatientQuerySet(models.QuerySet):
+    def search(self, last_name='', first_name=''):
+        return self.filter(**search_filters('', last_name, first_name))
+
+    def resolve(self, patients):
+        """
+        Сохранённые пациенты для несохранённых Patient по identity_key: одно индексное
+        чтение на всех плюс одна вставка для новых. Непустые телефон и email из новой
+        записи заменяют сохранённые (ещё один UPDATE, только если они изменились).
+        Возвращает список в том же порядке.
+        """
+        for patient in patients:
+            patient.sync_search_fields()
+        keys = {patient.identity_key for patient in patients}
+        found = {patient.identity_key: patient for patient in self.filter(identity_key__in=keys)}
+        missing = {patient.identity_key: patient for patient in patients if patient.identity_key not in found}
+        if missing:
+            # Пациента могли только что создать параллельно: при конфликте ключа строка не меняется
+            # (нормализованные имена однозначно задаются ключом), а pk возвращается вставкой (SQLite, PostgreSQL)
+            created = self.bulk_create(
+                missing.values(),
+                update_conflicts=True,
+                unique_fields=['identity_key'],
+                update_fields=['last_name_normalized', 'first_name_normalized'],
+            )
+            if any(patient.pk is None for patient in created):
+                created = self.filter(identity_key__in=missing.keys())
+            found.update((patient.identity_key, patient) for patient in created)
+
+        changed = {}
+        for patient in patients:
+            stored = found[patient.identity_key]
+            for field in Patient.CONTACT_FIELDS:
+                value = getattr(patient, field)
+                if value and value != getattr(stored, field):
+                    setattr(stored, field, value)
+                    changed[stored.pk] = stored
+        if changed:
+            self.bulk_update(changed.values(), Patient.CONTACT_FIELDS)
+        return [found[patient.identity_key] for patient in patients]
+
+
+class Patient(models.Model):
     GENDER_CHOICES = [
         ('M', 'Мужской'),
         ('F', 'Женский'),
     ]
 
-    patient_last_name = models.CharField(max_length=100, verbose_name="Фамилия")
-    patient_first_name = models.CharField(max_length=100, verbose_name="Имя")
-    patient_middle_name = models.CharField(max_length=100, blank=True, verbose_name="Отчество")
-    patient_gender = models.CharField(max_length=1, choices=GENDER_CHOICES, verbose_name="Пол")
-    patient_birth_date = models.DateField(verbose_name="Дата рождения")
-    patient_phone = models.CharField(max_length=20, blank=True, verbose_name="Телефон")
-    patient_email = models.EmailField(blank=True, verbose_name="Email")
+    # search.patient_identity_key(): хеш нормализованных ФИО, пола и даты рождения
+    identity_key = models.CharField(max_length=64, unique=True, editable=False)
+
+    last_name = models.CharField(max_length=100, verbose_name="Фамилия")
+    first_name = models.CharField(max_length=100, verbose_name="Имя")
+    middle_name = models.CharField(max_length=100, blank=True, verbose_name="Отчество")
+    gender = models.CharField(max_length=1, choices=GENDER_CHOICES, verbose_name="Пол")
+    birth_date = models.DateField(verbose_name="Дата рождения")
+    phone = models.CharField(max_length=20, blank=True, verbose_name="Телефон")
+    email = models.EmailField(blank=True, verbose_name="Email")
+
+    # Нормализованные копии для поиска, заполняются в sync_search_fields()
+    last_name_normalized = models.CharField(max_length=100, blank=True, editable=False)
+    first_name_normalized = models.CharField(max_length=100, blank=True, editable=False)
+
+    # Не входят в identity_key: обновляются последними непустыми значениями (PatientQuerySet.resolve)
+    CONTACT_FIELDS = ['phone', 'email']
+
+    objects = PatientQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Пациент"
+        verbose_name_plural = "Пациенты"
+        indexes = [
+            models.Index(
+                fields=['last_name_normalized', 'first_name_normalized', 'birth_date'],
+                name='core_patient_search_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.last_name} {self.first_name} ({self.birth_date})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        patient = super().from_db(db, field_names, values)
+        # Прежний ключ нужен, чтобы после правки ФИО в админке сбросить кеш динамики и под ним
+        patient.loaded_identity_key = patient.__dict__.get('identity_key')
+        return patient
+
+    def sync_search_fields(self):
+        """Обновляет нормализованные поля и ключ; bulk_create вызывает save() в обход, поэтому вызывать вручную"""
+        self.last_name_normalized = normalize_name(self.last_name)
+        self.first_name_normalized = normalize_name(self.first_name)
+        self.identity_key = patient_identity_key(
+            self.last_name, self.first_name, self.middle_name, self.gender, self.birth_date
+        )
+
+    def save(self, *args, **kwargs):
+        self.sync_search_fields()
+        super().save(*args, **kwargs)
+
+
+class HearingTestResultQuerySet(models.QuerySet):
+    def search_patient(self, last_name='', first_name=''):
+        """Поиск по началу фамилии и имени пациента без учёта регистра (в т.ч. кириллица)"""
+        return self.filter(**search_filters('patient__', last_name, first_name))
+
+
+# Поля пациента в ответах API и выгрузке (прежние столбцы результата) -> путь через внешний ключ
+PATIENT_RESULT_FIELDS = {
+    'patient_last_name': 'patient__last_name',
+    'patient_first_name': 'patient__first_name',
+    'patient_middle_name': 'patient__middle_name',
+    'patient_gender': 'patient__gender',
+    'patient_birth_date': 'patient__birth_date',
+    'patient_phone': 'patient__phone',
+    'patient_email': 'patient__email',
+}
+
+
+class HearingTestResult(models.Model):
+    # Индекс по внешнему ключу даёт core_result_patient_date_idx (пациент, дата теста)
+    patient = models.ForeignKey(
+        Patient,
+        on_delete=models.PROTECT,
+        related_name='results',
+        db_index=False,
+        verbose_name="Пациент",
+    )
 
     test_date = models.DateTimeField(auto_now_add=True, verbose_name="Дата теста")
     test_type = models.CharField(max_length=100, default="Тональная аудиометрия", verbose_name="Тип теста")
@@ -30,14 +219,73 @@ class HearingTestResult(models.Model):
     reliability_4000 = models.FloatField(verbose_name="Достоверность 4000 Гц")
     reliability_8000 = models.FloatField(verbose_name="Достоверность 8000 Гц")
 
-    calibration_data = models.JSONField(verbose_name="Данные калибровки")
+    calibration_profile = models.ForeignKey(
+        CalibrationProfile,
+        on_delete=models.PROTECT,
+        null=True,
+        related_name='results',
+        verbose_name="Профиль калибровки",
+    )
 
     diagnosis = models.TextField(verbose_name="Заключение")
     recommendations = models.TextField(blank=True, verbose_name="Рекомендации")
 
+    objects = HearingTestResultQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Результат аудиометрии"
         verbose_name_plural = "Результаты аудиометрии"
+        indexes = [
+            models.Index(fields=['patient', 'test_date'], name='core_result_patient_date_idx'),
+            models.Index(fields=['test_date'], name='core_result_test_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.patient} - {self.test_date}"
+
+
+class RawTrials(models.Model):
+    """Сырые пробы теста в компактной двоичной записи (формат и декодер — core/trials.py)"""
+    result = models.OneToOneField(
+        HearingTestResult,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='raw_trials',
+        verbose_name="Результат",
+    )
+    data = models.BinaryField(verbose_name="Пробы")
+
+    class Meta:
+        verbose_name = "Сырые пробы теста"
+        verbose_name_plural = "Сырые пробы тестов"
+
+
+def attach_patients(results):
+    """Заменяет несохранённых пациентов результатов (build_test_result) сохранёнными, см. PatientQuerySet.resolve"""
+    resolved = Patient.objects.resolve([result.patient for result in results])
+    for result, patient in zip(results, resolved):
+        result.patient = patient
+    return results
+
+
+class PopulationNorm(models.Model):
+    """
+    Распределение порогов на одной частоте в группе (возрастной диапазон, пол).
+    Обновляется при каждом сохранении результата (core/norms.py), без пересчёта всей таблицы.
+    """
+    age_band = models.CharField(max_length=10, verbose_name="Возрастная группа")
+    gender = models.CharField(max_length=1, choices=Patient.GENDER_CHOICES, verbose_name="Пол")
+    frequency = models.PositiveIntegerField(verbose_name="Частота, Гц")
+    count = models.PositiveIntegerField(default=0, verbose_name="Число результатов")
+    # Гистограмма порогов по norms.NORM_BINS равным корзинам на [0, 1]
+    histogram = models.JSONField(default=list, verbose_name="Гистограмма порогов")
+
+    class Meta:
+        verbose_name = "Популяционная норма"
+        verbose_name_plural = "Популяционные нормы"
+        constraints = [
+            models.UniqueConstraint(fields=['age_band', 'gender', 'frequency'], name='core_norm_group_uniq'),
+        ]
 
     def __str__(self):
-        return f"{self.patient_last_name} {self.patient_first_name} - {self.test_date}"
\ No newline at end of file
+        return f"{self.age_band} {self.gender} {self.frequency} Гц ({self.count})"
@@ -0,0 +1,133 @@
+"""
+Популяционные нормы порогов по возрастным группам и полу.
+
+Для каждой группы (возрастной диапазон, пол, частота) хранится гистограмма порогов
+из NORM_BINS равных корзин на [0, 1] — потоковый квантильный эскиз с погрешностью
+рангов не больше одной корзины. Новый результат добавляет по единице в корзины своих
+частот (record_results), а процентиль пациента считается по одной строке на частоту
+за фиксированное число операций, без агрегирования HearingTestResult.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+
+from .models import PopulationNorm
+
+NORM_FREQUENCIES = (500, 1000, 2000, 4000, 8000)
+NORM_BINS = 100
+# Нижние границы возрастных групп, лет
+AGE_BANDS = (0, 18, 30, 40, 50, 60, 70, 80)
+
+
+def age_band(birth_date, on_date):
+    if isinstance(birth_date, str):
+        birth_date = parse_date(birth_date)
+    if birth_date is None:
+        return None
+    if isinstance(on_date, datetime.datetime):
+        on_date = on_date.date()
+    age = on_date.year - birth_date.year - ((on_date.month, on_date.day) < (birth_date.month, birth_date.day))
+    lower = max((bound for bound in AGE_BANDS if bound <= age), default=AGE_BANDS[0])
+    upper = AGE_BANDS[AGE_BANDS.index(lower) + 1] - 1 if lower != AGE_BANDS[-1] else None
+    return f'{lower}-{upper}' if upper is not None else f'{lower}+'
+
+
+def bin_index(threshold):
+    """Корзина порога; значения вне [0, 1] попадают в крайние корзины"""
+    # Допуск, чтобы 0.29 * 100 = 28.999… попадало в корзину 29, а не 28
+    return min(NORM_BINS - 1, max(0, int(threshold * NORM_BINS + 1e-9)))
+
+
+def accumulate(rows, on_date=None):
+    """
+    rows — итерируемое (дата рождения, пол, дата теста, {частота: порог}).
+    Возвращает {(группа, пол, частота): [число, гистограмма]} только с приращениями.
+    """
+    increments = {}
+    for birth_date, gender, test_date, thresholds in rows:
+        band = age_band(birth_date, test_date or on_date or datetime.date.today())
+        if band is None or not gender:
+            continue
+        for frequency, threshold in thresholds.items():
+            if threshold is None:
+                continue
+            counts = increments.setdefault((band, gender, frequency), [0, [0] * NORM_BINS])
+            counts[0] += 1
+            counts[1][bin_index(threshold)] += 1
+    return increments
+
+
+def result_thresholds(result):
+    return {frequency: getattr(result, f'threshold_{frequency}') for frequency in NORM_FREQUENCIES}
+
+
+def apply_increments(increments, model=PopulationNorm):
+    """
+    Добавляет приращения к строкам норм: одно чтение с блокировкой и один bulk_update
+    на все группы (плюс создание недостающих групп). Вызывать внутри транзакции сохранения.
+    """
+    if not increments:
+        return
+
+    def locked_groups():
+        groups = Q()
+        for band, gender, frequency in increments:
+            groups |= Q(age_band=band, gender=gender, frequency=frequency)
+        return {
+            (norm.age_band, norm.gender, norm.frequency): norm
+            for norm in model.objects.select_for_update().filter(groups)
+        }
+
+    with transaction.atomic(savepoint=False):
+        norms = locked_groups()
+        missing = increments.keys() - norms.keys()
+        if missing:
+            # Пустые строки создаются отдельно, чтобы параллельное создание той же группы не ломало сохранение
+            model.objects.bulk_create([
+                model(age_band=band, gender=gender, frequency=frequency, histogram=[0] * NORM_BINS)
+                for band, gender, frequency in missing
+            ], ignore_conflicts=True)
+            norms = locked_groups()
+
+        for key, (count, histogram) in increments.items():
+            norm = norms[key]
+            norm.count += count
+            norm.histogram = [old + new for old, new in zip(norm.histogram, histogram)]
+        model.objects.bulk_update(norms.values(), ['count', 'histogram'])
+
+
+def record_results(results):
+    """Учитывает сохранённые HearingTestResult (с загруженным patient) в нормах (вызывается после save/bulk_create)"""
+    apply_increments(accumulate(
+        (result.patient.birth_date, result.patient.gender, result.test_date, result_thresholds(result))
+        for result in results
+    ))
+
+
+def percentile(norm, threshold):
+    """Доля группы с порогом ниже данного, % (половина своей корзины считается ниже)"""
+    if not norm.count:
+        return None
+    index = bin_index(threshold)
+    below = sum(norm.histogram[:index]) + norm.histogram[index] / 2
+    return round(100 * below / norm.count, 1)
+
+
+def patient_percentiles(result):
+    """
+    Процентили порогов результата в его группе.
+    Возвращает (группа, {'500': 63.5, ...}, {'500': размер группы, ...}); процентиль None, если группа пуста.
+    """
+    band = age_band(result.patient.birth_date, result.test_date)
+    norms = {
+        norm.frequency: norm
+        for norm in PopulationNorm.objects.filter(age_band=band, gender=result.patient.gender)
+    }
+    thresholds = result_thresholds(result)
+    return band, {
+        str(frequency): percentile(norms[frequency], thresholds[frequency])
+        if frequency in norms and thresholds[frequency] is not None else None
+        for frequency in NORM_FREQUENCIES
+    }, {str(frequency): norm.count for frequency, norm in norms.items()}
@@ -0,0 +1,103 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .fastjson import paginated_json
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация по убыванию (test_date, id).
+
+    Вместо OFFSET следующая страница выбирается условием
+    (test_date, id) < (последняя дата, последний id), поэтому стоимость запроса
+    не растёт с номером страницы. Курсор — непрозрачная base64-строка.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 50
+    max_page_size = 200
+
+    def __init__(self, columns=None):
+        # Имена столбцов, если страница — кортежи values_list(), а не словари values()
+        self.columns = columns
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.GET.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, test_date, pk):
+        raw = json.dumps([test_date.isoformat(), pk]).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            test_date, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            test_date = parse_datetime(test_date)
+            if test_date is None or not isinstance(pk, int):
+                raise ValueError
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise ValidationError({'status': 'error', 'message': 'Invalid cursor'})
+        return test_date, pk
+
+    def page_queryset(self, queryset, request):
+        """
+        queryset — значения values() или values_list() (с columns) с полями test_date и id.
+        Возвращает срез текущей страницы (+1 строка, чтобы понять, есть ли следующая).
+        Работает и с DRF Request, и с обычным HttpRequest (async-представления).
+        """
+        self.request = request
+        self.current_page_size = self.get_page_size(request)
+
+        cursor = request.GET.get(self.cursor_query_param)
+        if cursor:
+            test_date, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(test_date__lt=test_date) | Q(test_date=test_date, id__lt=pk))
+
+        return queryset.order_by('-test_date', '-id')[:self.current_page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.current_page_size
+        rows = rows[:self.current_page_size]
+        self.last_row = rows[-1] if rows else None
+        return rows
+
+    def row_key(self, row):
+        if self.columns is None:
+            return row['test_date'], row['id']
+        return row[self.columns.index('test_date')], row[self.columns.index('id')]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Возвращает список строк текущей страницы"""
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        return self.set_page([row async for row in self.page_queryset(queryset, request)])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        cursor = self.encode_cursor(*self.row_key(self.last_row))
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_json(self, encoder, rows):
+        """То же тело, что JSONRenderer для get_paginated_data(), для кортежей через RowEncoder (core/fastjson.py)"""
+        return paginated_json(self.get_next_link(), encoder.encode_rows(rows))
@@ -0,0 +1,110 @@
+"""
+Подсчёт порогов слышимости и достоверности по сырым пробам теста.
+
+Список проб один раз переводится в массивы NumPy, после чего пороги (минимальная
+услышанная громкость) и доля услышанных проб считаются сгруппированными редукциями
+за один проход, а не отдельным просмотром списка для каждой частоты.
+Модуль не зависит от запроса и может использоваться из views, management-команд
+и пакетных задач.
+"""
+import math
+
+import numpy as np
+
+DEFAULT_FREQUENCIES = (500, 1000, 2000, 4000, 8000)
+
+
+def _as_number(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return math.nan
+
+
+def _numeric_column(values):
+    """Столбец значений -> float64; всё, что не int/float, становится NaN"""
+    column = np.array(values)
+    if column.dtype.kind in 'biuf':
+        return column.astype(np.float64, copy=False)
+    # Медленный путь для смешанных типов (None, строки и т.п.)
+    return np.fromiter((_as_number(v) for v in values), dtype=np.float64, count=len(values))
+
+
+def trials_to_arrays(data):
+    """
+    Переводит список проб [{'frequency', 'volume', 'heard'}, ...] в массивы
+    (frequencies, volumes, heard). Нечисловые частоты и громкости становятся NaN.
+    """
+    frequencies = _numeric_column([r.get('frequency') for r in data])
+    volumes = _numeric_column([r.get('volume') for r in data])
+    heard = np.array([r.get('heard', False) for r in data])
+    if heard.dtype.kind not in 'biuf':
+        heard = heard.astype(object)
+    heard = heard.astype(np.bool_)
+    return frequencies, volumes, heard
+
+
+def score_arrays(frequencies, volumes, heard, frequency_set=DEFAULT_FREQUENCIES, sessions=None, n_sessions=None):
+    """
+    Сгруппированный подсчёт по массивам проб.
+
+    frequencies, volumes, heard — массивы одной длины; sessions — необязательный
+    номер сессии для каждой пробы (0..n_sessions-1), что позволяет обсчитать
+    сразу много тестов. Возвращает (thresholds, reliabilities, totals) формы
+    (n_sessions, len(frequency_set)); порог NaN, если ни одна проба не услышана.
+    """
+    frequency_set = np.asarray(frequency_set, dtype=np.float64)
+    n_freq = len(frequency_set)
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    volumes = np.asarray(volumes, dtype=np.float64)
+    heard = np.asarray(heard, dtype=np.bool_)
+
+    if sessions is None:
+        sessions = np.zeros(len(frequencies), dtype=np.intp)
+        n_sessions = 1
+    else:
+        sessions = np.asarray(sessions, dtype=np.intp)
+        if n_sessions is None:
+            n_sessions = int(sessions.max()) + 1 if len(sessions) else 0
+
+    # Индекс частоты каждой пробы в frequency_set; пробы с чужими частотами отбрасываются
+    order = np.argsort(frequency_set)
+    positions = np.searchsorted(frequency_set, frequencies, sorter=order)
+    positions = np.minimum(positions, n_freq - 1)
+    freq_index = order[positions]
+    matched = frequency_set[freq_index] == frequencies
+
+    groups = sessions[matched] * n_freq + freq_index[matched]
+    size = n_sessions * n_freq
+    totals = np.bincount(groups, minlength=size)
+    heard_counts = np.bincount(groups, weights=heard[matched], minlength=size)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        reliabilities = np.where(totals > 0, heard_counts / np.maximum(totals, 1), 0.0)
+
+    thresholds = np.full(size, np.inf)
+    counted = heard[matched] & ~np.isnan(volumes[matched])
+    np.minimum.at(thresholds, groups[counted], volumes[matched][counted])
+    thresholds[np.isinf(thresholds)] = np.nan
+
+    shape = (n_sessions, n_freq)
+    return thresholds.reshape(shape), reliabilities.reshape(shape), totals.reshape(shape)
+
+
+def score_trials(data, frequency_set=DEFAULT_FREQUENCIES):
+    """
+    Считает пороги и достоверность по частотам из списка проб.
+    Возвращает словари {'500': ..., ...}; порог None, если частота не услышана или не тестировалась.
+    """
+    return score_trial_arrays(*trials_to_arrays(data), frequency_set=frequency_set)
+
+
+def score_trial_arrays(frequencies, volumes, heard, frequency_set=DEFAULT_FREQUENCIES):
+    """score_trials() по уже полученным массивам проб одного теста"""
+    thresholds, reliabilities, _ = score_arrays(frequencies, volumes, heard, frequency_set=frequency_set)
+    thresholds_row, reliabilities_row = thresholds[0].tolist(), reliabilities[0].tolist()
+
+    keys = [str(freq) for freq in frequency_set]
+    return (
+        {key: None if math.isnan(value) else value for key, value in zip(keys, thresholds_row)},
+        dict(zip(keys, reliabilities_row)),
+    )
@@ -0,0 +1,45 @@
+"""
+Нормализация ФИО для индексного поиска.
+
+SQLite сравнивает без учёта регистра только ASCII, поэтому icontains не находит
+«иванов» в «Иванов» и всегда сканирует всю таблицу. Вместо этого храним
+нормализованные копии имён (NFKC + casefold, «ё» -> «е») и ищем по префиксу
+диапазонным условием, которое использует B-tree индекс.
+"""
+import datetime
+import hashlib
+import unicodedata
+
+from django.utils.dateparse import parse_date
+
+
+def normalize_name(value):
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKC', value).casefold().replace('ё', 'е')
+    return ' '.join(value.split())
+
+
+def prefix_range(prefix):
+    """
+    Границы [lower, upper) для строк, начинающихся с prefix.
+    Условие col >= lower AND col < upper эквивалентно LIKE 'prefix%', но индексируемо.
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def patient_identity_key(last_name, first_name, middle_name, gender, birth_date):
+    """
+    Ключ пациента: SHA-256 от нормализованных фамилии, имени, отчества, пола и даты рождения (ISO).
+    Однофамильцы с той же датой рождения, но другим отчеством или полом — разные пациенты.
+    Дата может прийти строкой из тела запроса ('1990-5-1') или датой из БД.
+    """
+    if isinstance(birth_date, str):
+        birth_date = parse_date(birth_date) or birth_date
+    if isinstance(birth_date, datetime.date):
+        birth_date = birth_date.isoformat()
+    identity = '\x1f'.join((
+        normalize_name(last_name), normalize_name(first_name), normalize_name(middle_name),
+        (gender or '').strip().upper(), str(birth_date),
+    ))
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()
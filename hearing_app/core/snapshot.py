@@ -0,0 +1,226 @@
+"""
+Колоночный снимок порогов для когортной аналитики.
+
+Каждый столбец (пороги, достоверности, id, дата теста, дата рождения, пол) хранится
+отдельным файлом .npy и читается через np.memmap, поэтому запрос вроде «средний порог
+на 4 кГц у мужчин 50–60 лет за последний год» — это векторная маска и редукция по
+нескольким столбцам без ORM и без обращения к рабочей БД.
+
+Снимок дополняется инкрементально (sync_snapshot: только id больше последнего
+загруженного), командой manage.py sync_threshold_snapshot. Файлы выделяются с запасом
+и растут удвоением; число действительных строк хранится в meta.json, который
+заменяется атомарно после записи столбцов, поэтому читатели никогда не видят
+недописанных строк. Результаты неизменны, так что правки задним числом не отслеживаются.
+"""
+import datetime
+import json
+import os
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import HearingTestResult
+
+SNAPSHOT_FREQUENCIES = (500, 1000, 2000, 4000, 8000)
+GENDER_CODES = {'M': 1, 'F': 2}
+INITIAL_CAPACITY = 1024
+SYNC_CHUNK_SIZE = 50000
+EPOCH = datetime.date(1970, 1, 1)
+
+# Столбец -> dtype; даты — секунды (тест) и дни (рождение) от 1970-01-01, пол — GENDER_CODES (0 — не указан)
+COLUMNS = {
+    'id': 'int64',
+    'test_date': 'int64',
+    'birth_date': 'int32',
+    'gender': 'uint8',
+    **{f'threshold_{frequency}': 'float64' for frequency in SNAPSHOT_FREQUENCIES},
+    **{f'reliability_{frequency}': 'float64' for frequency in SNAPSHOT_FREQUENCIES},
+}
+DB_FIELDS = (
+    'id', 'test_date', 'patient__birth_date', 'patient__gender',
+    *(name for name in COLUMNS if name.startswith(('threshold_', 'reliability_'))),
+)
+
+
+def snapshot_dir(directory=None):
+    return Path(directory or settings.THRESHOLD_SNAPSHOT_DIR)
+
+
+def read_meta(directory=None):
+    try:
+        return json.loads((snapshot_dir(directory) / 'meta.json').read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return {'count': 0, 'capacity': 0, 'last_id': 0}
+
+
+def _write_meta(directory, meta):
+    path = directory / 'meta.json'
+    tmp_path = directory / 'meta.json.tmp'
+    tmp_path.write_text(json.dumps(meta), encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+def _reserve(directory, meta, needed):
+    """Гарантирует ёмкость столбцов не меньше needed; при росте файл переписывается с удвоением"""
+    from numpy.lib.format import open_memmap
+
+    capacity = meta['capacity']
+    if needed <= capacity:
+        return
+    new_capacity = max(INITIAL_CAPACITY, capacity)
+    while new_capacity < needed:
+        new_capacity *= 2
+    for name, dtype in COLUMNS.items():
+        path = directory / f'{name}.npy'
+        tmp_path = directory / f'{name}.npy.tmp'
+        grown = open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(new_capacity,))
+        if capacity:
+            grown[:meta['count']] = open_memmap(path, mode='r')[:meta['count']]
+        grown.flush()
+        del grown
+        os.replace(tmp_path, path)
+    meta['capacity'] = new_capacity
+    _write_meta(directory, meta)
+
+
+def _rows_to_columns(rows):
+    import numpy as np
+
+    values = list(zip(*rows))
+    columns = {
+        'id': np.array(values[0], dtype='int64'),
+        'test_date': np.array([int(moment.timestamp()) for moment in values[1]], dtype='int64'),
+        'birth_date': np.array([(birth_date - EPOCH).days for birth_date in values[2]], dtype='int32'),
+        'gender': np.array([GENDER_CODES.get(gender, 0) for gender in values[3]], dtype='uint8'),
+    }
+    for name, column in zip(DB_FIELDS[4:], values[4:]):
+        columns[name] = np.array(column, dtype='float64')
+    return columns
+
+
+def append_columns(columns, directory=None):
+    from numpy.lib.format import open_memmap
+
+    directory = snapshot_dir(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    meta = read_meta(directory)
+    size = len(columns['id'])
+    if not size:
+        return 0
+    _reserve(directory, meta, meta['count'] + size)
+
+    start = meta['count']
+    for name in COLUMNS:
+        column = open_memmap(directory / f'{name}.npy', mode='r+')
+        column[start:start + size] = columns[name]
+        column.flush()
+        del column
+    meta['count'] = start + size
+    meta['last_id'] = int(columns['id'][-1])
+    _write_meta(directory, meta)
+    return size
+
+
+def sync_snapshot(directory=None, chunk_size=SYNC_CHUNK_SIZE):
+    """Дописывает в снимок результаты с id больше последнего загруженного; возвращает число строк"""
+    appended = 0
+    last_id = read_meta(directory)['last_id']
+    while True:
+        rows = list(
+            HearingTestResult.objects.filter(id__gt=last_id).order_by('id').values_list(*DB_FIELDS)[:chunk_size]
+        )
+        if not rows:
+            return appended
+        appended += append_columns(_rows_to_columns(rows), directory)
+        last_id = rows[-1][0]
+
+
+class ThresholdSnapshot:
+    """Столбцы снимка только для чтения (np.memmap), обрезанные до числа действительных строк"""
+
+    def __init__(self, directory=None):
+        import numpy as np
+
+        directory = snapshot_dir(directory)
+        meta = read_meta(directory)
+        self.count = meta['count']
+        self.columns = {
+            name: np.load(directory / f'{name}.npy', mmap_mode='r')[:self.count] if self.count
+            else np.empty(0, dtype=dtype)
+            for name, dtype in COLUMNS.items()
+        }
+
+    def mask(self, gender=None, age_min=None, age_max=None, date_from=None, date_to=None):
+        """Булева маска строк; возраст — полных лет на дату теста, границы и даты включительно"""
+        import numpy as np
+
+        columns = self.columns
+        selected = np.ones(self.count, dtype=bool)
+        if gender is not None:
+            selected &= columns['gender'] == GENDER_CODES.get(gender, 0)
+        if age_min is not None or age_max is not None:
+            age = _full_years(columns['birth_date'], columns['test_date'] // 86400)
+            if age_min is not None:
+                selected &= age >= age_min
+            if age_max is not None:
+                selected &= age <= age_max
+        if date_from is not None:
+            selected &= columns['test_date'] >= _day_start(date_from)
+        if date_to is not None:
+            selected &= columns['test_date'] < _day_start(date_to + datetime.timedelta(days=1))
+        return selected
+
+    def stats(self, column, mask=None):
+        import numpy as np
+
+        values = self.columns[column] if mask is None else self.columns[column][mask]
+        if not len(values):
+            return {'count': 0, 'mean': None, 'std': None, 'median': None, 'p10': None, 'p90': None}
+        p10, median, p90 = np.percentile(values, [10, 50, 90]).tolist()
+        return {
+            'count': int(len(values)),
+            'mean': float(values.mean()),
+            'std': float(values.std()),
+            'median': median,
+            'p10': p10,
+            'p90': p90,
+        }
+
+
+def _full_years(birth_days, on_days):
+    """
+    Полных лет на дату по дням от 1970-01-01 — то же правило, что norms.age_band():
+    разность годов минус один, если день рождения в этом году ещё не наступил
+    """
+    import numpy as np
+
+    def year_and_day(days):
+        dates = np.asarray(days, dtype='int64').astype('datetime64[D]')
+        months = dates.astype('datetime64[M]')
+        years = months.astype('datetime64[Y]')
+        month_day = (months - years).astype('int64') * 100 + (dates - months).astype('int64')
+        return years.astype('int64'), month_day
+
+    birth_year, birth_month_day = year_and_day(birth_days)
+    year, month_day = year_and_day(on_days)
+    return year - birth_year - (month_day < birth_month_day)
+
+
+def _day_start(date):
+    return int(datetime.datetime.combine(date, datetime.time(), tzinfo=datetime.timezone.utc).timestamp())
+
+
+def cohort_stats(frequencies=SNAPSHOT_FREQUENCIES, directory=None, **filters):
+    """
+    Статистика порогов и достоверности по частотам для когорты, например
+    cohort_stats([4000], gender='M', age_min=50, age_max=60, date_from=date(2025, 10, 1)).
+    """
+    snapshot = ThresholdSnapshot(directory)
+    mask = snapshot.mask(**filters)
+    return {
+        str(frequency): {
+            'threshold': snapshot.stats(f'threshold_{frequency}', mask),
+            'reliability': snapshot.stats(f'reliability_{frequency}', mask),
+        }
+        for frequency in frequencies
+    }
@@ -0,0 +1,144 @@
+"""
+Синтез калиброванных стимулов на сервере: чистый тон, warble-тон и узкополосный шум.
+
+Громкость — в долях 0..1, как в пробах теста; перед синтезом она ограничивается
+max_db/100 и умножается на factor из активного профиля калибровки (та же формула,
+что и в AudioTester.js). Готовые WAV (16 бит, моно) хранятся целиком в LRU-кеше по
+(версия калибровки, вид, частота, громкость, длительность) и отдаются без копирования,
+так что повторный стимул в сессии не пересчитывается. При смене профиля калибровки
+меняется версия, и старые записи просто вытесняются.
+"""
+import struct
+import threading
+from collections import OrderedDict
+
+SAMPLE_RATE = 44100
+RAMP_MS = 25
+# Warble: частотная модуляция ±5% с частотой 4 Гц
+WARBLE_DEPTH = 0.05
+WARBLE_RATE = 4.0
+# Ширина полосы узкополосного шума — 1/3 октавы вокруг центральной частоты
+NOISE_BANDWIDTH_OCTAVES = 1 / 3
+
+STIMULUS_KINDS = ('tone', 'warble', 'noise')
+MIN_DURATION_MS = 50
+MAX_DURATION_MS = 5000
+
+
+class StimulusError(Exception):
+    pass
+
+
+def calibrated_amplitude(calibration, frequency, level):
+    try:
+        entry = calibration[str(frequency)]
+    except KeyError:
+        raise StimulusError(f'No calibration for {frequency} Hz')
+    return min(1.0, min(level, entry['max_db'] / 100) * entry['factor'])
+
+
+def synthesize(kind, frequency, amplitude, duration_ms, sample_rate=SAMPLE_RATE):
+    """Сигнал float64 с пиковой амплитудой amplitude и косинусными фронтами RAMP_MS"""
+    import numpy as np
+
+    n = int(sample_rate * duration_ms / 1000)
+    t = np.arange(n) / sample_rate
+    if kind == 'tone':
+        signal = np.sin(2 * np.pi * frequency * t)
+    elif kind == 'warble':
+        deviation = WARBLE_DEPTH * frequency
+        signal = np.sin(2 * np.pi * frequency * t + deviation / WARBLE_RATE * np.sin(2 * np.pi * WARBLE_RATE * t))
+    elif kind == 'noise':
+        # Белый шум, обрезанный в частотной области; зерно от частоты — один и тот же шум при каждом синтезе
+        spectrum = np.fft.rfft(np.random.default_rng(frequency).standard_normal(n))
+        bins = np.fft.rfftfreq(n, 1 / sample_rate)
+        half_band = 2 ** (NOISE_BANDWIDTH_OCTAVES / 2)
+        spectrum[(bins < frequency / half_band) | (bins > frequency * half_band)] = 0
+        signal = np.fft.irfft(spectrum, n)
+        signal /= max(np.abs(signal).max(), 1e-12)
+    else:
+        raise StimulusError(f'Unknown stimulus kind: {kind}')
+
+    ramp = min(int(sample_rate * RAMP_MS / 1000), n // 2)
+    if ramp:
+        envelope = 0.5 - 0.5 * np.cos(np.pi * np.arange(ramp) / ramp)
+        signal[:ramp] *= envelope
+        signal[n - ramp:] *= envelope[::-1]
+    return amplitude * signal
+
+
+def to_wav(signal, sample_rate=SAMPLE_RATE):
+    """PCM 16 бит, моно, с заголовком RIFF — одним буфером bytes"""
+    import numpy as np
+
+    pcm = np.clip(np.round(signal * 32767), -32768, 32767).astype('<i2').tobytes()
+    header = struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + len(pcm), b'WAVE', b'fmt ', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16, b'data', len(pcm),
+    )
+    return header + pcm
+
+
+class StimulusCache:
+    """Потокобезопасный LRU готовых WAV с ограничением по суммарному размеру"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key, factory):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                return data
+        # Синтез вне блокировки: параллельный промах по тому же ключу посчитает стимул дважды, но не заблокирует остальных
+        data = factory()
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = data
+                self.size += len(data)
+                while self.size > self.max_bytes and len(self._items) > 1:
+                    _, evicted = self._items.popitem(last=False)
+                    self.size -= len(evicted)
+            return self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_stimulus_cache():
+    global _cache
+    if _cache is None:
+        from django.conf import settings
+
+        with _cache_lock:
+            if _cache is None:
+                _cache = StimulusCache(settings.STIMULUS_CACHE_MAX_BYTES)
+    return _cache
+
+
+def stimulus_wav(profile, kind, frequency, level, duration_ms):
+    """WAV-байты стимула для профиля калибровки (берётся из кеша или синтезируется)"""
+    if kind not in STIMULUS_KINDS:
+        raise StimulusError(f'Unknown stimulus kind: {kind}')
+    if not 0 <= level <= 1:
+        raise StimulusError('Level must be between 0 and 1')
+    if not MIN_DURATION_MS <= duration_ms <= MAX_DURATION_MS:
+        raise StimulusError(f'Duration must be between {MIN_DURATION_MS} and {MAX_DURATION_MS} ms')
+    # Громкость округляется до сотых, чтобы число различных стимулов (и ключей кеша) было конечным
+    level = round(level, 2)
+    amplitude = calibrated_amplitude(profile.data, frequency, level)
+
+    key = (profile.content_hash, kind, frequency, level, duration_ms)
+    return get_stimulus_cache().get_or_create(
+        key, lambda: to_wav(synthesize(kind, frequency, amplitude, duration_ms))
+    )
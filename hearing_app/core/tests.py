@@ -1,3 +1,1377 @@
-from django.test import TestCase
+import csv
+import datetime
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import wave
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlencode, urlsplit
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db.models import Avg
+from django.utils import timezone
+
+from . import audiometry
+from .benchmarking import (
+    client_load, import_times, make_payload, make_trials, populate_results, reference_list_json, reference_ndjson,
+)
+from .caching import cache_stats
+from .calibration import CALIBRATION_VALUES, calibration_hash
+from .diagnosis import DIAGNOSES, NORM_THRESHOLDS, diagnosis_levels, generate_diagnosis, rules_version
+from .export import EXPORT_FIELDS, EXPORT_FORMATS, iter_ndjson
+from .fastjson import paginated_json
+from .inference import MODEL_FEATURES, ModelNotAvailable, ModelService
+from .instrumentation import stage
+from .models import PATIENT_RESULT_FIELDS, CalibrationProfile, HearingTestResult, Patient, PopulationNorm, RawTrials
+from .norms import AGE_BANDS, NORM_BINS, age_band
+from .scoring import DEFAULT_FREQUENCIES, score_arrays, score_trials, trials_to_arrays
+from .search import normalize_name, prefix_range
+from .snapshot import INITIAL_CAPACITY, ThresholdSnapshot, cohort_stats, read_meta, sync_snapshot
+from .stimuli import get_stimulus_cache
+from .views import PATIENT_TESTS_LIST_ENCODER, patient_tests_rows, patient_tests_values, prepare_result
+from .training import latest_version, publish_artifact, train
+from .trials import TrialsFormatError, decode_many, decode_trials, encode_trials, rescore
+from .writer import ResultWriter
+
+# Тяжёлые научные библиотеки: должны загружаться только при первом использовании
+HEAVY_MODULES = ('numpy', 'scipy', 'sklearn', 'joblib', 'librosa', 'numba', 'statsmodels', 'soundfile', 'pandas')
+# Бюджет холодного старта приложения (django.setup() + URLconf), мс
+COLD_START_BUDGET_MS = 1500
+APP_STARTUP = 'import django; django.setup(); import hearing_app.urls'
+
+
+class CacheIsolatedTestCase(TestCase):
+    """Кеш Django (калибровка, ответы, динамика) переживает откат БД между тестами, поэтому сбрасывается"""
+
+    @classmethod
+    def setUpClass(cls):
+        cache.clear()
+        super().setUpClass()
+
+    def setUp(self):
+        cache.clear()
+
+
+class BatchIngestTests(CacheIsolatedTestCase):
+    url = '/api/save-results/batch/'
+
+    def post(self, items):
+        return self.client.post(self.url, {'results': items}, content_type='application/json')
+
+    def test_invalid_items_are_reported_without_failing_batch(self):
+        rng = random.Random(0)
+        valid = make_payload(rng)
+        bad_date = make_payload(rng)
+        bad_date['patient']['birthDate'] = 'не дата'
+        missing_frequency = make_payload(rng)
+        missing_frequency['data'] = [trial for trial in missing_frequency['data'] if trial['frequency'] != 8000]
+
+        body = self.post([valid, 'строка', bad_date, missing_frequency]).json()
+        self.assertEqual((body['saved'], body['failed']), (1, 3))
+        self.assertEqual([outcome['status'] for outcome in body['results']], ['success', 'error', 'error', 'error'])
+        self.assertIn('birth_date', body['results'][2]['message'])
+        self.assertIn('threshold_8000', body['results'][3]['message'])
+        self.assertEqual(list(HearingTestResult.objects.values_list('id', flat=True)), [body['results'][0]['test_id']])
+
+    def test_batch_is_written_in_one_transaction(self):
+        with mock.patch('core.views.record_results', side_effect=RuntimeError('norms unavailable')):
+            response = self.post([make_payload(random.Random(seed)) for seed in range(3)])
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(HearingTestResult.objects.exists())
+        self.assertFalse(Patient.objects.exists())
+        self.assertFalse(RawTrials.objects.exists())
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        payload = make_payload(random.Random(0))
+        self.post([payload])
+        queries = []
+        for size in (5, 50):
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.post([payload] * size).json()['saved'], size)
+            queries.append(len(captured))
+        # Точка сохранения, пациенты, результаты, пробы, чтение и обновление норм
+        self.assertEqual(queries, [7, 7])
+        self.assertEqual(HearingTestResult.objects.count(), 56)
+        self.assertEqual(Patient.objects.count(), 1)
+        self.assertEqual(
+            PopulationNorm.objects.filter(frequency=1000).values_list('count', flat=True).get(), 56
+        )
+
+
+def reference_scores(data):
+    """Прежний подсчёт в save_results: отдельный проход по списку проб для каждой частоты"""
+    thresholds, reliabilities = {}, {}
+    for freq in [500, 1000, 2000, 4000, 8000]:
+        freq_results = [r for r in data if r.get('frequency') == freq]
+        if not freq_results:
+            thresholds[str(freq)], reliabilities[str(freq)] = None, 0
+            continue
+        reliabilities[str(freq)] = sum(1 for r in freq_results if r['heard']) / len(freq_results)
+        heard_volumes = [
+            r['volume'] for r in freq_results if r.get('heard', False) and isinstance(r.get('volume'), (int, float))
+        ]
+        thresholds[str(freq)] = min(heard_volumes) if heard_volumes else None
+    return thresholds, reliabilities
+
+
+class ScoringTests(SimpleTestCase):
+    def random_trials(self, rng):
+        """Пробы фронтенда вперемешку с пропущенными частотами и нестандартными значениями"""
+        frequencies = rng.sample([500, 1000, 2000, 4000, 8000], rng.randint(0, 5))
+        trials = make_trials(rng, frequencies)
+        for _ in range(rng.randint(0, 4)):
+            trials.append({
+                'frequency': rng.choice([1000, 1000.0, '1000', 750, None]),
+                'volume': rng.choice([0.05, 1, None, 'громко']),
+                'heard': rng.choice([True, False, 0, 1]),
+            })
+        rng.shuffle(trials)
+        return trials
+
+    def test_matches_per_frequency_loop(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            trials = self.random_trials(rng)
+            with self.subTest(trials=trials):
+                self.assertEqual(score_trials(trials), reference_scores(trials))
+
+    def test_empty_test(self):
+        thresholds, reliabilities = score_trials([])
+        self.assertEqual(thresholds, dict.fromkeys(thresholds, None))
+        self.assertEqual(reliabilities, dict.fromkeys(reliabilities, 0))
+
+    def test_sessions_match_separate_scoring(self):
+        rng = random.Random(1)
+        tests = [self.random_trials(rng) for _ in range(50)]
+        arrays = [trials_to_arrays(trials) for trials in tests]
+        sessions = [index for index, trials in enumerate(tests) for _ in trials]
+        columns = [[value for array in column for value in array.tolist()] for column in zip(*arrays)]
+        thresholds, reliabilities, _ = score_arrays(*columns, sessions=sessions, n_sessions=len(tests))
+
+        for index, trials in enumerate(tests):
+            expected_thresholds, expected_reliabilities = reference_scores(trials)
+            self.assertEqual(
+                [None if value != value else value for value in thresholds[index].tolist()],
+                list(expected_thresholds.values()),
+            )
+            self.assertEqual(reliabilities[index].tolist(), list(expected_reliabilities.values()))
+
+
+class PatientSearchTests(CacheIsolatedTestCase):
+    names = ['Иванов', 'ИВАНОВА', 'иваненко', 'Ивушкин', 'Игорев', 'Ёлкин', 'Елкина', 'Ivanov']
+
+    @classmethod
+    def setUpTestData(cls):
+        for index, last_name in enumerate(cls.names):
+            Patient.objects.create(last_name=last_name, first_name='Анна', gender='F',
+                                   birth_date=datetime.date(1980, 1, 1 + index))
+
+    def search(self, last_name='', first_name=''):
+        return sorted(Patient.objects.search(last_name, first_name).values_list('last_name', flat=True))
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name('  ЁЛКИНА   Анна '), 'елкина анна')
+        self.assertEqual(normalize_name('ＩＶＡＮＯＶ'), 'ivanov')
+        self.assertEqual(normalize_name(None), '')
+
+    def test_prefix_range(self):
+        lower, upper = prefix_range('ив')
+        self.assertEqual((lower, upper), ('ив', 'иг'))
+        self.assertTrue(lower <= 'ивушкин' < upper)
+        self.assertFalse(lower <= 'игорев' < upper)
+        self.assertFalse(lower <= 'иа' < upper)
+
+    def test_cyrillic_prefix_is_case_insensitive(self):
+        self.assertEqual(self.search('иВаН'), ['ИВАНОВА', 'Иванов', 'иваненко'])
+        self.assertEqual(self.search('ив'), ['ИВАНОВА', 'Иванов', 'Ивушкин', 'иваненко'])
+        self.assertEqual(self.search('IVAN'), ['Ivanov'])
+        self.assertEqual(self.search('ивановаа'), [])
+
+    def test_yo_matches_ye(self):
+        self.assertEqual(self.search('елк'), ['Ёлкин', 'Елкина'])
+        self.assertEqual(self.search('Ёлкина'), ['Елкина'])
+
+    def test_empty_query_does_not_filter(self):
+        self.assertEqual(len(self.search()), len(self.names))
+        self.assertEqual(len(self.search('  ', '')), len(self.names))
+        self.assertEqual(self.search('иванов', 'ан'), ['ИВАНОВА', 'Иванов'])
+        self.assertEqual(self.search('иванов', 'мария'), [])
+
+    def test_search_uses_index(self):
+        self.assertIn('core_patient_search_idx', Patient.objects.search('иван').explain())
+
+    def test_endpoint(self):
+        payload = make_payload(random.Random(0))
+        payload['patient'].update(lastName='Ёжикова', firstName='Анна')
+        self.client.post('/api/save-results/', payload, content_type='application/json')
+        rows = self.client.get('/api/patient-tests/', {'last_name': 'ЕЖИК', 'first_name': 'ан'}).json()['results']
+        self.assertEqual([row['patient_last_name'] for row in rows], ['Ёжикова'])
+
+
+class CalibrationProfileTests(CacheIsolatedTestCase):
+    def test_profiles_are_deduplicated_by_content(self):
+        data = {'1000': {'factor': 1.0, 'max_db': 110}, '500': {'factor': 0.9, 'max_db': 100}}
+        first = CalibrationProfile.objects.get_or_create_for(data)
+        same = CalibrationProfile.objects.get_or_create_for(dict(reversed(list(data.items()))))
+        self.assertEqual(first.pk, same.pk)
+        self.assertEqual(first.content_hash, calibration_hash(data))
+        other = CalibrationProfile.objects.get_or_create_for({**data, '500': {'factor': 0.95, 'max_db': 100}})
+        self.assertNotEqual(other.pk, first.pk)
+
+    def test_results_share_the_active_profile(self):
+        rng = random.Random(0)
+        for _ in range(3):
+            self.client.post('/api/save-results/', make_payload(rng), content_type='application/json')
+        self.assertEqual(CalibrationProfile.objects.count(), 1)
+        self.assertEqual(
+            set(HearingTestResult.objects.values_list('calibration_profile', flat=True)),
+            {CalibrationProfile.objects.active().pk},
+        )
+
+    def test_activate_switches_single_active_profile(self):
+        default = CalibrationProfile.objects.active()
+        self.assertEqual(default.data, CALIBRATION_VALUES)
+        data = {**CALIBRATION_VALUES, '1000': {'factor': 1.0, 'max_db': 115}}
+        profile = CalibrationProfile.objects.activate(data)
+        self.assertEqual(list(CalibrationProfile.objects.filter(is_active=True)), [profile])
+        self.assertEqual(CalibrationProfile.objects.active(), profile)
+        # Повторная активация прежних значений не создаёт новый профиль
+        self.assertEqual(CalibrationProfile.objects.activate(CALIBRATION_VALUES).pk, default.pk)
+        self.assertEqual(CalibrationProfile.objects.count(), 2)
+
+    def test_etag_follows_active_profile(self):
+        for url in ('/api/calibration/', '/api/async/calibration/'):
+            with self.subTest(url=url):
+                cache.clear()
+                first = self.client.get(url)
+                self.assertEqual(first['ETag'], f'"{CalibrationProfile.objects.active().content_hash}"')
+                self.assertEqual(first.json()['calibration'], CALIBRATION_VALUES)
+                not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual((not_modified.status_code, not_modified.content), (304, b''))
+
+                updated = {**CALIBRATION_VALUES, '8000': {'factor': 1, 'max_db': 100}}
+                profile = CalibrationProfile.objects.activate(updated)
+                changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual(changed.status_code, 200)
+                self.assertEqual(changed['ETag'], f'"{profile.content_hash}"')
+                CalibrationProfile.objects.activate(CALIBRATION_VALUES)
+
+
+class ExportTests(CacheIsolatedTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        cls.ids = []
+        for day in (1, 2, 3):
+            test_id = cls.client_class().post('/api/save-results/', make_payload(rng),
+                                              content_type='application/json').json()['test_id']
+            HearingTestResult.objects.filter(id=test_id).update(
+                test_date=datetime.datetime(2026, 3, day, 23, 30, tzinfo=datetime.timezone.utc)
+            )
+            cls.ids.append(test_id)
+
+    def export(self, **params):
+        response = self.client.get('/api/export/', params)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv(self):
+        response, text = self.export(fields='id,patient_last_name,test_date,threshold_1000')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('hearing_results.csv', response['Content-Disposition'])
+        rows = list(csv.reader(StringIO(text)))
+        self.assertEqual(rows[0], ['id', 'patient_last_name', 'test_date', 'threshold_1000'])
+        test = HearingTestResult.objects.select_related('patient').get(id=self.ids[0])
+        self.assertEqual(rows[1], [str(test.id), test.patient.last_name, '2026-03-01T23:30:00Z',
+                                   repr(test.threshold_1000)])
+        self.assertEqual(len(rows), 4)
+
+    def test_ndjson(self):
+        response, text = self.export(export_format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in text.splitlines()]
+        self.assertEqual([row['id'] for row in rows], self.ids)
+        self.assertEqual(list(rows[0]), EXPORT_FIELDS)
+
+    def test_date_filters_are_inclusive(self):
+        _, text = self.export(export_format='ndjson', fields='id', date_from='2026-03-02', date_to='2026-03-03')
+        self.assertEqual([json.loads(line)['id'] for line in text.splitlines()], self.ids[1:])
+        _, text = self.export(export_format='ndjson', fields='id', date_to='2026-03-01')
+        self.assertEqual([json.loads(line)['id'] for line in text.splitlines()], self.ids[:1])
+
+    def test_invalid_parameters(self):
+        for params in ({'fields': 'id,password'}, {'date_from': '01.03.2026'}, {'export_format': 'xlsx'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/export/', params).status_code, 400)
+
+    def test_output_is_streamed_in_chunks(self):
+        with mock.patch('core.export.EXPORT_CHUNK_SIZE', 1):
+            for fmt in EXPORT_FORMATS:
+                with self.subTest(fmt=fmt):
+                    response = self.client.get('/api/export/', {'export_format': fmt})
+                    chunks = list(response.streaming_content)
+                    # CSV: заголовок + строка на фрагмент; NDJSON: строка на фрагмент
+                    self.assertEqual(len(chunks), len(self.ids) + (fmt == 'csv'))
+
+    def test_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'export.csv'
+            call_command('export_results', fields='id', date_from='2026-03-03', output=str(path))
+            self.assertEqual(path.read_text(encoding='utf-8').split(), ['id', str(self.ids[2])])
+        with self.assertRaises(CommandError):
+            call_command('export_results', fields='unknown')
+
+
+class AsyncViewTests(CacheIsolatedTestCase):
+    """ASGI-версии endpoint'ов отвечают так же, как синхронные api/..."""
+
+    async def apost(self, url, payload):
+        return await self.async_client.post(url, payload, content_type='application/json')
+
+    async def test_save_results_matches_sync(self):
+        payload = make_payload(random.Random(0))
+        expected = (await sync_to_async(self.client.post)('/api/save-results/', payload,
+                                                          content_type='application/json')).json()
+        body = (await self.apost('/api/async/save-results/', payload)).json()
+        self.assertEqual(body.keys(), expected.keys())
+        self.assertEqual({**body, 'test_id': None}, {**expected, 'test_id': None})
+
+        test = await HearingTestResult.objects.select_related('patient').aget(id=body['test_id'])
+        self.assertEqual(test.patient_id, (await HearingTestResult.objects.aget(id=expected['test_id'])).patient_id)
+        self.assertTrue(await RawTrials.objects.filter(result_id=body['test_id']).aexists())
+
+    async def test_get_test_results_matches_sync_and_is_cached(self):
+        test_id = (await self.apost('/api/async/save-results/', make_payload(random.Random(0)))).json()['test_id']
+        expected = await sync_to_async(self.client.get)(f'/api/results/{test_id}/')
+        first = await self.async_client.get(f'/api/async/results/{test_id}/')
+        self.assertEqual(first.content, expected.content)
+        self.assertEqual(first['ETag'], expected['ETag'])
+
+        second = await self.async_client.get(f'/api/async/results/{test_id}/')
+        self.assertEqual(second.content, expected.content)
+        self.assertEqual((await sync_to_async(cache_stats)())['results'], {'hits': 2, 'misses': 1})
+
+    async def test_missing_result(self):
+        response = await self.async_client.get('/api/async/results/999999/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['status'], 'error')
+
+    async def test_patient_tests_matches_sync(self):
+        rng = random.Random(0)
+        for _ in range(3):
+            await self.apost('/api/async/save-results/', make_payload(rng))
+        params = {'limit': 2}
+        expected = (await sync_to_async(self.client.get)('/api/patient-tests/', params)).json()
+        body = (await self.async_client.get('/api/async/patient-tests/', params)).json()
+        self.assertEqual(body['results'], expected['results'])
+        self.assertIn('/api/async/patient-tests/', body['next'])
+
+        cursor = parse_qs(urlsplit(body['next']).query)['cursor'][0]
+        rest = (await self.async_client.get('/api/async/patient-tests/', {**params, 'cursor': cursor})).json()
+        self.assertEqual(len(rest['results']), 1)
+        self.assertIsNone(rest['next'])
+
+    async def test_invalid_cursor(self):
+        response = await self.async_client.get('/api/async/patient-tests/', {'cursor': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SarimaBatchTests(SimpleTestCase):
+    """Пакетное обучение SARIMA: дисковый кеш и тёплый старт"""
+    order = (1, 0, 0)
+    seasonal_order = (0, 0, 0, 0)
+
+    def setUp(self):
+        import numpy as np
+
+        rng = np.random.default_rng(0)
+        base = np.sin(np.arange(60) / 3)
+        # Два похожих ряда и один заметно отличающийся
+        self.signals = [base + rng.normal(0, 0.05, 60), base + rng.normal(0, 0.05, 60), rng.normal(0, 3, 60)]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_dir = Path(directory.name)
+
+    def fit(self, signals=None, **kwargs):
+        from ml.sarima_model import fit_sarima_batch
+
+        kwargs.setdefault('cache_dir', self.cache_dir)
+        return fit_sarima_batch(self.signals if signals is None else signals, self.order, self.seasonal_order,
+                                n_jobs=1, **kwargs)
+
+    def train_sarima(self):
+        from ml.sarima_model import train_sarima
+
+        return train_sarima
+
+    def test_cache_miss_then_hit(self):
+        from ml.sarima_model import signal_key
+
+        first = self.fit()
+        keys = [signal_key(signal, self.order, self.seasonal_order) for signal in self.signals]
+        self.assertEqual([fit.key for fit in first], keys)
+        self.assertEqual({path.stem for path in self.cache_dir.glob('*.npz')}, set(keys))
+
+        with mock.patch('ml.sarima_model.train_sarima', side_effect=AssertionError('cache miss')):
+            second = self.fit()
+        for cached, fitted in zip(second, first):
+            self.assertEqual(cached.key, fitted.key)
+            self.assertTrue((cached.params == fitted.params).all())
+            self.assertEqual((cached.aic, cached.bic, cached.llf), (fitted.aic, fitted.bic, fitted.llf))
+
+    def test_only_new_signals_are_fitted(self):
+        self.fit(self.signals[:1])
+        with mock.patch('ml.sarima_model.train_sarima', wraps=self.train_sarima()) as train:
+            fits = self.fit()
+        self.assertEqual(train.call_count, 2)
+        self.assertEqual(len(fits), 3)
+
+    def test_cache_can_be_disabled(self):
+        self.fit(cache_dir=None)
+        self.assertEqual(list(self.cache_dir.iterdir()), [])
+
+    def test_corrupted_cache_entry_is_refitted(self):
+        from ml.sarima_model import signal_key
+
+        key = signal_key(self.signals[0], self.order, self.seasonal_order)
+        (self.cache_dir / f'{key}.npz').write_bytes(b'not a npz')
+        fit = self.fit(self.signals[:1])[0]
+        self.assertEqual(fit.key, key)
+        self.assertEqual(len(fit.params), 2)
+
+    def test_warm_start_between_similar_signals(self):
+        import numpy as np
+
+        with mock.patch('ml.sarima_model.train_sarima', wraps=self.train_sarima()) as train:
+            fits = self.fit()
+        starts = {id(call.args[0]): call.kwargs['start_params'] for call in train.call_args_list}
+        self.assertEqual(len(starts), 3)
+        # Непохожий ряд стартует с нуля, из похожей пары второй — с параметров первого
+        self.assertEqual(sum(start is None for start in starts.values()), 2)
+        warm = next(start for start in starts.values() if start is not None)
+        self.assertTrue(any(np.array_equal(warm, fit.params) for fit in fits[:2]))
+
+        self.cache_dir = None
+        with mock.patch('ml.sarima_model.train_sarima', wraps=self.train_sarima()) as train:
+            cold = self.fit(warm_start=False)
+        self.assertTrue(all(call.kwargs['start_params'] is None for call in train.call_args_list))
+        for warm_fit, cold_fit in zip(fits, cold):
+            self.assertAlmostEqual(warm_fit.llf, cold_fit.llf, places=2)
+
+
+class FeatureExtractionTests(SimpleTestCase):
+    """Потоковое извлечение признаков из WAV (ml/features.py)"""
+    sample_rate = 22050
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write_wav(self, name, frequency=1000, seconds=2.0, amplitude=0.5, channels=1):
+        import numpy as np
+
+        t = np.arange(int(self.sample_rate * seconds)) / self.sample_rate
+        samples = np.round(amplitude * np.sin(2 * np.pi * frequency * t) * 32767).astype('<i2')
+        path = self.directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with wave.open(str(path), 'wb') as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(np.repeat(samples, channels).tobytes())
+        return path
+
+    def test_sine_features(self):
+        from ml.features import FEATURE_NAMES, HOP_LENGTH, N_FFT, extract_features, feature_vector
+
+        features = extract_features(self.write_wav('tone.wav'))
+        self.assertEqual(features['sample_rate'], self.sample_rate)
+        self.assertAlmostEqual(features['duration'], 2.0)
+        self.assertEqual(features['frames'], (2 * self.sample_rate - N_FFT) // HOP_LENGTH + 1)
+        self.assertAlmostEqual(features['max_freq'], 1000, delta=self.sample_rate / N_FFT)
+        self.assertAlmostEqual(features['rms'], 0.5 / 2 ** 0.5, places=3)
+        self.assertEqual(len(features['mfcc']), 13)
+        self.assertEqual(feature_vector(features), [features[name] for name in FEATURE_NAMES])
+
+    def test_blocks_match_whole_file(self):
+        from ml.features import extract_features
+
+        path = self.write_wav('tone.wav', frequency=440)
+        whole = extract_features(path, frames_per_block=10 ** 6)
+        streamed = extract_features(path, frames_per_block=3)
+        self.assertEqual(streamed['frames'], whole['frames'])
+        self.assertEqual(streamed['max_freq'], whole['max_freq'])
+        self.assertAlmostEqual(streamed['rms'], whole['rms'], places=6)
+        for streamed_value, whole_value in zip(streamed['mfcc'], whole['mfcc']):
+            self.assertAlmostEqual(streamed_value, whole_value, places=3)
+
+    def test_stereo_is_mixed_to_mono(self):
+        from ml.features import extract_features
+
+        mono = extract_features(self.write_wav('mono.wav'))
+        stereo = extract_features(self.write_wav('stereo.wav', channels=2))
+        self.assertEqual(stereo['max_freq'], mono['max_freq'])
+        self.assertAlmostEqual(stereo['rms'], mono['rms'], places=6)
+
+    def test_recording_shorter_than_frame(self):
+        from ml.features import extract_features
+
+        features = extract_features(self.write_wav('click.wav', seconds=0.05))
+        self.assertEqual(features['frames'], 0)
+        self.assertEqual((features['max_freq'], features['mfcc_mean']), (0.0, 0.0))
+        self.assertGreater(features['rms'], 0)
+
+    def test_extract_directory(self):
+        from ml.features import extract_directory
+
+        low = self.write_wav('a/low.wav', frequency=500)
+        high = self.write_wav('b/high.wav', frequency=2000)
+        broken = self.directory / 'broken.wav'
+        broken.write_bytes(b'RIFF')
+        (self.directory / 'notes.txt').write_text('не запись')
+
+        features = extract_directory(self.directory, n_jobs=1)
+        self.assertEqual(list(features), [str(low), str(high), str(broken)])
+        self.assertIn('error', features[str(broken)])
+        self.assertLess(features[str(low)]['max_freq'], features[str(high)]['max_freq'])
+        self.assertEqual(extract_directory(self.directory / 'a'), {str(low): features[str(low)]})
+
+
+class ModelServiceTests(SimpleTestCase):
+    """Загрузка и горячая замена модели в core/inference.py"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'hearing_model.pkl'
+        self.service = ModelService(self.path, check_interval=0)
+
+    def write_model(self, classes=('Норма', 'Патология'), feature_names=None, mtime_ns=None):
+        import joblib
+        import numpy as np
+        from sklearn.tree import DecisionTreeClassifier
+
+        width = len(feature_names or MODEL_FEATURES)
+        matrix = np.vstack([np.zeros((2, width)), np.ones((2, width))])
+        model = DecisionTreeClassifier().fit(matrix, [classes[0]] * 2 + [classes[-1]] * 2)
+        joblib.dump(model, self.path)
+        if feature_names is not None:
+            self.path.with_suffix('.json').write_text(json.dumps({'feature_names': feature_names}), encoding='utf-8')
+        if mtime_ns is not None:
+            os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_missing_model(self):
+        with self.assertRaises(ModelNotAvailable):
+            self.service.get()
+
+    def test_default_and_sidecar_feature_names(self):
+        self.write_model()
+        self.assertEqual(self.service.feature_names, MODEL_FEATURES)
+
+        other = ModelService(self.path)
+        self.write_model(feature_names=['threshold_1000', 'reliability_1000'])
+        self.assertEqual(other.feature_names, ('threshold_1000', 'reliability_1000'))
+
+        self.path.with_suffix('.json').write_text('{"version": 1}', encoding='utf-8')
+        self.assertEqual(ModelService(self.path).feature_names, MODEL_FEATURES)
+        self.path.with_suffix('.json').write_text('не json', encoding='utf-8')
+        self.assertEqual(ModelService(self.path).feature_names, MODEL_FEATURES)
+
+    def test_reloads_only_when_signature_changes(self):
+        import joblib
+
+        self.write_model(mtime_ns=10 ** 18)
+        with mock.patch('joblib.load', wraps=joblib.load) as load:
+            _, _, version = self.service.get()
+            self.service.get()
+            self.assertEqual(load.call_count, 1)
+
+            self.write_model(('Норма', 'Тугоухость'), feature_names=['a', 'b'], mtime_ns=10 ** 18 + 1)
+            model, feature_names, new_version = self.service.get()
+            self.assertEqual(load.call_count, 2)
+        self.assertNotEqual(new_version, version)
+        self.assertEqual(model.classes_.tolist(), ['Норма', 'Тугоухость'])
+        self.assertEqual(feature_names, ('a', 'b'))
+
+    def test_check_interval_delays_reload(self):
+        self.write_model(mtime_ns=10 ** 18)
+        service = ModelService(self.path, check_interval=3600)
+        version = service.get()[2]
+        self.write_model(mtime_ns=10 ** 18 + 1)
+        self.assertEqual(service.get()[2], version)
+
+    def test_keeps_serving_while_file_is_replaced(self):
+        self.write_model()
+        model, _, version = self.service.get()
+        self.path.unlink()
+        self.assertEqual(self.service.get(), (model, MODEL_FEATURES, version))
+
+    def test_predict_view_uses_sidecar_feature_names(self):
+        self.write_model(feature_names=['threshold_1000', 'reliability_1000'])
+        with mock.patch('core.inference.get_model_service', return_value=self.service):
+            body = self.client.post('/api/predict/', {'features': [
+                {'threshold_1000': 1, 'reliability_1000': 1}, [0, 0],
+            ]}, content_type='application/json').json()
+            invalid = self.client.post('/api/predict/', {'features': [[0, 0, 0]]}, content_type='application/json')
+        self.assertEqual(body['predictions'], ['Патология', 'Норма'])
+        self.assertEqual(body['model_version'], self.service.get()[2])
+        self.assertEqual(invalid.status_code, 400)
+        self.assertIn('threshold_1000, reliability_1000', invalid.json()['message'])
+
+
+class TrainingTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+
+    def train(self, **options):
+        return train(directory=self.directory, n_estimators=10, increment_estimators=5, n_jobs=1, **options)
+
+    def test_incremental_training_adds_trees_for_new_rows(self):
+        populate_results(200, random.Random(0))
+        _, first = self.train()
+        self.assertEqual((first['version'], first['mode'], first['n_estimators']), (1, 'full', 10))
+        self.assertEqual(first['label_source'], 'rule_based_diagnosis')
+        self.assertIn('accuracy', first['rule_agreement'])
+
+        populate_results(100, random.Random(1))
+        path, second = self.train(incremental=True)
+        self.assertEqual(path.name, 'hearing_model_v0002.pkl')
+        self.assertEqual((second['mode'], second['parent_version'], second['n_estimators']), ('incremental', 1, 15))
+        self.assertEqual(second['rows_in_run'], 100)
+        self.assertEqual(second['rows_trained'], first['rows_trained'] + 100)
+        self.assertEqual(second['last_pk'], HearingTestResult.objects.latest('pk').pk)
+        self.assertEqual(latest_version(self.directory)['version'], 2)
+
+        self.assertEqual(self.train(incremental=True), (None, second))
+
+    def test_publish_replaces_model_and_metadata(self):
+        populate_results(100, random.Random(0))
+        _, metadata = self.train()
+        target = self.directory / 'published' / 'hearing_model.pkl'
+        target.parent.mkdir()
+        publish_artifact(metadata, self.directory, target)
+        self.assertEqual(target.read_bytes(), (self.directory / 'hearing_model_v0001.pkl').read_bytes())
+        self.assertEqual(json.loads(target.with_suffix('.json').read_text(encoding='utf-8'))['version'], 1)
+
+
+class ImportTimeTests(SimpleTestCase):
+    """Регрессии времени старта воркеров и manage.py (python -X importtime)"""
+
+    def assert_not_imported(self, times, modules=HEAVY_MODULES):
+        loaded = sorted(name for name in times if name.split('.')[0] in modules)
+        self.assertEqual(loaded, [], f'Heavy modules imported at startup: {", ".join(loaded[:10])}')
+
+    def test_app_startup_does_not_import_heavy_dependencies(self):
+        times, _ = import_times(APP_STARTUP)
+        self.assert_not_imported(times)
+
+    def test_app_startup_time_budget(self):
+        _, total = import_times(APP_STARTUP)
+        self.assertLess(total, COLD_START_BUDGET_MS)
+
+    def test_ml_modules_load_heavy_dependencies_lazily(self):
+        times, _ = import_times(
+            'import django; django.setup(); import ml.features, ml.sarima_model, core.training, core.inference'
+        )
+        self.assert_not_imported(times, ('scipy', 'sklearn', 'librosa', 'numba', 'statsmodels'))
+
+
+# Число SQL-запросов на endpoint не зависит от размера таблицы; рост — регрессия (N+1, лишние SELECT).
+# save_results: калибровка, поиск (и вставка нового) пациента, вставка результата и сырых проб,
+# чтение и обновление норм (первый результат группы создаёт её строки) и точки сохранения транзакций
+QUERY_BUDGETS = {'save_results': 11, 'get_test_results': 1, 'get_patient_tests': 1}
+
+
+class EndpointQueryCountTests(CacheIsolatedTestCase):
+    """Быстрая версия manage.py benchmark_api: только число запросов через django.test.Client"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rng = random.Random(0)
+        populate_results(200, cls.rng)
+
+    def measure(self, name):
+        samples = list(HearingTestResult.objects.values_list('id', 'patient__last_name', 'patient__first_name')[:20])
+        scenarios = {
+            'save_results': ('POST', ['/api/save-results/'], [json.dumps(make_payload(self.rng))]),
+            'get_test_results': ('GET', [f'/api/results/{pk}/' for pk, _, _ in samples], None),
+            'get_patient_tests': ('GET', [
+                '/api/patient-tests/?' + urlencode({'last_name': last_name, 'first_name': first_name})
+                for _, last_name, first_name in samples
+            ], None),
+        }
+        method, paths, bodies = scenarios[name]
+        return client_load(self.client, paths, 20, method, bodies)
+
+    def test_query_budgets(self):
+        for name, budget in QUERY_BUDGETS.items():
+            with self.subTest(endpoint=name):
+                stats = self.measure(name)
+                self.assertEqual(stats['errors'], 0)
+                self.assertLessEqual(stats['max_queries'], budget)
+
+
+class PerformanceMiddlewareTests(CacheIsolatedTestCase):
+    def save(self):
+        return self.client.post('/api/save-results/', make_payload(random.Random(0)), content_type='application/json')
+
+    def test_server_timing_reports_stages(self):
+        with self.assertLogs('core.performance', 'INFO') as logs:
+            response = self.save()
+        metrics = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        self.assertEqual(metrics[:2], ['total', 'db'])
+        self.assertLessEqual({'parse', 'scoring', 'db_write', 'render'}, set(metrics))
+
+        record = logs.records[-1].performance
+        self.assertEqual(record['path'], '/api/save-results/')
+        self.assertGreaterEqual(record['stages']['db_write']['db_queries'], 1)
+        self.assertGreaterEqual(record['db_queries'], record['stages']['db_write']['db_queries'])
+
+    def test_stage_outside_request_is_noop(self):
+        with stage('scoring'):
+            pass
+
+    def test_slow_requests_are_profiled(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            PERF_PROFILE_SAMPLE_RATE=1.0, PERF_PROFILE_THRESHOLD_MS=0, PERF_PROFILE_DIR=directory,
+        ):
+            with self.assertLogs('core.performance', 'INFO') as logs:
+                self.save()
+            profile = Path(logs.records[-1].performance['profile'])
+            self.assertTrue(profile.exists())
+            self.assertEqual(profile.parent, Path(directory))
+
+
+class AdaptiveSessionTests(CacheIsolatedTestCase):
+    def run_listener(self, threshold):
+        session = audiometry.new_session({})
+        while not audiometry.is_finished(session):
+            audiometry.respond(session, audiometry.next_stimulus(session)['volume'] >= threshold)
+        return session
+
+    def test_converges_to_listener_threshold(self):
+        for threshold in (0.05, 0.25, 0.6, 1.0):
+            with self.subTest(threshold=threshold):
+                session = self.run_listener(threshold)
+                self.assertEqual(set(session['thresholds'].values()), {threshold})
+                # Меньше, чем полный проход по шкале громкостей на каждой частоте
+                self.assertLess(len(session['trials']), len(audiometry.FREQUENCIES) * len(audiometry.LEVELS))
+
+    def test_no_response_records_maximum_level(self):
+        session = self.run_listener(2.0)
+        self.assertEqual(set(session['thresholds'].values()), {audiometry.LEVELS[-1]})
+        self.assertEqual(set(session['reliabilities'].values()), {0.0})
+
+    def test_session_api_saves_result(self):
+        patient = make_payload(random.Random(0))['patient']
+        response = self.client.post('/api/sessions/', {'patient': patient}, content_type='application/json')
+        session_id, stimulus = response.json()['session_id'], response.json()['stimulus']
+
+        stale = self.client.post(f'/api/sessions/{session_id}/responses/', {
+            'trial': stimulus['trial'] + 1, 'heard': True,
+        }, content_type='application/json')
+        self.assertEqual(stale.status_code, 409)
+
+        while True:
+            body = self.client.post(f'/api/sessions/{session_id}/responses/', {
+                'trial': stimulus['trial'], 'heard': stimulus['volume'] >= 0.3,
+            }, content_type='application/json').json()
+            if body['status'] != 'running':
+                break
+            stimulus = body['stimulus']
+
+        self.assertEqual(body['status'], 'success')
+        test = HearingTestResult.objects.get(id=body['test_id'])
+        self.assertEqual(test.threshold_1000, 0.3)
+        self.assertEqual(test.patient.last_name, patient['lastName'])
+        gone = self.client.post(f'/api/sessions/{session_id}/responses/', {'trial': 0, 'heard': True},
+                                content_type='application/json')
+        self.assertEqual(gone.status_code, 404)
+
+    def test_session_requires_standard_frequencies(self):
+        patient = make_payload(random.Random(0))['patient']
+        for frequencies in ([1000, 2000], [1000, 2000, 4000, 8000, 750], [1000, 1000, 2000, 4000, 8000, 500], []):
+            with self.subTest(frequencies=frequencies):
+                response = self.client.post('/api/sessions/', {'patient': patient, 'frequencies': frequencies},
+                                            content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+        ordered = [500, 1000, 2000, 4000, 8000]
+        response = self.client.post('/api/sessions/', {'patient': patient, 'frequencies': ordered},
+                                    content_type='application/json')
+        self.assertEqual(response.json()['stimulus']['frequency'], 500)
+
+    def test_session_rejects_invalid_patient_before_start(self):
+        patient = make_payload(random.Random(0))['patient']
+        for changes in ({'birthDate': 'not-a-date'}, {'lastName': ''}, {'gender': 'X'}, {'email': 'нет'}):
+            with self.subTest(changes=changes):
+                response = self.client.post('/api/sessions/', {'patient': {**patient, **changes}},
+                                            content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertNotIn('session_id', response.json())
+
+    def test_session_reliabilities_match_save_results(self):
+        # Слушатель иногда слышит ниже порога: доля услышанных проб меньше 1
+        rng = random.Random(0)
+        session = audiometry.new_session({})
+        while not audiometry.is_finished(session):
+            volume = audiometry.next_stimulus(session)['volume']
+            audiometry.respond(session, volume >= 0.4 or rng.random() < 0.3)
+        self.assertEqual(session['reliabilities'], score_trials(session['trials'])[1])
+        self.assertLess(min(session['reliabilities'].values()), 1.0)
+
+        patient = make_payload(random.Random(0))['patient']
+        session_id = self.client.post('/api/sessions/', {'patient': patient},
+                                      content_type='application/json').json()['session_id']
+        body = {'status': 'running', 'stimulus': {'trial': 0}}
+        while body['status'] == 'running':
+            body = self.client.post(f'/api/sessions/{session_id}/responses/', {
+                'trial': body['stimulus']['trial'], 'heard': rng.random() < 0.6,
+            }, content_type='application/json').json()
+        [(_, _, reliabilities)] = list(rescore(RawTrials.objects.filter(result_id=body['test_id'])))
+        self.assertEqual(body['reliabilities'], dict(zip(map(str, DEFAULT_FREQUENCIES), reliabilities[0].tolist())))
+
+
+class StimulusTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        get_stimulus_cache().clear()
+
+    def test_stimulus_is_valid_wav(self):
+        for kind in ('tone', 'warble', 'noise'):
+            with self.subTest(kind=kind):
+                response = self.client.get(f'/api/stimuli/{kind}/', {'frequency': 1000, 'level': 0.4, 'duration': 500})
+                self.assertEqual(response['Content-Type'], 'audio/wav')
+                with wave.open(BytesIO(response.content)) as wav:
+                    self.assertEqual((wav.getnchannels(), wav.getsampwidth(), wav.getframerate()), (1, 2, 44100))
+                    self.assertEqual(wav.getnframes(), 22050)
+
+    def test_repeated_stimulus_is_served_from_cache(self):
+        params = {'frequency': 2000, 'level': 0.5}
+        first = self.client.get('/api/stimuli/tone/', params)
+        cached_size = get_stimulus_cache().size
+        second = self.client.get('/api/stimuli/tone/', params)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(get_stimulus_cache().size, cached_size)
+        self.assertEqual(
+            self.client.get('/api/stimuli/tone/', params, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304
+        )
+
+    def test_invalid_parameters(self):
+        for kind, params in (('chirp', {'frequency': 1000, 'level': 0.4}), ('tone', {'frequency': 1234, 'level': 0.4}),
+                             ('tone', {'frequency': 1000, 'level': 2}), ('tone', {'frequency': 'x', 'level': 0.4})):
+            with self.subTest(kind=kind, params=params):
+                self.assertEqual(self.client.get(f'/api/stimuli/{kind}/', params).status_code, 400)
+
+
+class PopulationNormTests(CacheIsolatedTestCase):
+    def save(self, threshold, birth_date='1990-05-01', gender='F'):
+        patient = {'lastName': 'Иванова', 'firstName': 'Анна', 'gender': gender, 'birthDate': birth_date}
+        trials = [{'frequency': freq, 'volume': threshold, 'heard': True} for freq in (500, 1000, 2000, 4000, 8000)]
+        response = self.client.post('/api/save-results/', {'patient': patient, 'data': trials},
+                                    content_type='application/json')
+        return response.json()['test_id']
+
+    def test_age_band(self):
+        self.assertEqual(age_band('1990-05-01', datetime.date(2026, 4, 30)), '30-39')
+        self.assertEqual(age_band('1990-05-01', datetime.date(2020, 5, 1)), '30-39')
+        self.assertEqual(age_band('1990-05-01', datetime.date(2020, 4, 30)), '18-29')
+        self.assertEqual(age_band('1930-01-01', datetime.date(2026, 1, 1)), '80+')
+
+    def test_norms_are_updated_incrementally(self):
+        for threshold in (0.1, 0.2, 0.3, 0.4):
+            self.save(threshold)
+        self.save(0.5, gender='M')
+
+        norm = PopulationNorm.objects.get(gender='F', frequency=1000)
+        self.assertEqual(norm.count, 4)
+        self.assertEqual(len(norm.histogram), NORM_BINS)
+        self.assertEqual(PopulationNorm.objects.get(gender='M', frequency=1000).count, 1)
+
+    def test_percentile_endpoint(self):
+        test_ids = [self.save(threshold) for threshold in (0.1, 0.2, 0.3, 0.4)]
+        with self.assertNumQueries(2):
+            body = self.client.get(f'/api/results/{test_ids[2]}/percentiles/').json()
+        self.assertEqual(body['gender'], 'F')
+        self.assertEqual(body['group_sizes']['1000'], 4)
+        # Ниже 0.3 — два результата и половина своей корзины
+        self.assertEqual(body['percentiles']['1000'], 62.5)
+        self.assertEqual(self.client.get('/api/results/999999/percentiles/').status_code, 404)
+
+
+class PatientTrendTests(CacheIsolatedTestCase):
+    params = {'last_name': 'Петров', 'first_name': 'Иван', 'gender': 'M', 'birth_date': '1960-03-15'}
+
+    def save(self, threshold, years_ago):
+        patient = {'lastName': 'Петров', 'firstName': 'Иван', 'gender': 'M', 'birthDate': '1960-03-15'}
+        trials = [{'frequency': freq, 'volume': threshold, 'heard': True} for freq in (500, 1000, 2000, 4000, 8000)]
+        test_id = self.client.post('/api/save-results/', {'patient': patient, 'data': trials},
+                                   content_type='application/json').json()['test_id']
+        HearingTestResult.objects.filter(id=test_id).update(
+            test_date=timezone.now() - datetime.timedelta(days=365.25 * years_ago)
+        )
+
+    def test_trend_is_cached_until_new_result(self):
+        self.save(0.2, years_ago=2)
+        self.save(0.3, years_ago=1)
+        body = self.client.get('/api/patient-trends/', self.params).json()
+        self.assertEqual(body['tests'], 2)
+        self.assertAlmostEqual(body['trends']['1000']['slope_per_year'], 0.1, places=3)
+        self.assertIsNone(body['forecast'])
+
+        with self.assertNumQueries(0):
+            self.client.get('/api/patient-trends/', self.params)
+
+        self.save(0.4, years_ago=0)
+        body = self.client.get('/api/patient-trends/', self.params).json()
+        self.assertEqual(body['tests'], 3)
+        self.assertAlmostEqual(body['trends']['1000']['slope_per_year'], 0.1, places=3)
+
+    def test_forecast_does_not_write_model_cache(self):
+        from ml.sarima_model import DEFAULT_CACHE_DIR
+
+        for years_ago, threshold in enumerate((0.5, 0.45, 0.45, 0.4, 0.35, 0.3)):
+            self.save(threshold, years_ago=years_ago)
+        cached_models = set(DEFAULT_CACHE_DIR.glob('*.npz'))
+        body = self.client.get('/api/patient-trends/', {**self.params, 'forecast': 2}).json()
+        self.assertEqual(len(body['forecast']['1000']), 2)
+        self.assertEqual(set(DEFAULT_CACHE_DIR.glob('*.npz')), cached_models)
+
+    def test_invalid_and_unknown_patient(self):
+        self.assertEqual(self.client.get('/api/patient-trends/', {'last_name': 'Петров'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/patient-trends/', {**self.params, 'gender': 'X'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/patient-trends/', {**self.params, 'forecast': 99}).status_code, 400)
+        self.assertEqual(self.client.get('/api/patient-trends/', self.params).status_code, 404)
+
+
+class PatientTests(CacheIsolatedTestCase):
+    def post(self, last_name, phone='', gender='F', middle_name=''):
+        patient = {'lastName': last_name, 'firstName': 'Анна', 'middleName': middle_name, 'gender': gender,
+                   'birthDate': '1985-07-01', 'phone': phone}
+        return self.client.post('/api/save-results/', {'patient': patient, 'data': make_trials(random.Random(0))},
+                                content_type='application/json').json()
+
+    def test_repeated_patient_is_stored_once(self):
+        self.post('Смирнова', phone='+7 900 000-00-00')
+        self.post('СМИРНОВА ')
+        patient = Patient.objects.get()
+        self.assertEqual(patient.results.count(), 2)
+        # Пустой телефон не затирает сохранённый, новый — заменяет
+        self.assertEqual(patient.phone, '+7 900 000-00-00')
+        self.post('Смирнова', phone='+7 900 111-11-11')
+        patient.refresh_from_db()
+        self.assertEqual(patient.phone, '+7 900 111-11-11')
+
+    def test_namesakes_are_different_patients(self):
+        self.post('Смирнова')
+        self.post('Смирнова', gender='M')
+        self.post('Смирнова', middle_name='Петровна')
+        self.assertEqual(Patient.objects.count(), 3)
+        self.assertEqual(set(Patient.objects.values_list('gender', 'middle_name')),
+                         {('F', ''), ('M', ''), ('F', 'Петровна')})
+
+    def test_existing_patient_is_resolved_with_one_query(self):
+        self.post('Смирнова')
+        test_result = prepare_result({
+            'patient': {'lastName': 'смирнова', 'firstName': 'анна', 'gender': 'F', 'birthDate': '1985-07-01'},
+            'data': make_trials(random.Random(0)),
+        }, CalibrationProfile.objects.active())[0]
+        with self.assertNumQueries(1):
+            [patient] = Patient.objects.resolve([test_result.patient])
+        self.assertEqual(patient.last_name, 'Смирнова')
+
+    def test_patient_edit_invalidates_cached_results(self):
+        test_id = self.post('Смирнова')['test_id']
+        url = f'/api/results/{test_id}/'
+        etag = self.client.get(url)['ETag']
+        patient = Patient.objects.get()
+        patient.last_name = 'Смирнова-Петрова'
+        patient.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['patient_last_name'], 'Смирнова-Петрова')
+
+    def test_batch_deduplicates_patients_and_keeps_response_format(self):
+        rng = random.Random(0)
+        payload = make_payload(rng)
+        body = self.client.post('/api/save-results/batch/', {'results': [payload, payload, make_payload(rng)]},
+                                content_type='application/json').json()
+        self.assertEqual(body['saved'], 3)
+        self.assertEqual(Patient.objects.count(), 2)
+
+        test = self.client.get(f"/api/results/{body['results'][0]['test_id']}/").json()
+        self.assertEqual(test['patient_last_name'], payload['patient']['lastName'])
+        self.assertEqual(test['patient_birth_date'], payload['patient']['birthDate'])
+        listing = self.client.get('/api/patient-tests/', {
+            'last_name': payload['patient']['lastName'], 'birth_date': payload['patient']['birthDate'],
+        }).json()
+        self.assertEqual({row['patient_first_name'] for row in listing['results']}, {payload['patient']['firstName']})
+
+
+class PatientMigrationTests(TransactionTestCase):
+    """Миграция 0006: результаты с данными пациента -> таблица пациентов"""
+    before = [('core', '0005_population_norms')]
+    after = [('core', '0006_patients')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+        self.addCleanup(self.migrate_to_latest)
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def add_result(self, apps, **patient):
+        thresholds = {f'{field}_{freq}': 0.5 for field in ('threshold', 'reliability') for freq in DEFAULT_FREQUENCIES}
+        return apps.get_model('core', 'HearingTestResult').objects.create(
+            patient_last_name='Абобов', patient_first_name='Петя', patient_middle_name='Заурович',
+            patient_gender='M', patient_birth_date=datetime.date(2001, 9, 11), diagnosis='Норма',
+            **{f'patient_{field}': value for field, value in patient.items()}, **thresholds,
+        ).pk
+
+    def test_latest_non_empty_contact_wins(self):
+        apps = self.executor.loader.project_state(self.before).apps
+        first = self.add_result(apps, phone='8005553535', email='a@example.com')
+        second = self.add_result(apps, phone='88005553535', email='')
+        third = self.add_result(apps, phone='', email='')
+
+        with self.assertLogs('core.migrations.0006_patients', 'WARNING') as logs:
+            MigrationExecutor(connection).migrate(self.after)
+        self.assertIn("'8005553535' -> '88005553535'", logs.output[0])
+
+        apps = MigrationExecutor(connection).loader.project_state(self.after).apps
+        patient = apps.get_model('core', 'Patient').objects.get()
+        self.assertEqual((patient.phone, patient.email), ('88005553535', 'a@example.com'))
+        results = apps.get_model('core', 'HearingTestResult').objects.filter(pk__in=[first, second, third])
+        self.assertEqual({result.patient_id for result in results}, {patient.pk})
+
+
+class ResponseCacheTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.test_id = self.client.post('/api/save-results/', make_payload(random.Random(0)),
+                                        content_type='application/json').json()['test_id']
+        self.url = f'/api/results/{self.test_id}/'
+
+    def test_result_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+        self.assertIn('max-age=', second['Cache-Control'])
+        self.assertFalse(second['ETag'].startswith('W/'))
+        self.assertEqual(cache_stats()['results'], {'hits': 1, 'misses': 1})
+
+    def test_conditional_request_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        for url in (self.url, f'/api/async/results/{self.test_id}/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_admin_edit_invalidates_cached_result(self):
+        etag = self.client.get(self.url)['ETag']
+        test = HearingTestResult.objects.get(id=self.test_id)
+        test.diagnosis = 'Исправлено'
+        test.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['diagnosis'], 'Исправлено')
+
+    def test_missing_result(self):
+        self.assertEqual(self.client.get('/api/results/999999/').status_code, 404)
+
+    def test_calibration_is_cached_and_revalidated(self):
+        first = self.client.get('/api/calibration/')
+        self.assertEqual(first['Cache-Control'], 'no-cache')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/calibration/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class WriteBehindTests(TransactionTestCase):
+    """Одновременная запись с многих кабин через единственный поток-писатель"""
+    threads = 8
+    per_thread = 100
+
+    def setUp(self):
+        cache.clear()
+        self.writer = ResultWriter(max_batch=200, max_delay=0.005)
+        self.addCleanup(self.writer.stop)
+
+    def test_concurrent_submissions_are_batched_without_lock_errors(self):
+        profile = CalibrationProfile.objects.active()
+        submissions = [
+            [prepare_result(make_payload(random.Random(thread * self.per_thread + number)), profile)[0]
+             for number in range(self.per_thread)]
+            for thread in range(self.threads)
+        ]
+        errors = []
+
+        def booth(results):
+            for test_result in results:
+                try:
+                    self.writer.submit(test_result).result(timeout=30)
+                except Exception as e:
+                    errors.append(e)
+
+        workers = [threading.Thread(target=booth, args=(results,)) for results in submissions]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        total = self.threads * self.per_thread
+        self.assertEqual(errors, [])
+        self.assertEqual(HearingTestResult.objects.count(), total)
+        self.assertEqual(self.writer.written, total)
+        # Записи одновременных кабин объединяются в общие транзакции
+        self.assertLess(self.writer.batches, total)
+        self.assertGreater(total / elapsed, 100, f'{total / elapsed:.0f} writes/s')
+
+    @override_settings(WRITE_BEHIND_ENABLED=True)
+    async def test_async_view_awaits_writer(self):
+        with mock.patch('core.writer.get_result_writer', return_value=self.writer):
+            response = await self.async_client.post('/api/async/save-results/', make_payload(random.Random(0)),
+                                                    content_type='application/json')
+        self.assertEqual(response.json()['status'], 'success')
+        self.assertTrue(await HearingTestResult.objects.filter(id=response.json()['test_id']).aexists())
+        self.assertEqual(self.writer.written, 1)
+
+
+class ThresholdSnapshotTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        # Больше начальной ёмкости, чтобы проверить рост файлов
+        populate_results(INITIAL_CAPACITY + 100, random.Random(0))
+
+    def test_incremental_sync(self):
+        self.assertEqual(sync_snapshot(self.directory, chunk_size=500), INITIAL_CAPACITY + 100)
+        self.assertEqual(sync_snapshot(self.directory), 0)
+        populate_results(10, random.Random(1))
+        self.assertEqual(sync_snapshot(self.directory), 10)
+        meta = read_meta(self.directory)
+        self.assertEqual(meta['count'], HearingTestResult.objects.count())
+        self.assertEqual(meta['last_id'], HearingTestResult.objects.latest('id').id)
+
+    def test_cohort_stats_match_database(self):
+        sync_snapshot(self.directory)
+        with self.assertNumQueries(0):
+            stats = cohort_stats([4000], self.directory, gender='M', date_from=timezone.now().date())['4000']
+        men = HearingTestResult.objects.filter(patient__gender='M')
+        self.assertEqual(stats['threshold']['count'], men.count())
+        self.assertAlmostEqual(stats['threshold']['mean'], men.aggregate(mean=Avg('threshold_4000'))['mean'])
+
+        tomorrow = timezone.now().date() + datetime.timedelta(days=1)
+        self.assertEqual(cohort_stats([4000], self.directory, date_from=tomorrow)['4000']['threshold']['count'], 0)
+
+    def test_age_matches_age_band_around_birthdays(self):
+        results = list(HearingTestResult.objects.select_related('patient').order_by('id')[:300])
+        Patient.objects.filter(pk=results[0].patient_id).update(birth_date=datetime.date(2000, 2, 29))
+        results[0].patient.refresh_from_db()
+        # За минуту до дня рождения (UTC), в его начало и на следующий день
+        offsets = (datetime.timedelta(minutes=-1), datetime.timedelta(), datetime.timedelta(days=1))
+        bands = {}
+        for number, result in enumerate(results):
+            birthday = datetime.datetime.combine(result.patient.birth_date.replace(year=2020), datetime.time(),
+                                                 tzinfo=datetime.timezone.utc)
+            moment = birthday + offsets[number % 3]
+            HearingTestResult.objects.filter(id=result.id).update(test_date=moment)
+            bands[result.id] = age_band(result.patient.birth_date, moment)
+        sync_snapshot(self.directory)
+
+        snapshot = ThresholdSnapshot(self.directory)
+        ids = snapshot.columns['id']
+        for lower, upper in zip(AGE_BANDS, [*AGE_BANDS[1:], 200]):
+            label = f'{lower}-{upper - 1}' if upper != 200 else f'{lower}+'
+            with self.subTest(band=label):
+                selected = set(ids[snapshot.mask(age_min=lower, age_max=upper - 1)].tolist()) & bands.keys()
+                self.assertEqual(selected, {pk for pk, band in bands.items() if band == label})
+        # Родился 29.02.2000: 28.02.2020 в 23:59 ещё 19 лет
+        self.assertIn(results[0].id, ids[snapshot.mask(age_min=19, age_max=19)].tolist())
+
+    def test_cohort_endpoint(self):
+        with override_settings(THRESHOLD_SNAPSHOT_DIR=self.directory):
+            sync_snapshot()
+            body = self.client.get('/api/cohorts/', {'frequency': 1000, 'gender': 'F', 'age_min': 20}).json()
+            self.assertEqual(list(body['frequencies']), ['1000'])
+            self.assertGreater(body['frequencies']['1000']['threshold']['count'], 0)
+            self.assertEqual(self.client.get('/api/cohorts/', {'frequency': 123}).status_code, 400)
+            for params in ({'date_from': 'garbage'}, {'date_to': '01.03.2026'}, {'date_to': '2026-02-30'}):
+                with self.subTest(params=params):
+                    self.assertEqual(self.client.get('/api/cohorts/', params).status_code, 400)
+
+
+class RediagnoseTests(CacheIsolatedTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        populate_results(120, random.Random(0))
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.state_file = Path(directory.name) / 'state.json'
+        HearingTestResult.objects.update(diagnosis='Устаревшее заключение')
+
+    def rediagnose(self, **options):
+        call_command('rediagnose', chunk_size=25, state_file=str(self.state_file), stdout=StringIO(), **options)
+
+    def stale(self):
+        return HearingTestResult.objects.filter(diagnosis='Устаревшее заключение')
+
+    def test_vectorized_rules_match_scalar(self):
+        rng = random.Random(0)
+        norms = list(NORM_THRESHOLDS.values())
+        rows = [[rng.uniform(-5, 30) for _ in norms] for _ in range(500)]
+        # Точные границы: среднее отклонение 0.1, 0.3 и 0.6
+        rows += [[norm + bound for norm in norms] for bound in (0.1, 0.3, 0.6)]
+        expected = [generate_diagnosis(dict(zip(NORM_THRESHOLDS, row))) for row in rows]
+        self.assertEqual([DIAGNOSES[level] for level in diagnosis_levels(rows)], expected)
+
+    def test_dry_run_writes_nothing(self):
+        self.rediagnose(dry_run=True)
+        self.assertEqual(self.stale().count(), 120)
+
+    def test_rewrites_stale_diagnoses(self):
+        self.rediagnose()
+        self.assertFalse(self.stale().exists())
+        for test in HearingTestResult.objects.all():
+            thresholds = {freq: getattr(test, f'threshold_{freq}') for freq in NORM_THRESHOLDS}
+            self.assertEqual(test.diagnosis, generate_diagnosis(thresholds))
+        self.assertFalse(self.state_file.exists())
+
+    def test_resume_continues_after_checkpoint(self):
+        middle = HearingTestResult.objects.order_by('pk').values_list('pk', flat=True)[59]
+        self.state_file.write_text(json.dumps({'last_pk': middle, 'rules': rules_version()}))
+        self.rediagnose(resume=True)
+        self.assertEqual(self.stale().count(), 60)
+        self.assertFalse(self.stale().filter(pk__gt=middle).exists())
+
+    def test_resume_with_changed_rules_is_rejected(self):
+        self.state_file.write_text(json.dumps({'last_pk': 1, 'rules': 'other'}))
+        with self.assertRaises(CommandError):
+            self.rediagnose(resume=True)
+
+
+class FastSerializationTests(CacheIsolatedTestCase):
+    """Быстрый путь core/fastjson.py должен совпадать с прежним JSONRenderer / DjangoJSONEncoder байт в байт"""
+
+    @classmethod
+    def setUpTestData(cls):
+        populate_results(30, random.Random(0))
+        # Кавычки, обратная косая черта, фигурные скобки и разделитель строк U+2028
+        Patient.objects.filter(pk=Patient.objects.first().pk).update(
+            last_name='О\'Нил "тест" \\ {0} \u2028', middle_name='',
+        )
+
+    def test_list_matches_renderer(self):
+        tests = HearingTestResult.objects.order_by('-test_date', '-id')
+        next_link = 'http://testserver/api/patient-tests/?cursor=abc'
+        self.assertEqual(
+            paginated_json(next_link, PATIENT_TESTS_LIST_ENCODER.encode_rows(list(patient_tests_rows(tests)))),
+            reference_list_json(list(patient_tests_values(tests)), next_link),
+        )
+        self.assertEqual(paginated_json(None, PATIENT_TESTS_LIST_ENCODER.encode_rows([])),
+                         reference_list_json([]))
+
+    def test_list_endpoint_pages_with_cursor(self):
+        seen = []
+        url = '/api/patient-tests/?limit=7'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            body = response.json()
+            seen += [row['id'] for row in body['results']]
+            url = body['next']
+        self.assertEqual(seen, list(HearingTestResult.objects.order_by('-test_date', '-id').values_list('id', flat=True)))
+
+    def test_ndjson_matches_encoder(self):
+        rows = [
+            (1, timezone.now(), datetime.date(1990, 5, 1), 'Иван "И" {x}', 0.25, None, True),
+            (2, datetime.datetime(2025, 1, 1, 12, 0), None, '', float('nan'), Decimal('1.50'), False),
+        ]
+        fields = ['id', 'test_date', 'birth_date', 'name', 'threshold', 'extra', 'flag']
+        self.assertEqual(''.join(iter_ndjson(rows, fields)), reference_ndjson(rows, fields))
+
+    def test_export_endpoint_matches_reference(self):
+        response = self.client.get('/api/export/', {'export_format': 'ndjson'})
+        lookups = [PATIENT_RESULT_FIELDS.get(name, name) for name in EXPORT_FIELDS]
+        rows = HearingTestResult.objects.order_by('pk').values_list(*lookups)
+        self.assertEqual(b''.join(response.streaming_content).decode(), reference_ndjson(rows, EXPORT_FIELDS))
+
+
+class RawTrialsTests(CacheIsolatedTestCase):
+    def assert_round_trip(self, frequencies, volumes, heard):
+        import numpy as np
+
+        decoded = decode_trials(encode_trials(frequencies, volumes, heard))
+        for expected, actual in zip((frequencies, volumes, heard), decoded):
+            np.testing.assert_array_equal(actual, np.asarray(expected))
+
+    def test_round_trip_is_lossless(self):
+        self.assert_round_trip([1000, 500, 1000, 8000], [0.1, 0.35, 0.05, 1.0], [False, True, True, False])
+        # Громкости вне сетки, NaN-частота и больше 255 различных частот — запасные форматы
+        self.assert_round_trip([500, float('nan'), 500], [0.123456789, 0.2, float('nan')], [True, False, True])
+        self.assert_round_trip(list(range(300)), [0.5] * 300, [True] * 300)
+        self.assert_round_trip([], [], [])
+
+    def test_encoding_is_compact(self):
+        from .scoring import trials_to_arrays
+
+        data = make_payload(random.Random(0))['data']
+        self.assertLess(len(encode_trials(*trials_to_arrays(data))) * 4, len(json.dumps(data)))
+
+    def test_invalid_blob(self):
+        for blob in (b'', b'XX' + bytes(8)):
+            with self.subTest(blob=blob), self.assertRaises(TrialsFormatError):
+                decode_trials(blob)
+
+    def test_truncated_or_padded_body(self):
+        # Узкий индекс с фиксированной точкой, широкий индекс и громкости float64
+        for trials in (([1000, 500], [0.1, 0.2], [True, False]),
+                       (list(range(300)), [0.123456789] * 300, [False] * 300)):
+            blob = encode_trials(*trials)
+            for size in (len(blob) - 1, len(blob) // 2, 10):
+                with self.subTest(size=size), self.assertRaisesRegex(TrialsFormatError, 'header expects'):
+                    decode_trials(blob[:size])
+            with self.assertRaises(TrialsFormatError):
+                decode_trials(blob + b'\0')
+
+        valid = encode_trials([1000], [0.5], [True])
+        with self.assertRaisesRegex(TrialsFormatError, '^Record 1: '):
+            decode_many([valid, valid[:-1]])
+
+    def test_saved_trials_rescore_to_stored_thresholds(self):
+        payloads = [make_payload(random.Random(seed)) for seed in range(5)]
+        ids = [self.client.post('/api/save-results/', payload, content_type='application/json').json()['test_id']
+               for payload in payloads]
+        self.assertEqual(RawTrials.objects.count(), len(ids))
+
+        _, _, _, sessions = decode_many(RawTrials.objects.order_by('pk').values_list('data', flat=True))
+        self.assertEqual(len(sessions), sum(len(payload['data']) for payload in payloads))
+
+        [(rescored_ids, thresholds, _)] = list(rescore(chunk_size=10))
+        self.assertEqual(rescored_ids, ids)
+        for row, test in zip(thresholds.tolist(), HearingTestResult.objects.order_by('pk')):
+            self.assertEqual(row[1], test.threshold_1000)
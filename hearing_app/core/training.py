@@ -0,0 +1,195 @@
+"""
+Обучение модели классификации по сохранённым результатам аудиометрии.
+
+Матрица признаков собирается из HearingTestResult порциями по первичному ключу
+(values_list + iterator) в заранее выделенный массив, без создания объектов моделей.
+Артефакты версионируются в HEARING_MODEL_DIR: hearing_model_vNNNN.pkl + .json
+с метаданными (признаки, последний обученный pk, метрики). Инкрементальное
+дообучение добавляет к лесу новые деревья, обученные только на строках,
+появившихся после предыдущей версии (RandomForest warm_start).
+
+Это заготовка конвейера, а не модель слуха: независимой метки (например, заключения
+врача) в базе пока нет, и классом служит «не норма» из поля diagnosis, которое само
+вычисляется правилами diagnosis.generate_diagnosis по тем же threshold_*. Лес просто
+воспроизводит правило, поэтому метрики на отложенных строках пишутся в метаданные как
+rule_agreement — согласие с правилом, а не качество модели. При появлении
+независимой метки её нужно подставить в build_training_matrix вместо LABEL_SOURCE.
+"""
+import datetime
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .diagnosis import DIAGNOSES
+from .models import HearingTestResult
+
+TRAINING_FIELDS = (
+    'threshold_500', 'threshold_1000', 'threshold_2000', 'threshold_4000', 'threshold_8000',
+    'reliability_500', 'reliability_1000', 'reliability_2000', 'reliability_4000', 'reliability_8000',
+)
+# Класс 0 — норма, 1 — патология (как в train_model.py); метка выводится из правил по тем же порогам
+NORMAL_DIAGNOSIS = DIAGNOSES[0]
+LABEL_SOURCE = 'rule_based_diagnosis'
+CHUNK_SIZE = 5000
+ARTIFACT_PATTERN = re.compile(r'^hearing_model_v(\d{4,})\.pkl$')
+
+
+def build_training_matrix(after_pk=0, chunk_size=CHUNK_SIZE):
+    """
+    Возвращает (X, y, last_pk) для строк с pk > after_pk.
+    Память: итоговая матрица + одна порция строк.
+    """
+    queryset = HearingTestResult.objects.filter(pk__gt=after_pk).order_by('pk')
+    total = queryset.count()
+    X = np.empty((total, len(TRAINING_FIELDS)), dtype=np.float64)
+    y = np.empty(total, dtype=np.int64)
+    last_pk = after_pk
+
+    rows = queryset.values_list('pk', 'diagnosis', *TRAINING_FIELDS).iterator(chunk_size=chunk_size)
+    filled = 0
+    while filled < total:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        pks, diagnoses, *columns = zip(*chunk)
+        end = filled + len(chunk)
+        X[filled:end] = np.column_stack(columns)
+        y[filled:end] = np.array(diagnoses, dtype=object) != NORMAL_DIAGNOSIS
+        last_pk = pks[-1]
+        filled = end
+
+    return X[:filled], y[:filled], last_pk
+
+
+def evaluate(model, X, y):
+    if not len(y):
+        return {}
+    from sklearn.metrics import accuracy_score, roc_auc_score
+
+    metrics = {'rows': int(len(y)), 'accuracy': float(accuracy_score(y, model.predict(X)))}
+    if len(model.classes_) == 2 and len(np.unique(y)) == 2:
+        metrics['roc_auc'] = float(roc_auc_score(y, model.predict_proba(X)[:, 1]))
+    return metrics
+
+
+def artifact_dir():
+    return Path(getattr(settings, 'HEARING_MODEL_DIR', Path(settings.BASE_DIR) / 'model_artifacts'))
+
+
+def latest_version(directory=None):
+    """Метаданные последней версии или None"""
+    directory = Path(directory or artifact_dir())
+    if not directory.exists():
+        return None
+    versions = sorted(
+        int(match.group(1)) for match in map(ARTIFACT_PATTERN.match, os.listdir(directory)) if match
+    )
+    if not versions:
+        return None
+    with open(directory / f'hearing_model_v{versions[-1]:04d}.json', encoding='utf-8') as meta_file:
+        return json.load(meta_file)
+
+
+def _atomic_write(path, write):
+    fd, tmp_path = tempfile.mkstemp(dir=Path(path).parent, suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def save_artifact(model, metadata, directory=None):
+    import joblib
+
+    directory = Path(directory or artifact_dir())
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = f"hearing_model_v{metadata['version']:04d}"
+    metadata['model_file'] = f'{stem}.pkl'
+    # Без сжатия, чтобы сервис мог открыть массивы через mmap
+    _atomic_write(directory / f'{stem}.pkl', lambda tmp: joblib.dump(model, tmp))
+    _atomic_write(directory / f'{stem}.json', lambda tmp: Path(tmp).write_text(
+        json.dumps(metadata, ensure_ascii=False, indent=2), encoding='utf-8'))
+    return directory / f'{stem}.pkl'
+
+
+def publish_artifact(metadata, directory=None, target=None):
+    """Делает версию рабочей: атомарно подменяет HEARING_MODEL_PATH и его .json"""
+    directory = Path(directory or artifact_dir())
+    target = Path(target or settings.HEARING_MODEL_PATH)
+    source = directory / metadata['model_file']
+    # Сначала метаданные: сервис следит за файлом модели и перечитывает .json при его смене
+    _atomic_write(target.with_suffix('.json'), lambda tmp: shutil.copyfile(source.with_suffix('.json'), tmp))
+    _atomic_write(target, lambda tmp: shutil.copyfile(source, tmp))
+
+
+def train(incremental=False, n_estimators=100, increment_estimators=20, test_fraction=0.2,
+          random_state=0, n_jobs=-1, directory=None):
+    """
+    Обучает и сохраняет новую версию. Возвращает (путь к артефакту, метаданные)
+    или (None, метаданные предыдущей версии), если новых строк нет.
+    """
+    import joblib
+    from sklearn.ensemble import RandomForestClassifier
+
+    directory = Path(directory or artifact_dir())
+    previous = latest_version(directory)
+    started = time.perf_counter()
+
+    if incremental and previous is not None:
+        X, y, last_pk = build_training_matrix(after_pk=previous['last_pk'])
+        if not len(y):
+            return None, previous
+        model = joblib.load(directory / previous['model_file'])
+        if set(np.unique(y)) != set(model.classes_.tolist()):
+            # Новые деревья должны видеть те же классы, иначе голосование леса несовместимо
+            incremental = False
+        else:
+            # Сначала оцениваем старую модель на новых строках, затем дообучаем на них же
+            metrics = evaluate(model, X, y)
+            model.set_params(warm_start=True, n_estimators=model.n_estimators + increment_estimators,
+                             n_jobs=n_jobs)
+            model.fit(X, y)
+            rows_trained = previous['rows_trained'] + len(y)
+
+    if not incremental or previous is None:
+        incremental = False
+        X, y, last_pk = build_training_matrix()
+        if not len(y):
+            return None, previous
+        rng = np.random.default_rng(random_state)
+        holdout = rng.random(len(y)) < test_fraction
+        if holdout.all() or not holdout.any():
+            holdout[:] = False
+        model = RandomForestClassifier(n_estimators=n_estimators, n_jobs=n_jobs, random_state=random_state)
+        model.fit(X[~holdout], y[~holdout])
+        metrics = evaluate(model, X[holdout], y[holdout])
+        rows_trained = int((~holdout).sum())
+
+    metadata = {
+        'version': (previous['version'] + 1) if previous else 1,
+        'parent_version': previous['version'] if incremental else None,
+        'mode': 'incremental' if incremental else 'full',
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'feature_names': list(TRAINING_FIELDS),
+        'classes': model.classes_.tolist(),
+        'n_estimators': model.n_estimators,
+        'rows_in_run': int(len(y)),
+        'rows_trained': int(rows_trained),
+        'last_pk': int(last_pk),
+        'label_source': LABEL_SOURCE,
+        # Согласие с правилом, по которому получена метка, — не оценка качества (см. docstring модуля)
+        'rule_agreement': metrics,
+        'training_seconds': round(time.perf_counter() - started, 3),
+    }
+    return save_artifact(model, metadata, directory), metadata
@@ -0,0 +1,132 @@
+"""
+Динамика порогов пациента по всем его тестам.
+
+Скорость изменения порога (в единицах громкости за год) считается для всех частот
+сразу одной векторной МНК-подгонкой по матрице (тесты × частоты). По запросу к ней
+добавляется прогноз на несколько следующих тестов по ARIMA из ml.sarima_model.
+Результат кешируется по ключу пациента (Patient.identity_key) на TREND_CACHE_TIMEOUT
+и сбрасывается раньше invalidate_trends() при сохранении нового результата этого пациента
+или invalidate_patient() при правке самого пациента.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import invalidate_results
+from .models import HearingTestResult
+from .search import patient_identity_key
+
+TREND_FREQUENCIES = (500, 1000, 2000, 4000, 8000)
+CACHE_PREFIX = 'trends:'
+DAYS_PER_YEAR = 365.25
+# Прогноз: несезонная ARIMA по последовательности тестов (интервалы между визитами считаются равными)
+FORECAST_ORDER = (1, 1, 0)
+FORECAST_SEASONAL_ORDER = (0, 0, 0, 0)
+FORECAST_MIN_TESTS = 6
+FORECAST_MAX_STEPS = 5
+
+
+def patient_key(identity_key):
+    return CACHE_PREFIX + identity_key
+
+
+def invalidate_trends(results):
+    """Сбрасывает кеш динамики пациентов, у которых появились новые результаты"""
+    cache.delete_many({patient_key(result.patient.identity_key) for result in results})
+
+
+def invalidate_patient(sender, instance, **kwargs):
+    """
+    Обработчик post_save/post_delete Patient: ответы api/results/<id>/ содержат ФИО и пол,
+    поэтому сбрасываются ответы всех результатов пациента и его динамика
+    (в т.ч. под прежним ключом, если правка изменила ФИО, пол или дату рождения)
+    """
+    keys = {instance.identity_key, getattr(instance, 'loaded_identity_key', None)} - {None}
+    cache.delete_many([patient_key(key) for key in keys])
+    if instance.pk is not None:
+        invalidate_results(HearingTestResult.objects.filter(patient_id=instance.pk).values_list('pk', flat=True))
+
+
+def fit_trends(days, thresholds):
+    """
+    days — (n,) дни от первого теста, thresholds — (n, k) пороги.
+    Возвращает (slopes, intercepts) формы (k,) в единицах за год; NaN, если тестов меньше двух в разные дни.
+    """
+    import numpy as np
+
+    years = np.asarray(days, dtype=np.float64) / DAYS_PER_YEAR
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    centered = years - years.mean()
+    variance = centered @ centered
+    if len(years) < 2 or variance == 0:
+        nan = np.full(thresholds.shape[1], np.nan)
+        return nan, nan
+    means = thresholds.mean(axis=0)
+    slopes = centered @ (thresholds - means) / variance
+    return slopes, means - slopes * years.mean()
+
+
+def forecast_thresholds(thresholds, steps):
+    """Прогноз порогов на steps следующих тестов, по одной ARIMA на частоту (с кешем обученных моделей)"""
+    from ml.sarima_model import fit_sarima_batch, restore_results
+
+    series = list(thresholds.T)
+    # Запрос к API — обучаем в текущем процессе, без пула и без дискового кеша моделей:
+    # прогноз и так хранится в кеше динамики пациента, а файлы на каждый запрос копились бы без предела
+    fits = fit_sarima_batch(series, FORECAST_ORDER, FORECAST_SEASONAL_ORDER, n_jobs=1, cache_dir=None)
+    return [
+        restore_results(signal, fit, FORECAST_ORDER, FORECAST_SEASONAL_ORDER).forecast(steps).tolist()
+        for signal, fit in zip(series, fits)
+    ]
+
+
+def compute_trends(identity_key, forecast_steps=0):
+    import numpy as np
+
+    rows = list(
+        HearingTestResult.objects.filter(patient__identity_key=identity_key)
+        .order_by('test_date', 'id')
+        .values_list('test_date', *(f'threshold_{frequency}' for frequency in TREND_FREQUENCIES))
+    )
+    if not rows:
+        return None
+
+    dates = [row[0] for row in rows]
+    thresholds = np.array([row[1:] for row in rows], dtype=np.float64)
+    days = [(date - dates[0]).total_seconds() / 86400 for date in dates]
+    slopes, intercepts = fit_trends(days, thresholds)
+
+    keys = [str(frequency) for frequency in TREND_FREQUENCIES]
+    trends = {
+        key: {
+            'slope_per_year': None if np.isnan(slope) else float(slope),
+            'intercept': None if np.isnan(intercept) else float(intercept),
+            'first': float(thresholds[0, index]),
+            'latest': float(thresholds[-1, index]),
+        }
+        for index, (key, slope, intercept) in enumerate(zip(keys, slopes, intercepts))
+    }
+
+    forecast = None
+    if forecast_steps and len(rows) >= FORECAST_MIN_TESTS:
+        forecast = dict(zip(keys, forecast_thresholds(thresholds, forecast_steps)))
+
+    return {
+        'tests': len(rows),
+        'dates': dates,
+        'trends': trends,
+        'forecast': forecast,
+    }
+
+
+def patient_trends(last_name, first_name, middle_name, gender, birth_date, forecast_steps=0):
+    """
+    Динамика из кеша или вычисленная заново. В кеше у пациента одна запись
+    {число шагов прогноза: результат}, чтобы invalidate_trends удалял все варианты разом.
+    """
+    identity_key = patient_identity_key(last_name, first_name, middle_name, gender, birth_date)
+    key = patient_key(identity_key)
+    variants = cache.get(key) or {}
+    if forecast_steps not in variants:
+        variants[forecast_steps] = compute_trends(identity_key, forecast_steps)
+        cache.set(key, variants, settings.TREND_CACHE_TIMEOUT)
+    return variants[forecast_steps]
@@ -0,0 +1,156 @@
+"""
+Компактное хранение сырых проб теста для повторного анализа.
+
+Пробы ({'frequency', 'volume', 'heard'}, ...) кодируются в двоичную запись RawTrials.data:
+
+    заголовок   <2sBBIH: b'HT', версия, флаги, число проб, число различных частот
+    частоты     float64[различных частот] — таблица частот
+    индексы     uint8 (или uint16 с FLAG_WIDE_INDEX)[проб] — номер частоты пробы в таблице
+    громкости   uint16 в единицах 1/VOLUME_SCALE (или float64 с FLAG_FLOAT_VOLUMES)[проб]
+    услышано    np.packbits — по биту на пробу
+
+Громкости хранятся в фиксированной точке, только если так они восстанавливаются
+точно, иначе — как есть, поэтому кодирование без потерь. Тест из ~30 проб занимает
+около 150 байт вместо ~1,5 КБ JSON. Декодер возвращает массивы NumPy (np.frombuffer)
+без объектов Python на пробу; decode_many склеивает пачку записей в массивы
+с номером сессии для scoring.score_arrays.
+"""
+import struct
+from itertools import islice
+
+from .models import RawTrials
+
+MAGIC = b'HT'
+VERSION = 1
+HEADER = struct.Struct('<2sBBIH')
+FLAG_WIDE_INDEX = 1
+FLAG_FLOAT_VOLUMES = 2
+VOLUME_SCALE = 10000
+RESCORE_CHUNK_SIZE = 5000
+
+
+class TrialsFormatError(ValueError):
+    pass
+
+
+def encode_trials(frequencies, volumes, heard):
+    """Массивы проб (как из scoring.trials_to_arrays) -> bytes"""
+    import numpy as np
+
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    volumes = np.asarray(volumes, dtype=np.float64)
+    heard = np.asarray(heard, dtype=np.bool_)
+    count = len(frequencies)
+
+    # NaN-частоты сворачиваются в одну запись таблицы
+    table, index = np.unique(frequencies, return_inverse=True)
+    flags = FLAG_WIDE_INDEX if len(table) > 255 else 0
+    index = index.astype('<u2' if flags & FLAG_WIDE_INDEX else 'u1')
+
+    scaled = np.rint(volumes * VOLUME_SCALE)
+    if np.all((scaled >= 0) & (scaled <= np.iinfo(np.uint16).max) & (scaled / VOLUME_SCALE == volumes)):
+        volume_bytes = scaled.astype('<u2').tobytes()
+    else:
+        flags |= FLAG_FLOAT_VOLUMES
+        volume_bytes = volumes.astype('<f8').tobytes()
+
+    return b''.join((
+        HEADER.pack(MAGIC, VERSION, flags, count, len(table)),
+        table.astype('<f8').tobytes(),
+        index.tobytes(),
+        volume_bytes,
+        np.packbits(heard).tobytes(),
+    ))
+
+
+def body_size(flags, count, table_size):
+    """Размер записи после заголовка по его флагам и счётчикам"""
+    index_size = 2 if flags & FLAG_WIDE_INDEX else 1
+    volume_size = 8 if flags & FLAG_FLOAT_VOLUMES else 2
+    return table_size * 8 + count * (index_size + volume_size) + (count + 7) // 8
+
+
+def decode_trials(blob):
+    """
+    bytes -> (frequencies float64, volumes float64, heard bool).
+    Повреждённая или обрезанная запись -> TrialsFormatError.
+    """
+    import numpy as np
+
+    blob = bytes(blob)
+    try:
+        magic, version, flags, count, table_size = HEADER.unpack_from(blob)
+    except struct.error:
+        raise TrialsFormatError('Truncated trials header')
+    if magic != MAGIC or version != VERSION:
+        raise TrialsFormatError(f'Unsupported trials format {magic!r} v{version}')
+    # Длина тела проверяется заранее: иначе np.frombuffer упадёт с ValueError на обрезанной записи
+    expected = HEADER.size + body_size(flags, count, table_size)
+    if len(blob) != expected:
+        raise TrialsFormatError(f'Trials body is {len(blob)} bytes, header expects {expected}')
+
+    offset = HEADER.size
+    table = np.frombuffer(blob, dtype='<f8', count=table_size, offset=offset)
+    offset += table.nbytes
+    index = np.frombuffer(blob, dtype='<u2' if flags & FLAG_WIDE_INDEX else 'u1', count=count, offset=offset)
+    offset += index.nbytes
+    if flags & FLAG_FLOAT_VOLUMES:
+        volumes = np.frombuffer(blob, dtype='<f8', count=count, offset=offset).astype(np.float64)
+    else:
+        volumes = np.frombuffer(blob, dtype='<u2', count=count, offset=offset) / VOLUME_SCALE
+    offset += count * (8 if flags & FLAG_FLOAT_VOLUMES else 2)
+    packed = np.frombuffer(blob, dtype=np.uint8, count=(count + 7) // 8, offset=offset)
+    heard = np.unpackbits(packed, count=count).astype(np.bool_)
+    return table[index], volumes, heard
+
+
+def decode_many(blobs):
+    """
+    Пачка записей -> (frequencies, volumes, heard, sessions): склеенные пробы и номер
+    записи (0..len(blobs)-1) для каждой, как ждёт scoring.score_arrays(sessions=...).
+    """
+    import numpy as np
+
+    decoded = []
+    for number, blob in enumerate(blobs):
+        try:
+            decoded.append(decode_trials(blob))
+        except TrialsFormatError as e:
+            raise TrialsFormatError(f'Record {number}: {e}') from e
+    if not decoded:
+        empty = np.empty(0, dtype=np.float64)
+        return empty, empty, np.empty(0, dtype=np.bool_), np.empty(0, dtype=np.intp)
+    frequencies, volumes, heard = (np.concatenate(column) for column in zip(*decoded))
+    sessions = np.repeat(np.arange(len(decoded), dtype=np.intp), [len(trials[0]) for trials in decoded])
+    return frequencies, volumes, heard, sessions
+
+
+def save_trials(results):
+    """Пишет сырые пробы сохранённых результатов (test_result.trials_blob из prepare_result) одним INSERT"""
+    records = [
+        RawTrials(result=result, data=result.trials_blob)
+        for result in results
+        if getattr(result, 'trials_blob', None) is not None
+    ]
+    if records:
+        RawTrials.objects.bulk_create(records)
+
+
+def rescore(queryset=None, chunk_size=RESCORE_CHUNK_SIZE):
+    """
+    Пересчёт порогов по сохранённым пробам: по chunk_size записей за раз
+    выдаёт (id результатов, thresholds, reliabilities) формы (записей, частот).
+    """
+    from .scoring import score_arrays
+
+    queryset = RawTrials.objects.all() if queryset is None else queryset
+    rows = queryset.order_by('pk').values_list('pk', 'data').iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        ids, blobs = zip(*chunk)
+        frequencies, volumes, heard, sessions = decode_many(blobs)
+        thresholds, reliabilities, _ = score_arrays(frequencies, volumes, heard, sessions=sessions,
+                                                    n_sessions=len(blobs))
+        yield list(ids), thresholds, reliabilities
@@ -1,11 +1,31 @@
 from django.urls import path, re_path
 from django.views.generic import TemplateView
-from .views import save_results, get_test_results, get_patient_tests, get_calibration
+from . import async_views
+from .views import (
+    save_results, save_results_batch, get_test_results, get_patient_tests, get_calibration, export_results,
+    predict, start_session, session_response, get_stimulus, get_test_percentiles, get_patient_trends,
+    get_cohort_stats
+)
 
 urlpatterns = [
     path('api/save-results/', save_results, name='save_results'),
+    path('api/save-results/batch/', save_results_batch, name='save_results_batch'),
+    path('api/sessions/', start_session, name='start_session'),
+    path('api/sessions/<str:session_id>/responses/', session_response, name='session_response'),
+    path('api/stimuli/<str:kind>/', get_stimulus, name='get_stimulus'),
     path('api/results/<int:test_id>/', get_test_results, name='get_test_results'),
+    path('api/results/<int:test_id>/percentiles/', get_test_percentiles, name='get_test_percentiles'),
     path('api/patient-tests/', get_patient_tests, name='get_patient_tests'),
+    path('api/patient-trends/', get_patient_trends, name='get_patient_trends'),
+    path('api/cohorts/', get_cohort_stats, name='get_cohort_stats'),
     # re_path(r'^.*', TemplateView.as_view(template_name='index.html')),
     path('api/calibration/', get_calibration, name='get_calibration'),
+    path('api/export/', export_results, name='export_results'),
+    path('api/predict/', predict, name='predict'),
+
+    # Асинхронные версии для запуска под ASGI (uvicorn hearing_app.asgi:application)
+    path('api/async/save-results/', async_views.save_results, name='async_save_results'),
+    path('api/async/results/<int:test_id>/', async_views.get_test_results, name='async_get_test_results'),
+    path('api/async/patient-tests/', async_views.get_patient_tests, name='async_get_patient_tests'),
+    path('api/async/calibration/', async_views.get_calibration, name='async_get_calibration'),
 ]
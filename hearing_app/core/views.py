@@ -1,193 +1,576 @@
-from django.utils import timezone
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-import numpy as np
-from .models import HearingTestResult
-from .serializers import HearingTestResultSerializer
+from .caching import cached_response, cached_result, result_cache_control
+from .diagnosis import generate_diagnosis, get_recommendations
+from .export import EXPORT_FORMATS, ExportError, export_queryset, iter_export, parse_fields
+from .fastjson import drf_encoder
+from .instrumentation import stage
+from .models import PATIENT_RESULT_FIELDS, CalibrationProfile, HearingTestResult, Patient, attach_patients
+from .norms import patient_percentiles, record_results
+from .pagination import KeysetPagination
+from .trends import FORECAST_MAX_STEPS, invalidate_trends, patient_trends
+from .trials import encode_trials, save_trials
+
+# NumPy (scoring) и модель (inference, sklearn/joblib) импортируются при первом использовании,
+# чтобы воркеры и manage.py не платили за них при старте (см. core/tests.py, ImportTimeTests)
+
+# Ограничения пакетной загрузки результатов
+BATCH_MAX_ITEMS = 1000
+BATCH_INSERT_SIZE = 500
+
+
+def build_patient(patient_data):
+    """Несохранённый пациент из данных фронтенда (lastName, firstName, ...)"""
+    return Patient(
+        last_name=patient_data.get('lastName', ''),
+        first_name=patient_data.get('firstName', ''),
+        middle_name=patient_data.get('middleName', ''),
+        gender=patient_data.get('gender', ''),
+        birth_date=patient_data.get('birthDate', None),
+        phone=patient_data.get('phone', ''),
+        email=patient_data.get('email', ''),
+    )
+
+
+def build_test_result(patient_data, thresholds, reliabilities, diagnosis, calibration_profile):
+    """
+    Собирает (не сохраняя) запись результата теста с несохранённым пациентом;
+    перед записью пациент заменяется сохранённым через attach_patients()
+    """
+    return HearingTestResult(
+        patient=build_patient(patient_data),
+
+        threshold_500=thresholds.get('500'),
+        threshold_1000=thresholds.get('1000'),
+        threshold_2000=thresholds.get('2000'),
+        threshold_4000=thresholds.get('4000'),
+        threshold_8000=thresholds.get('8000'),
+
+        reliability_500=reliabilities.get('500', 0),
+        reliability_1000=reliabilities.get('1000', 0),
+        reliability_2000=reliabilities.get('2000', 0),
+        reliability_4000=reliabilities.get('4000', 0),
+        reliability_8000=reliabilities.get('8000', 0),
+        calibration_profile=calibration_profile,
+
+        diagnosis=diagnosis,
+        recommendations=get_recommendations(diagnosis)
+    )
+
+
+def prepare_result(request_data, calibration_profile):
+    """
+    Разбирает тело запроса save-results и собирает несохранённую запись.
+    Возвращает (test_result, thresholds, reliabilities) или бросает ValueError.
+    """
+    data = request_data.get('data', [])
+    patient_data = request_data.get('patient', {})
+
+    if not isinstance(data, list) or not isinstance(patient_data, dict):
+        raise ValueError('Invalid data format')
+
+    from .scoring import score_trial_arrays, trials_to_arrays
+
+    with stage('scoring'):
+        trials = trials_to_arrays(data)
+        thresholds, reliabilities = score_trial_arrays(*trials)
+        diagnosis = generate_diagnosis(thresholds)
+    test_result = build_test_result(patient_data, thresholds, reliabilities, diagnosis, calibration_profile)
+    # Сырые пробы сохраняются рядом с результатом (core/trials.py, save_trials)
+    test_result.trials_blob = encode_trials(*trials)
+    return test_result, thresholds, reliabilities
+
+
+def save_result(test_result):
+    """
+    Сохраняет результат и учитывает его в популяционных нормах одной транзакцией.
+    С WRITE_BEHIND_ENABLED запись идёт через очередь единственного потока-писателя (core/writer.py).
+    """
+    if settings.WRITE_BEHIND_ENABLED:
+        from .writer import get_result_writer
+
+        get_result_writer().submit(test_result).result(timeout=settings.WRITE_BEHIND_TIMEOUT)
+        return
+    with transaction.atomic():
+        attach_patients([test_result])
+        test_result.save()
+        save_trials([test_result])
+        record_results([test_result])
+    invalidate_trends([test_result])
 
 
-def calculate_reliability(results):
-    heard_count = sum(1 for r in results if r['heard'])
-    total = len(results)
-    return heard_count / total if total > 0 else 0
+def saved_result_payload(test_result, thresholds, reliabilities):
+    return {
+        'status': 'success',
+        'test_id': test_result.id,
+        'thresholds': thresholds,
+        'reliabilities': reliabilities,
+        'diagnosis': test_result.diagnosis,
+        'recommendations': test_result.recommendations
+    }
 
 
 @api_view(['POST'])
 def save_results(request):
     try:
-        data = request.data.get('data', [])
-        patient_data = request.data.get('patient', {})
-        thresholds = {}
-        reliabilities = {}
+        with stage('parse'):
+            data = request.data
+        test_result, thresholds, reliabilities = prepare_result(data, CalibrationProfile.objects.active())
 
-        if not isinstance(data, list):
-            return Response({'status': 'error', 'message': 'Invalid data format'})
+        # Сохраняем результаты в БД
+        with stage('db_write'):
+            save_result(test_result)
 
-        for freq in [500, 1000, 2000, 4000, 8000]:
-            freq_results = [r for r in data if r.get('frequency') == freq]
-            freq_key = str(freq)
+        return Response(saved_result_payload(test_result, thresholds, reliabilities))
+    except Exception as e:
+        return Response({'status': 'error', 'message': str(e)})
 
-            if not freq_results:
-                thresholds[freq_key] = None
-                reliabilities[freq_key] = 0
-                continue
 
-            reliability = calculate_reliability(freq_results)
-            reliabilities[freq_key] = reliability
+@api_view(['POST'])
+def save_results_batch(request):
+    """
+    Пакетное сохранение результатов (например, очередь киоска после восстановления связи).
+    Принимает список {patient, data}; все валидные записи пишутся одним bulk_create
+    в одной транзакции. Для каждого элемента возвращается test_id либо ошибка.
+    """
+    with stage('parse'):
+        data = request.data
+    items = data.get('results') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return Response({'status': 'error', 'message': 'Invalid data format'})
+    if len(items) > BATCH_MAX_ITEMS:
+        return Response({
+            'status': 'error',
+            'message': f'Too many items in batch (max {BATCH_MAX_ITEMS})'
+        }, status=413)
+
+    outcomes = [None] * len(items)
+    pending = []
+    calibration_profile = CalibrationProfile.objects.active()
+
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('Invalid item format')
+            test_result, thresholds, reliabilities = prepare_result(item, calibration_profile)
+            # Проверяем каждую запись заранее: одна битая строка не должна
+            # откатывать всю пакетную транзакцию
+            test_result.patient.clean_fields(exclude=['identity_key'])
+            # Активный профиль калибровки заведомо существует: без его проверки в clean_fields
+            # не нужен отдельный SELECT на каждый элемент пакета
+            test_result.clean_fields(exclude=['test_date', 'patient', 'calibration_profile'])
+        except ValidationError as e:
+            outcomes[index] = {'status': 'error', 'message': str(e.message_dict)}
+            continue
+        except Exception as e:
+            outcomes[index] = {'status': 'error', 'message': str(e)}
+            continue
+
+        pending.append((index, test_result, thresholds, reliabilities))
 
-            heard_volumes = [
-                r['volume'] for r in freq_results
-                if r.get('heard', False) and isinstance(r.get('volume'), (int, float))
-            ]
+    try:
+        with stage('db_write'), transaction.atomic():
+            saved = HearingTestResult.objects.bulk_create(
+                attach_patients([test_result for _, test_result, _, _ in pending]),
+                batch_size=BATCH_INSERT_SIZE,
+            )
+            save_trials(saved)
+            record_results(saved)
+    except Exception as e:
+        return Response({'status': 'error', 'message': str(e)}, status=500)
+    invalidate_trends(saved)
 
-            thresholds[freq_key] = min(heard_volumes) if heard_volumes else None
+    for index, test_result, thresholds, reliabilities in pending:
+        outcomes[index] = saved_result_payload(test_result, thresholds, reliabilities)
 
-        diagnosis = generate_diagnosis(thresholds)
+    return Response({
+        'status': 'success',
+        'saved': len(pending),
+        'failed': len(items) - len(pending),
+        'results': outcomes
+    })
 
-        # Сохраняем результаты в БД
-        test_result = HearingTestResult(
-            patient_last_name=patient_data.get('lastName', ''),
-            patient_first_name=patient_data.get('firstName', ''),
-            patient_middle_name=patient_data.get('middleName', ''),
-            patient_gender=patient_data.get('gender', ''),
-            patient_birth_date=patient_data.get('birthDate', None),
-            patient_phone=patient_data.get('phone', ''),
-            patient_email=patient_data.get('email', ''),
-
-            threshold_500=thresholds.get('500'),
-            threshold_1000=thresholds.get('1000'),
-            threshold_2000=thresholds.get('2000'),
-            threshold_4000=thresholds.get('4000'),
-            threshold_8000=thresholds.get('8000'),
-
-            reliability_500=reliabilities.get('500', 0),
-            reliability_1000=reliabilities.get('1000', 0),
-            reliability_2000=reliabilities.get('2000', 0),
-            reliability_4000=reliabilities.get('4000', 0),
-            reliability_8000=reliabilities.get('8000', 0),
-            calibration_data=CALIBRATION_VALUES,
-
-            diagnosis=diagnosis,
-            recommendations=get_recommendations(diagnosis)
-        )
-        test_result.save()
 
+@api_view(['POST'])
+def start_session(request):
+    """
+    Начинает адаптивный тест (см. core/audiometry.py): {"patient": {...}, "frequencies": [...]?},
+    где frequencies — audiometry.FREQUENCIES в нужном порядке
+    -> {"session_id", "stimulus": {"frequency", "volume", "trial"}}
+    """
+    from . import audiometry
+
+    data = request.data if isinstance(request.data, dict) else {}
+    patient_data = data.get('patient')
+    frequencies = data.get('frequencies', audiometry.FREQUENCIES)
+    if (not isinstance(patient_data, dict) or not isinstance(frequencies, (list, tuple)) or not frequencies
+            or not all(isinstance(freq, int) for freq in frequencies)):
+        return Response({'status': 'error', 'message': 'Invalid data format'}, status=400)
+    # Результат сохраняется только с порогами на всех стандартных частотах (поля threshold_* обязательны),
+    # поэтому порядок частот можно задать, а набор — нет
+    if len(frequencies) != len(audiometry.FREQUENCIES) or set(frequencies) != set(audiometry.FREQUENCIES):
         return Response({
-            'status': 'success',
-            'test_id': test_result.id,
-            'thresholds': thresholds,
-            'reliabilities': reliabilities,
-            'diagnosis': diagnosis,
-            'recommendations': test_result.recommendations
-        })
-    except Exception as e:
-        return Response({'status': 'error', 'message': str(e)})
+            'status': 'error',
+            'message': f'frequencies must list each of {sorted(audiometry.FREQUENCIES)} once',
+        }, status=400)
 
+    # Данные пациента проверяются до начала теста: иначе ошибка обнаружится только
+    # при сохранении после последнего ответа, и время в кабине будет потеряно
+    try:
+        build_patient(patient_data).clean_fields(exclude=['identity_key'])
+    except ValidationError as e:
+        return Response({'status': 'error', 'message': str(e.message_dict)}, status=400)
 
-def generate_diagnosis(thresholds):
-    norm_thresholds = {
-        '500': 20,
-        '1000': 15,
-        '2000': 10,
-        '4000': 5,
-        '8000': 0
-    }
+    session = audiometry.new_session(patient_data, frequencies)
+    audiometry.store_session(session)
+    return Response({'status': 'running', 'session_id': session['id'], 'stimulus': audiometry.next_stimulus(session)})
 
-    deviations = []
-    for freq, norm in norm_thresholds.items():
-        user_threshold = thresholds.get(freq, 1.0)
-        if isinstance(user_threshold, (int, float)):
-            deviations.append(user_threshold - norm)
 
-    avg_deviation = np.mean(deviations) if deviations else 0
+@api_view(['POST'])
+def session_response(request, session_id):
+    """
+    Ответ на текущий стимул: {"trial": номер стимула, "heard": true|false}.
+    Возвращает следующий стимул, а после последней частоты сохраняет результат
+    как api/save-results/ и возвращает его. Повтор уже учтённого ответа даёт 409.
+    """
+    from . import audiometry
+    from .scoring import trials_to_arrays
 
-    if avg_deviation < 0.1:
-        return "Ваш слух в пределах нормы"
-    elif 0.1 <= avg_deviation < 0.3:
-        return "Легкое снижение слуха"
-    elif 0.3 <= avg_deviation < 0.6:
-        return "Умеренное снижение слуха"
-    else:
-        return "Рекомендуется консультация специалиста"
+    try:
+        session = audiometry.load_session(session_id)
+    except audiometry.SessionError as e:
+        return Response({'status': 'error', 'message': str(e)}, status=404)
+
+    heard = request.data.get('heard') if isinstance(request.data, dict) else None
+    if not isinstance(heard, bool):
+        return Response({'status': 'error', 'message': 'Invalid data format'}, status=400)
+    stimulus = audiometry.next_stimulus(session)
+    if stimulus is None or request.data.get('trial') != stimulus['trial']:
+        return Response({'status': 'error', 'message': 'Response does not match the current stimulus',
+                         'stimulus': stimulus}, status=409)
+
+    audiometry.respond(session, heard)
+    if not audiometry.is_finished(session):
+        audiometry.store_session(session)
+        return Response({'status': 'running', 'session_id': session_id, 'stimulus': audiometry.next_stimulus(session)})
+
+    thresholds, reliabilities = session['thresholds'], session['reliabilities']
+    try:
+        with stage('scoring'):
+            diagnosis = generate_diagnosis(thresholds)
+        test_result = build_test_result(
+            session['patient'], thresholds, reliabilities, diagnosis, CalibrationProfile.objects.active()
+        )
+        test_result.trials_blob = encode_trials(*trials_to_arrays(session['trials']))
+        with stage('db_write'):
+            save_result(test_result)
+    except Exception as e:
+        return Response({'status': 'error', 'message': str(e)})
+
+    audiometry.delete_session(session)
+    return Response({**saved_result_payload(test_result, thresholds, reliabilities), 'trials': len(session['trials'])})
+
+
+def test_result_payload(test):
+    """Представление одного теста для api/results/<id>/"""
+    return {
+        'test_date': test.test_date,
+        'patient_last_name': test.patient.last_name,
+        'patient_first_name': test.patient.first_name,
+        'patient_middle_name': test.patient.middle_name,
+        'patient_birth_date': test.patient.birth_date,
+        'patient_gender': test.patient.gender,
+        'diagnosis': test.diagnosis,
+        'recommendations': test.recommendations,
+        'thresholds': {
+            '500': test.threshold_500,
+            '1000': test.threshold_1000,
+            '2000': test.threshold_2000,
+            '4000': test.threshold_4000,
+            '8000': test.threshold_8000,
+        },
+        'reliabilities': {
+            '500': test.reliability_500,
+            '1000': test.reliability_1000,
+            '2000': test.reliability_2000,
+            '4000': test.reliability_4000,
+            '8000': test.reliability_8000,
+        }
+    }
 
 
-def get_recommendations(diagnosis):
-    if "нормы" in diagnosis.lower():
-        return "Повторите тест через год для контроля слуха."
-    elif "легкое" in diagnosis.lower():
-        return "Рекомендуется избегать шумных помещений, повторить тест через 6 месяцев."
-    elif "умеренное" in diagnosis.lower():
-        return "Рекомендуется консультация ЛОР-врача и проведение дополнительных исследований."
-    else:
-        return "Необходима срочная консультация специалиста для детального обследования."
+def load_test_result_payload(test_id):
+    try:
+        return test_result_payload(HearingTestResult.objects.select_related('patient').get(id=test_id))
+    except HearingTestResult.DoesNotExist:
+        return None
 
 
 @api_view(['GET'])
 def get_test_results(request, test_id):
+    # Результат неизменен: готовый JSON и ETag берутся из кеша (core/caching.py)
+    entry = cached_result(test_id, load_test_result_payload)
+    if entry is None:
+        return Response({'status': 'error', 'message': 'Test not found'}, status=404)
+    return cached_response(request, entry, result_cache_control())
+
+
+@api_view(['GET'])
+def get_test_percentiles(request, test_id):
+    """Положение порогов теста среди результатов той же возрастной группы и пола (core/norms.py)"""
     try:
-        test = HearingTestResult.objects.get(id=test_id)
-        data = {
-            'test_date': test.test_date,
-            'patient_last_name': test.patient_last_name,
-            'patient_first_name': test.patient_first_name,
-            'patient_middle_name': test.patient_middle_name,
-            'patient_birth_date': test.patient_birth_date,
-            'patient_gender': test.patient_gender,
-            'diagnosis': test.diagnosis,
-            'recommendations': test.recommendations,
-            'thresholds': {
-                '500': test.threshold_500,
-                '1000': test.threshold_1000,
-                '2000': test.threshold_2000,
-                '4000': test.threshold_4000,
-                '8000': test.threshold_8000,
-            },
-            'reliabilities': {
-                '500': test.reliability_500,
-                '1000': test.reliability_1000,
-                '2000': test.reliability_2000,
-                '4000': test.reliability_4000,
-                '8000': test.reliability_8000,
-            }
-        }
-        return Response(data)
+        test = HearingTestResult.objects.select_related('patient').get(id=test_id)
     except HearingTestResult.DoesNotExist:
         return Response({'status': 'error', 'message': 'Test not found'}, status=404)
 
+    age_band, percentiles, group_sizes = patient_percentiles(test)
+    return Response({
+        'status': 'success',
+        'age_band': age_band,
+        'gender': test.patient.gender,
+        'percentiles': percentiles,
+        'group_sizes': group_sizes,
+    })
+
+
+def query_date(params, name):
+    """Необязательная дата YYYY-MM-DD из параметров запроса; неверный формат -> ValueError"""
+    if not params.get(name):
+        return None
+    day = parse_date(params[name])
+    if day is None:
+        raise ValueError(f'Invalid {name} date, expected YYYY-MM-DD')
+    return day
+
 
 @api_view(['GET'])
-def get_patient_tests(request):
-    last_name = request.query_params.get('last_name', '')
-    first_name = request.query_params.get('first_name', '')
-    birth_date = request.query_params.get('birth_date', None)
+def get_cohort_stats(request):
+    """
+    Когортная статистика порогов по колоночному снимку (core/snapshot.py), без запросов к БД:
+    ?frequency=4000&gender=M&age_min=50&age_max=60&date_from=YYYY-MM-DD&date_to=YYYY-MM-DD (все необязательны)
+    """
+    from .snapshot import SNAPSHOT_FREQUENCIES, cohort_stats
+
+    params = request.query_params
+    try:
+        frequencies = [int(params['frequency'])] if params.get('frequency') else SNAPSHOT_FREQUENCIES
+        filters = {
+            'gender': params.get('gender') or None,
+            'age_min': int(params['age_min']) if params.get('age_min') else None,
+            'age_max': int(params['age_max']) if params.get('age_max') else None,
+            'date_from': query_date(params, 'date_from'),
+            'date_to': query_date(params, 'date_to'),
+        }
+    except ValueError as e:
+        return Response({'status': 'error', 'message': str(e)}, status=400)
+    if any(frequency not in SNAPSHOT_FREQUENCIES for frequency in frequencies):
+        return Response({'status': 'error', 'message': f'frequency must be one of {SNAPSHOT_FREQUENCIES}'},
+                        status=400)
+
+    return Response({'status': 'success', 'frequencies': cohort_stats(frequencies, **filters)})
 
-    tests = HearingTestResult.objects.all()
 
-    if last_name:
-        tests = tests.filter(patient_last_name__icontains=last_name)
-    if first_name:
-        tests = tests.filter(patient_first_name__icontains=first_name)
+# Поля краткого представления в списке исследований; полная запись — api/results/<id>/.
+# Поля пациента берутся JOIN'ом с Patient под прежними именами ключей
+PATIENT_TESTS_LIST_FIELDS = (
+    'id',
+    'test_date',
+    'test_type',
+    'diagnosis',
+)
+PATIENT_TESTS_LIST_PATIENT_FIELDS = (
+    'patient_last_name',
+    'patient_first_name',
+    'patient_middle_name',
+    'patient_birth_date',
+    'patient_gender',
+)
+
+
+PATIENT_TESTS_LIST_COLUMNS = PATIENT_TESTS_LIST_FIELDS + PATIENT_TESTS_LIST_PATIENT_FIELDS
+PATIENT_TESTS_LIST_ENCODER = drf_encoder(PATIENT_TESTS_LIST_COLUMNS)
+
+
+def patient_tests_values(queryset):
+    """Словари строк списка (прежний путь через JSONRenderer; для сравнения в тестах и замерах)"""
+    return queryset.values(
+        *PATIENT_TESTS_LIST_FIELDS,
+        **{name: F(PATIENT_RESULT_FIELDS[name]) for name in PATIENT_TESTS_LIST_PATIENT_FIELDS},
+    )
+
+
+def patient_tests_rows(queryset):
+    """Кортежи строк списка в порядке PATIENT_TESTS_LIST_COLUMNS"""
+    return queryset.values_list(
+        *PATIENT_TESTS_LIST_FIELDS,
+        *(PATIENT_RESULT_FIELDS[name] for name in PATIENT_TESTS_LIST_PATIENT_FIELDS),
+    )
+
+
+def patient_tests_queryset(params):
+    last_name = params.get('last_name', '')
+    first_name = params.get('first_name', '')
+    birth_date = params.get('birth_date', None)
+
+    tests = HearingTestResult.objects.search_patient(last_name=last_name, first_name=first_name)
+
     if birth_date:
-        tests = tests.filter(patient_birth_date=birth_date)
+        tests = tests.filter(patient__birth_date=birth_date)
 
-    serializer = HearingTestResultSerializer(tests.order_by('-test_date'), many=True)
-    return Response(serializer.data)
+    return patient_tests_rows(tests)
 
 
-CALIBRATION_VALUES = {
-    '500': {'factor': 1.02, 'max_db': 110},
-    '1000': {'factor': 0.98, 'max_db': 115},
-    '2000': {'factor': 1.05, 'max_db': 120},
-    '4000': {'factor': 0.95, 'max_db': 115},
-    '8000': {'factor': 1.1, 'max_db': 105}
-}
+@api_view(['GET'])
+def get_patient_tests(request):
+    # Кортежи values_list() кодируются сразу в JSON, без словарей и обхода JSONRenderer (core/fastjson.py)
+    paginator = KeysetPagination(PATIENT_TESTS_LIST_COLUMNS)
+    page = paginator.paginate_queryset(patient_tests_queryset(request.query_params), request)
+    body = paginator.get_paginated_json(PATIENT_TESTS_LIST_ENCODER, page)
+    return HttpResponse(body, content_type='application/json')
 
 
 @api_view(['GET'])
-def get_calibration(request):
-    """Возвращает калибровочные коэффициенты для оборудования"""
-    return Response({
+def get_patient_trends(request):
+    """
+    Динамика порогов пациента по всем его тестам (core/trends.py):
+    ?last_name=&first_name=[&middle_name=]&gender=M|F&birth_date=YYYY-MM-DD[&forecast=число следующих тестов]
+    """
+    params = request.query_params
+    last_name, first_name = params.get('last_name', ''), params.get('first_name', '')
+    middle_name, gender = params.get('middle_name', ''), params.get('gender', '')
+    try:
+        birth_date = parse_date(params.get('birth_date', ''))
+        forecast_steps = int(params.get('forecast', 0))
+    except ValueError:
+        birth_date, forecast_steps = None, 0
+    if (not last_name or not first_name or gender not in dict(Patient.GENDER_CHOICES) or birth_date is None
+            or not 0 <= forecast_steps <= FORECAST_MAX_STEPS):
+        return Response({
+            'status': 'error',
+            'message': 'last_name, first_name, gender (M|F), birth_date (YYYY-MM-DD) '
+                       f'and forecast (0-{FORECAST_MAX_STEPS}) expected',
+        }, status=400)
+
+    trends = patient_trends(last_name, first_name, middle_name, gender, birth_date, forecast_steps)
+    if trends is None:
+        return Response({'status': 'error', 'message': 'No tests found for patient'}, status=404)
+    return Response({'status': 'success', **trends})
+
+
+@api_view(['POST'])
+def predict(request):
+    """
+    Пакетный инференс: {"features": [[...], ...]} -> классы и вероятности. Порядок и число признаков
+    задаёт feature_names из метаданных опубликованной модели (у manage.py train_hearing_model —
+    training.TRAINING_FIELDS: threshold_500..8000, reliability_500..8000; без .json — inference.MODEL_FEATURES).
+    Строка может быть и словарём {имя признака: значение}.
+    Все строки оцениваются одним вызовом predict_proba.
+    """
+    from .inference import ModelNotAvailable, features_to_matrix, get_model_service
+
+    service = get_model_service()
+    try:
+        feature_names = service.feature_names
+    except ModelNotAvailable as e:
+        return Response({'status': 'error', 'message': str(e)}, status=503)
+
+    try:
+        matrix = features_to_matrix(
+            request.data.get('features') if isinstance(request.data, dict) else None, feature_names
+        )
+    except ValueError as e:
+        return Response({'status': 'error', 'message': str(e)}, status=400)
+
+    prediction = service.predict(matrix)
+
+    return Response({'status': 'success', **prediction})
+
+
+@api_view(['GET'])
+def export_results(request):
+    """
+    Потоковая выгрузка результатов для аналитики.
+    Параметры: export_format=csv|ndjson, date_from/date_to (YYYY-MM-DD), fields=поле1,поле2
+    (не format — этот параметр DRF использует для выбора рендерера)
+    """
+    fmt = request.query_params.get('export_format', 'csv')
+    try:
+        fields = parse_fields(request.query_params.get('fields'))
+        queryset = export_queryset(request.query_params.get('date_from'), request.query_params.get('date_to'))
+        chunks = iter_export(queryset, fields, fmt)
+    except ExportError as e:
+        return Response({'status': 'error', 'message': str(e)}, status=400)
+
+    response = StreamingHttpResponse(chunks, content_type=EXPORT_FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="hearing_results.{fmt}"'
+    return response
+
+
+# Калибровку можно сменить в любой момент: клиент хранит ответ, но перепроверяет его по ETag
+CALIBRATION_CACHE_CONTROL = 'no-cache'
+
+
+def calibration_response(request, profile, response_class=Response):
+    # ETag = хеш профиля: устройство с актуальной калибровкой получает 304 без тела
+    etag = f'"{profile.content_hash}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        not_modified['Cache-Control'] = CALIBRATION_CACHE_CONTROL
+        return not_modified
+
+    response = response_class({
         'status': 'success',
-        'calibration': CALIBRATION_VALUES,
-        'timestamp': timezone.now()
+        'calibration': profile.data,
+        'version': profile.content_hash,
+        'timestamp': profile.created_at
     })
+    response['ETag'] = etag
+    response['Cache-Control'] = CALIBRATION_CACHE_CONTROL
+    return response
+
+
+@api_view(['GET'])
+def get_calibration(request):
+    """Возвращает калибровочные коэффициенты для оборудования"""
+    return calibration_response(request, CalibrationProfile.objects.active())
+
+
+@api_view(['GET'])
+def get_stimulus(request, kind):
+    """
+    Калиброванный стимул в WAV: kind=tone|warble|noise, ?frequency=1000&level=0.4&duration=1000 (мс).
+    Буфер отдаётся из LRU-кеша core/stimuli.py; ETag включает версию калибровки.
+    """
+    from .stimuli import StimulusError, stimulus_wav
+
+    try:
+        frequency = int(request.query_params.get('frequency', ''))
+        level = float(request.query_params.get('level', ''))
+        duration_ms = int(request.query_params.get('duration', 1000))
+    except ValueError:
+        return Response({'status': 'error', 'message': 'frequency, level and duration must be numbers'}, status=400)
+
+    profile = CalibrationProfile.objects.active()
+    etag = f'"{profile.content_hash[:16]}-{kind}-{frequency}-{round(level, 2)}-{duration_ms}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+
+    try:
+        wav = stimulus_wav(profile, kind, frequency, level, duration_ms)
+    except StimulusError as e:
+        return Response({'status': 'error', 'message': str(e)}, status=400)
+
+    # bytes передаются в ответ как есть, без копирования буфера из кеша
+    response = HttpResponse(wav, content_type='audio/wav')
+    response['ETag'] = etag
+    return response
@@ -0,0 +1,126 @@
+"""
+Запись результатов через очередь и один поток-писатель (write-behind) для SQLite.
+
+У SQLite один писатель: при одновременных save_results с разных кабин запросы
+ждут блокировку и часть падает с "database is locked". С WRITE_BEHIND_ENABLED
+запросы только валидируют результат и кладут его в очередь, а единственный поток
+забирает накопившиеся записи и пишет их пачкой (до WRITE_BEHIND_MAX_BATCH) одной
+транзакцией. Запрос ждёт фиксации своей пачки, поэтому test_id в ответе, как и раньше,
+указывает на уже сохранённую запись.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import HearingTestResult, attach_patients
+from .norms import record_results
+from .trends import invalidate_trends
+from .trials import save_trials
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class ResultWriter:
+    def __init__(self, max_batch=200, max_delay=0.005):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.written = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, test_result):
+        """Ставит несохранённый результат в очередь; Future завершается после фиксации транзакции"""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((test_result, future))
+        return future
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+                    self._thread.start()
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _collect(self, first):
+        """Первая запись плюс всё, что успело прийти за max_delay, но не больше max_batch"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                self._write(self._collect(item))
+        finally:
+            connection.close()
+
+    def _write(self, batch):
+        results = [test_result for test_result, _ in batch]
+        try:
+            with transaction.atomic():
+                attach_patients(results)
+                saved = HearingTestResult.objects.bulk_create(results)
+                save_trials(saved)
+                record_results(saved)
+        except Exception:
+            # Пачка откатилась целиком: пишем по одной, чтобы ошибка одной записи не задела остальные
+            logger.exception('Batch of %d results failed, retrying one by one', len(batch))
+            for test_result, future in batch:
+                test_result.pk = None
+                test_result._state.adding = True
+                try:
+                    with transaction.atomic():
+                        attach_patients([test_result])
+                        test_result.save()
+                        save_trials([test_result])
+                        record_results([test_result])
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(test_result)
+        else:
+            for test_result, future in batch:
+                future.set_result(test_result)
+        self.batches += 1
+        self.written += sum(1 for _, future in batch if future.exception() is None)
+        invalidate_trends([test_result for test_result, future in batch if future.exception() is None])
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_result_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ResultWriter(settings.WRITE_BEHIND_MAX_BATCH, settings.WRITE_BEHIND_MAX_DELAY)
+    return _writer
@@ -56,6 +56,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.instrumentation.PerformanceMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -106,6 +107,25 @@ DATABASES = {
     }
 }
 
+# Запись результатов одним потоком-писателем пачками (core/writer.py) вместе с WAL и постоянными
+# соединениями SQLite — для одновременной отправки результатов с многих кабин. Включается HEARING_WRITE_BEHIND=1
+WRITE_BEHIND_ENABLED = os.environ.get("HEARING_WRITE_BEHIND") == "1"
+WRITE_BEHIND_MAX_BATCH = 200
+# Сколько писатель ждёт следующие результаты для той же пачки, с
+WRITE_BEHIND_MAX_DELAY = 0.005
+# Сколько запрос ждёт фиксации своей записи, с
+WRITE_BEHIND_TIMEOUT = 10
+
+if WRITE_BEHIND_ENABLED:
+    DATABASES["default"]["CONN_MAX_AGE"] = 60
+    DATABASES["default"]["OPTIONS"] = {
+        # WAL: читатели не блокируют писателя и наоборот; synchronous=NORMAL безопасен в режиме WAL
+        "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL",
+        # Блокировка на запись берётся в начале транзакции, а не при первом INSERT
+        "transaction_mode": "IMMEDIATE",
+        "timeout": 20,
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -147,3 +167,38 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Модель классификации (см. core/train_model.py) и период проверки файла на обновление, с
+HEARING_MODEL_PATH = BASE_DIR / "core" / "hearing_model.pkl"
+HEARING_MODEL_CHECK_INTERVAL = 2.0
+# Версионированные артефакты manage.py train_hearing_model
+HEARING_MODEL_DIR = BASE_DIR / "model_artifacts"
+
+# Замеры запросов (core/instrumentation.py): доля запросов под cProfile и порог длительности, мс,
+# начиная с которого профиль сохраняется в PERF_PROFILE_DIR
+PERF_PROFILE_SAMPLE_RATE = 0.0
+PERF_PROFILE_THRESHOLD_MS = 500
+PERF_PROFILE_DIR = BASE_DIR / "profiles"
+
+# Кеш Django: адаптивные сессии (core/audiometry.py), ответы api/results/<id>/ и калибровка (core/caching.py),
+# динамика пациентов (core/trends.py). Кеш в памяти процесса работает с одним воркером; при нескольких
+# воркерах нужен общий бэкенд (например, django.core.cache.backends.redis.RedisCache)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+AUDIOMETRY_SESSION_TTL = 30 * 60
+# Срок хранения готовых ответов api/results/<id>/ в кеше, с, и max-age для клиента, с
+RESULT_CACHE_TIMEOUT = 24 * 60 * 60
+RESULT_CACHE_MAX_AGE = 60 * 60
+# Как долго процесс использует закешированный активный профиль калибровки, с
+CALIBRATION_CACHE_TIMEOUT = 60
+# Срок хранения динамики пациента (core/trends.py) в кеше, с; новый результат сбрасывает её раньше
+TREND_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Предельный размер LRU-кеша готовых WAV-стимулов (core/stimuli.py), байт
+STIMULUS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Колоночный снимок порогов для когортной аналитики (core/snapshot.py, manage.py sync_threshold_snapshot)
+THRESHOLD_SNAPSHOT_DIR = BASE_DIR / "snapshots"
@@ -0,0 +1,140 @@
+"""
+Потоковое извлечение признаков из WAV-записей: доминирующая частота (max_freq),
+среднее MFCC (mfcc_mean) и RMS — те же признаки, на которых учится core/train_model.py.
+
+Файл читается блоками через soundfile.blocks с перекрытием n_fft - hop, поэтому
+кадры STFT совпадают с обработкой целого файла, а в памяти одновременно находится
+только один блок. Суммы по кадрам накапливаются, средние считаются в конце.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+FEATURE_NAMES = ('max_freq', 'mfcc_mean', 'rms')
+
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+N_MFCC = 13
+# Кадров STFT на блок чтения; блок = FRAMES_PER_BLOCK * hop + (n_fft - hop) отсчётов
+FRAMES_PER_BLOCK = 256
+
+
+class _FeatureAccumulator:
+    def __init__(self, sample_rate, n_fft, n_mels, n_mfcc):
+        # librosa (и numba/scipy за ним) грузится только когда действительно нужны признаки
+        import librosa
+
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.n_mfcc = n_mfcc
+        self.window = np.hanning(n_fft + 1)[:-1].astype(np.float32)
+        self.mel_basis = librosa.filters.mel(sr=sample_rate, n_fft=n_fft, n_mels=n_mels)
+        self.power_sum = np.zeros(n_fft // 2 + 1)
+        self.mfcc_sum = np.zeros(n_mfcc)
+        self.frames = 0
+        self.square_sum = 0.0
+        self.samples = 0
+
+    def add_samples(self, samples):
+        """Новые (неперекрывающиеся) отсчёты — для RMS по всей записи"""
+        samples = samples.astype(np.float64)
+        self.square_sum += float(np.dot(samples, samples))
+        self.samples += len(samples)
+
+    def add_frames(self, frames):
+        """frames: (n_frames, n_fft) — кадры STFT"""
+        import librosa
+
+        if not len(frames):
+            return
+        power = np.abs(np.fft.rfft(frames * self.window, axis=1)) ** 2
+        self.power_sum += power.sum(axis=0)
+        mel = self.mel_basis @ power.T
+        mfcc = librosa.feature.mfcc(S=librosa.power_to_db(mel, top_db=None), n_mfcc=self.n_mfcc)
+        self.mfcc_sum += mfcc.sum(axis=1)
+        self.frames += len(frames)
+
+    def result(self):
+        features = {
+            'sample_rate': self.sample_rate,
+            'duration': self.samples / self.sample_rate,
+            'rms': float(np.sqrt(self.square_sum / self.samples)) if self.samples else 0.0,
+            'frames': self.frames,
+        }
+        if self.frames:
+            mfcc = self.mfcc_sum / self.frames
+            peak_bin = int(np.argmax(self.power_sum))
+            features['max_freq'] = peak_bin * self.sample_rate / self.n_fft
+            features['mfcc'] = mfcc.tolist()
+            features['mfcc_mean'] = float(mfcc.mean())
+        else:
+            features.update({'max_freq': 0.0, 'mfcc': [0.0] * self.n_mfcc, 'mfcc_mean': 0.0})
+        return features
+
+
+def _frames(block, n_fft, hop_length):
+    if len(block) < n_fft:
+        return np.empty((0, n_fft), dtype=block.dtype)
+    return np.lib.stride_tricks.sliding_window_view(block, n_fft)[::hop_length]
+
+
+def extract_features(path, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS, n_mfcc=N_MFCC,
+                     frames_per_block=FRAMES_PER_BLOCK):
+    """
+    Признаки одной записи. Память ограничена одним блоком
+    (frames_per_block * hop_length + n_fft - hop_length отсчётов на канал), независимо от длины файла.
+    """
+    info = sf.info(str(path))
+    accumulator = _FeatureAccumulator(info.samplerate, n_fft, n_mels, n_mfcc)
+    overlap = n_fft - hop_length
+    blocksize = frames_per_block * hop_length + overlap
+    first = True
+
+    for block in sf.blocks(str(path), blocksize=blocksize, overlap=overlap, dtype='float32', always_2d=True):
+        mono = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+        # Перекрытие уже учтено в предыдущем блоке — для RMS берём только новые отсчёты
+        accumulator.add_samples(mono if first else mono[overlap:])
+        accumulator.add_frames(_frames(mono, n_fft, hop_length))
+        first = False
+
+    return accumulator.result()
+
+
+def feature_vector(features):
+    """Вектор в порядке FEATURE_NAMES для модели из train_model.py"""
+    return [features[name] for name in FEATURE_NAMES]
+
+
+def _extract_one(path):
+    try:
+        return str(path), extract_features(path)
+    except (RuntimeError, sf.LibsndfileError) as e:
+        return str(path), {'error': str(e)}
+
+
+def extract_directory(directory, pattern='*.wav', n_jobs=None):
+    """
+    Признаки для всех записей каталога (рекурсивно); файлы распределяются по n_jobs процессам.
+    Возвращает {путь: признаки}; при ошибке чтения — {путь: {'error': ...}}.
+    """
+    paths = sorted(Path(directory).rglob(pattern))
+    n_jobs = max(1, min(n_jobs or os.cpu_count() or 1, len(paths) or 1))
+    if n_jobs == 1:
+        return dict(map(_extract_one, paths))
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return dict(executor.map(_extract_one, paths, chunksize=4))
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    target = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).resolve().parents[2] / 'test.wav'
+    if target.is_dir():
+        print(json.dumps(extract_directory(target), ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps(extract_features(target), ensure_ascii=False, indent=2))
@@ -1,6 +1,16 @@
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
 import numpy as np
-import librosa
-from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+DEFAULT_ORDER = (1, 1, 1)
+DEFAULT_SEASONAL_ORDER = (1, 1, 1, 12)
+# Каталог кеша обученных моделей; переопределяется переменной окружения SARIMA_CACHE_DIR
+DEFAULT_CACHE_DIR = Path(os.environ.get('SARIMA_CACHE_DIR', Path(__file__).resolve().parent / '.sarima_cache'))
 
 
 def simulate_audio_data():
@@ -14,12 +24,171 @@ def simulate_audio_data():
     return normal, patology
 
 
-def train_sarima(audio_data):
-    model = SARIMAX(audio_data, order=(1, 1, 1), seasonal_order=(1, 1, 1, 12))
-    results = model.fit(disp=False)
+def train_sarima(audio_data, order=DEFAULT_ORDER, seasonal_order=DEFAULT_SEASONAL_ORDER, start_params=None):
+    # statsmodels импортируется только при обучении: сам модуль остаётся лёгким для импорта
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    model = SARIMAX(audio_data, order=order, seasonal_order=seasonal_order)
+    results = model.fit(start_params=start_params, disp=False)
     return results
 
 
+def signal_key(signal, order=DEFAULT_ORDER, seasonal_order=DEFAULT_SEASONAL_ORDER):
+    """Ключ кеша: SHA-256 от значений сигнала (float64) и порядков модели"""
+    signal = np.ascontiguousarray(signal, dtype=np.float64)
+    digest = hashlib.sha256()
+    digest.update(repr((signal.shape, tuple(order), tuple(seasonal_order))).encode())
+    digest.update(signal.tobytes())
+    return digest.hexdigest()
+
+
+def signal_signature(signal):
+    """
+    Дешёвое описание формы ряда (длина, std, автокорреляция lag-1) для сортировки
+    и поиска похожих рядов при тёплом старте
+    """
+    signal = np.asarray(signal, dtype=np.float64)
+    std = float(signal.std())
+    if len(signal) < 2 or std == 0:
+        return len(signal), std, 0.0
+    centered = signal - signal.mean()
+    autocorr = float(np.dot(centered[:-1], centered[1:]) / np.dot(centered, centered))
+    return len(signal), std, autocorr
+
+
+def is_similar(signature, other, tolerance):
+    length, std, autocorr = signature
+    other_length, other_std, other_autocorr = other
+    if length != other_length:
+        return False
+    scale = max(std, other_std, 1e-12)
+    return abs(autocorr - other_autocorr) <= tolerance and abs(std - other_std) / scale <= tolerance
+
+
+class SarimaFit(NamedTuple):
+    """Компактный итог обучения: то, что хранится в кеше и передаётся между процессами"""
+    key: str
+    params: np.ndarray
+    aic: float
+    bic: float
+    llf: float
+
+
+def restore_results(signal, fit, order=DEFAULT_ORDER, seasonal_order=DEFAULT_SEASONAL_ORDER):
+    """
+    Полный объект результатов statsmodels (прогноз, остатки и т.п.) по сохранённым параметрам.
+    Выполняет только проход фильтра Калмана, без оптимизации.
+    """
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    return SARIMAX(signal, order=order, seasonal_order=seasonal_order).filter(fit.params)
+
+
+def load_cached(key, cache_dir=DEFAULT_CACHE_DIR):
+    path = Path(cache_dir) / f'{key}.npz'
+    if not path.exists():
+        return None
+    try:
+        with np.load(path) as stored:
+            return SarimaFit(key, stored['params'], *stored['stats'].tolist())
+    except (OSError, ValueError, KeyError):
+        # Повреждённый файл кеша просто пересчитываем
+        return None
+
+
+def store_cached(fit, cache_dir=DEFAULT_CACHE_DIR):
+    """Атомарная запись (tmp + os.replace), чтобы параллельные процессы не видели половину файла"""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.npz')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            np.savez(tmp_file, params=fit.params, stats=np.array([fit.aic, fit.bic, fit.llf]))
+        os.replace(tmp_path, cache_dir / f'{fit.key}.npz')
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _split(items, parts):
+    size, remainder = divmod(len(items), parts)
+    chunks, start = [], 0
+    for part in range(parts):
+        end = start + size + (1 if part < remainder else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+
+def _fit_chunk(jobs, order, seasonal_order, cache_dir, warm_start, tolerance):
+    """
+    Последовательно обучает ряды одного процесса. Ряды отсортированы по сигнатуре,
+    поэтому соседние обычно похожи, и параметры предыдущей модели — хорошая стартовая точка.
+    """
+    fitted = []
+    previous_signature, previous_params = None, None
+    for index, key, signal in jobs:
+        signature = signal_signature(signal)
+        start_params = None
+        if warm_start and previous_params is not None and is_similar(signature, previous_signature, tolerance):
+            start_params = previous_params
+        results = train_sarima(signal, order, seasonal_order, start_params=start_params)
+        fit = SarimaFit(key, np.asarray(results.params), float(results.aic), float(results.bic), float(results.llf))
+        if cache_dir is not None:
+            store_cached(fit, cache_dir)
+        previous_signature, previous_params = signature, fit.params
+        fitted.append((index, fit))
+    return fitted
+
+
+def fit_sarima_batch(signals, order=DEFAULT_ORDER, seasonal_order=DEFAULT_SEASONAL_ORDER, n_jobs=None,
+                     cache_dir=DEFAULT_CACHE_DIR, warm_start=True, similarity_tolerance=0.05):
+    """
+    Обучает SARIMA для набора рядов. Возвращает список SarimaFit в порядке signals
+    (полный объект statsmodels — через restore_results).
+
+    - уже обученные ряды (тот же сигнал и порядки) берутся из дискового кеша cache_dir
+      (cache_dir=None отключает кеш);
+    - остальные распределяются по n_jobs процессам (по умолчанию — число ядер);
+    - внутри процесса похожие ряды стартуют с параметров предыдущей модели.
+    """
+    signals = [np.asarray(signal, dtype=np.float64) for signal in signals]
+    fits = [None] * len(signals)
+    pending = []
+
+    for index, signal in enumerate(signals):
+        key = signal_key(signal, order, seasonal_order)
+        cached = load_cached(key, cache_dir) if cache_dir is not None else None
+        if cached is not None:
+            fits[index] = cached
+        else:
+            pending.append((index, key, signal))
+
+    if not pending:
+        return fits
+
+    pending.sort(key=lambda job: signal_signature(job[2]))
+    n_jobs = max(1, min(n_jobs or os.cpu_count() or 1, len(pending)))
+    # Непрерывные куски отсортированного списка, чтобы похожие ряды попадали в один процесс
+    chunks = _split(pending, n_jobs)
+
+    if n_jobs == 1:
+        fitted = [_fit_chunk(chunks[0], order, seasonal_order, cache_dir, warm_start, similarity_tolerance)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [
+                executor.submit(_fit_chunk, chunk, order, seasonal_order, cache_dir, warm_start,
+                                similarity_tolerance)
+                for chunk in chunks
+            ]
+            fitted = [future.result() for future in futures]
+
+    for chunk in fitted:
+        for index, fit in chunk:
+            fits[index] = fit
+    return fits
+
+
 # Тестировка
 if __name__ == "__main__":
     normal, pathology = simulate_audio_data()
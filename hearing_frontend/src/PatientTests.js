@@ -9,6 +9,7 @@ const PatientTests = () => {
     birthDate: ''
   });
   const [tests, setTests] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const navigate = useNavigate();
@@ -38,7 +39,24 @@ const PatientTests = () => {
           birth_date: searchParams.birthDate
         }
       });
-      setTests(response.data);
+      setTests(response.data.results);
+      setNextPage(response.data.next);
+    } catch (err) {
+      setError('Ошибка при загрузке данных');
+      console.error(err);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const loadMoreTests = async () => {
+    setLoading(true);
+    setError('');
+
+    try {
+      const response = await axios.get(nextPage);
+      setTests(prev => [...prev, ...response.data.results]);
+      setNextPage(response.data.next);
     } catch (err) {
       setError('Ошибка при загрузке данных');
       console.error(err);
@@ -168,6 +186,24 @@ const PatientTests = () => {
               ))}
             </tbody>
           </table>
+          {nextPage && (
+            <button
+              onClick={loadMoreTests}
+              disabled={loading}
+              style={{
+                display: 'block',
+                margin: '20px auto',
+                padding: '8px 16px',
+                backgroundColor: '#3498db',
+                color: 'white',
+                border: 'none',
+                borderRadius: '6px',
+                cursor: 'pointer'
+              }}
+            >
+              Показать ещё
+            </button>
+          )}
         </div>
       ) : (
         !loading && <p style={{ textAlign: 'center', color: '#7f8c8d' }}>Исследования не найдены</p>